@@ -1,9 +1,13 @@
 # backend/app/agent_routes.py - Rotas da API para o Agente Sacy
-from fastapi import APIRouter, HTTPException
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from . import ee_executor, rate_limit
+
 # Importar agente e ferramentas no início para inicialização imediata
 from .agent_sacy_chat import sacy_chat_agent
 from .audio_chat import try_agent_chat, dialectize_paraense, normalize_slang
@@ -36,7 +40,7 @@ class ChatResponse(BaseModel):
     response: str
     context_summary: str
 
-@router.post("/analyze", response_model=AgentResponse)
+@router.post("/analyze", response_model=AgentResponse, dependencies=[Depends(rate_limit.charge("agent_analyze"))])
 async def analyze_with_sacy(request: AgentRequest):
     """
     🤖 Análise de IA com agente Sacy (Google ADK + Gemini)
@@ -132,8 +136,8 @@ async def agent_health():
             detail=f"Agente indisponível: {str(e)}"
         )
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat_with_sacy(request: ChatMessage):
+@router.post("/chat", response_model=ChatResponse, dependencies=[Depends(rate_limit.charge("agent_chat"))])
+async def chat_with_sacy(request: ChatMessage, http_request: Request):
     """
     💬 Chat interativo com o agente Sacy
     
@@ -168,79 +172,90 @@ async def chat_with_sacy(request: ChatMessage):
         
         tool_results = []
         
-        # 1. Verificar se precisa buscar imagens
-        if polygon and any(keyword in message_lower for keyword in ['imagem', 'lst', 'ndvi', 'ndwi', 'menos nuvens', 'lista', 'disponível', 'disponivel']):
-            layer_type = None
-            if 'lst' in message_lower or 'temperatura' in message_lower or 'calor' in message_lower:
-                layer_type = 'LST'
-            elif 'ndvi' in message_lower or 'vegetação' in message_lower or 'vegetacao' in message_lower:
-                layer_type = 'NDVI'
-            elif 'ndwi' in message_lower or 'água' in message_lower or 'agua' in message_lower:
-                layer_type = 'NDWI'
+        # Ferramentas fora do event loop (travariam tiles e health enquanto o EE responde),
+        # canceladas se o cliente desconectar
+        async with ee_executor.cancel_on_disconnect(http_request):
+            # 1. Verificar se precisa buscar imagens
+            if polygon and any(keyword in message_lower for keyword in ['imagem', 'lst', 'ndvi', 'ndwi', 'menos nuvens', 'lista', 'disponível', 'disponivel']):
+                layer_type = None
+                if 'lst' in message_lower or 'temperatura' in message_lower or 'calor' in message_lower:
+                    layer_type = 'LST'
+                elif 'ndvi' in message_lower or 'vegetação' in message_lower or 'vegetacao' in message_lower:
+                    layer_type = 'NDVI'
+                elif 'ndwi' in message_lower or 'água' in message_lower or 'agua' in message_lower:
+                    layer_type = 'NDWI'
             
-            if layer_type and start_date and end_date:
-                images_result = list_available_images_tool(
-                    polygon_coords=polygon,
-                    layer_type=layer_type,
-                    start_date=start_date,
-                    end_date=end_date,
-                    max_results=10
-                )
-                tool_results.append(images_result)
+                if layer_type and start_date and end_date:
+                    images_result = await asyncio.to_thread(
+                        list_available_images_tool,
+                        polygon_coords=polygon,
+                        layer_type=layer_type,
+                        start_date=start_date,
+                        end_date=end_date,
+                        max_results=10
+                    )
+                    tool_results.append(images_result)
         
-        # 2. Verificar se precisa analisar GeoJSON
-        if geojson and any(keyword in message_lower for keyword in ['municípios', 'municipios', 'favelas', 'comunidades', 'setores', 'quantas', 'quantos', 'bairros']):
-            geojson_result = analyze_geojson_features_tool(
-                geojson_data=geojson,
-                polygon_coords=polygon if polygon else None
-            )
-            tool_results.append(geojson_result)
+            # 2. Verificar se precisa analisar GeoJSON (dataset da pasta data tem prioridade)
+            geojson_dataset = (request.context_data or {}).get('geojson_dataset')
+            if (geojson or geojson_dataset) and any(keyword in message_lower for keyword in ['municípios', 'municipios', 'favelas', 'comunidades', 'setores', 'quantas', 'quantos', 'bairros']):
+                geojson_result = await asyncio.to_thread(
+                    analyze_geojson_features_tool,
+                    geojson_data=geojson,
+                    polygon_coords=polygon if polygon else None,
+                    dataset_name=geojson_dataset
+                )
+                tool_results.append(geojson_result)
         
-        # 3. Verificar se precisa calcular estatísticas
-        if polygon and any(keyword in message_lower for keyword in ['temperatura média', 'media', 'média', 'estatística', 'estatistica', 'mais intensa', 'mais quente', 'mais frio']):
-            layer_type = None
-            if 'lst' in message_lower or 'temperatura' in message_lower or 'calor' in message_lower:
-                layer_type = 'LST'
-            elif 'ndvi' in message_lower or 'vegetação' in message_lower or 'vegetacao' in message_lower:
-                layer_type = 'NDVI'
+            # 3. Verificar se precisa calcular estatísticas
+            if polygon and any(keyword in message_lower for keyword in ['temperatura média', 'media', 'média', 'estatística', 'estatistica', 'mais intensa', 'mais quente', 'mais frio']):
+                layer_type = None
+                if 'lst' in message_lower or 'temperatura' in message_lower or 'calor' in message_lower:
+                    layer_type = 'LST'
+                elif 'ndvi' in message_lower or 'vegetação' in message_lower or 'vegetacao' in message_lower:
+                    layer_type = 'NDVI'
             
-            if layer_type and start_date and end_date:
-                stats_result = calculate_image_statistics_tool(
-                    polygon_coords=polygon,
-                    layer_type=layer_type,
-                    start_date=start_date,
-                    end_date=end_date
-                )
-                tool_results.append(stats_result)
+                if layer_type and start_date and end_date:
+                    stats_result = await asyncio.to_thread(
+                        calculate_image_statistics_tool,
+                        polygon_coords=polygon,
+                        layer_type=layer_type,
+                        start_date=start_date,
+                        end_date=end_date
+                    )
+                    tool_results.append(stats_result)
         
-        # 4. Verificar se precisa análise SAR (radar)
-        if polygon and any(keyword in message_lower for keyword in ['sar', 'radar', 'sentinel-1', 'inundação', 'inundacao', 'alaga', 'enchente', 'alagamento']):
-            if start_date and end_date:
-                sar_result = analyze_sar_data_tool(
-                    polygon_coords=polygon,
-                    start_date=start_date,
-                    end_date=end_date,
-                    polarization='VV'
-                )
-                tool_results.append(sar_result)
+            # 4. Verificar se precisa análise SAR (radar)
+            if polygon and any(keyword in message_lower for keyword in ['sar', 'radar', 'sentinel-1', 'inundação', 'inundacao', 'alaga', 'enchente', 'alagamento']):
+                if start_date and end_date:
+                    sar_result = await asyncio.to_thread(
+                        analyze_sar_data_tool,
+                        polygon_coords=polygon,
+                        start_date=start_date,
+                        end_date=end_date,
+                        polarization='VV'
+                    )
+                    tool_results.append(sar_result)
         
-        # 5. Verificar se precisa análise de ilha de calor
-        if polygon and any(keyword in message_lower for keyword in ['ilha de calor', 'uhi', 'calor urbano', 'urbana']):
-            if start_date:
-                uhi_result = calculate_urban_heat_island_tool(
-                    polygon_coords=polygon,
-                    date=start_date
-                )
-                tool_results.append(uhi_result)
+            # 5. Verificar se precisa análise de ilha de calor
+            if polygon and any(keyword in message_lower for keyword in ['ilha de calor', 'uhi', 'calor urbano', 'urbana']):
+                if start_date:
+                    uhi_result = await asyncio.to_thread(
+                        calculate_urban_heat_island_tool,
+                        polygon_coords=polygon,
+                        date=start_date
+                    )
+                    tool_results.append(uhi_result)
         
-        # 6. Verificar se precisa análise de corpos d'água
-        if polygon and any(keyword in message_lower for keyword in ['água', 'agua', 'rio', 'lago', 'córrego', 'corrego', 'umidade', 'úmida']):
-            if start_date:
-                water_result = analyze_water_bodies_tool(
-                    polygon_coords=polygon,
-                    date=start_date
-                )
-                tool_results.append(water_result)
+            # 6. Verificar se precisa análise de corpos d'água
+            if polygon and any(keyword in message_lower for keyword in ['água', 'agua', 'rio', 'lago', 'córrego', 'corrego', 'umidade', 'úmida']):
+                if start_date:
+                    water_result = await asyncio.to_thread(
+                        analyze_water_bodies_tool,
+                        polygon_coords=polygon,
+                        date=start_date
+                    )
+                    tool_results.append(water_result)
         
         # Processar mensagem com resultados das ferramentas
         if tool_results:
@@ -294,6 +309,8 @@ Responda à pergunta usando esses dados de forma natural e clara, SEM mencionar
             response=response_text,
             context_summary=context_summary
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -301,7 +318,7 @@ Responda à pergunta usando esses dados de forma natural e clara, SEM mencionar
         )
 
 
-@router.post("/chat/text", response_model=ChatResponse)
+@router.post("/chat/text", response_model=ChatResponse, dependencies=[Depends(rate_limit.charge("agent_chat"))])
 async def chat_text_quick(request: ChatMessage):
     """Endpoint leve para Railway: recebe texto (ex: vindo do Web Speech API no cliente),
     usa o agente se disponível ou fallback local, dialetiza a resposta e retorna JSON.
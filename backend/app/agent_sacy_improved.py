@@ -100,6 +100,11 @@ class SacyAgentImproved:
                     parameters={
                         "type": "object",
                         "properties": {
+                            "dataset": {
+                                "type": "string",
+                                "description": "Arquivo da pasta data a analisar (opcional). Sem ele, usa o GeoJSON carregado no mapa",
+                                "enum": ["FCUs_BR.json", "setores_censitarios.json", "geopackages_n_setorizadas.json"]
+                            },
                             "filter_by": {
                                 "type": "string",
                                 "description": "Filtrar por propriedade específica (opcional)"
@@ -352,7 +357,7 @@ Bom ✅: "Massa de vegetação aqui! Tá bem verde (NDVI 0.7) - isso é floresta
                 return analyze_geojson_features_tool(
                     geojson_data=geojson_data or {},
                     polygon_coords=polygon_coords,
-                    filter_by=args.get('filter_by')
+                    dataset_name=args.get('dataset')
                 )
             
             else:
@@ -12,7 +12,13 @@ import json
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import ee
+import pyarrow as pa
+import shapely
+from shapely.geometry import Polygon, shape
 
+from . import ee_executor, geo_processor, grid_index
+
+@ee_executor.blocking(ee_executor.BATCH)
 def list_available_images_tool(
     polygon_coords: List[Dict[str, float]],
     layer_type: str,
@@ -59,6 +65,7 @@ def list_available_images_tool(
         
         results = []
         for i in range(min(size, max_results)):
+            ee_executor.check_cancelled()
             img = ee.Image(images_list.get(i))
             props = img.getInfo()['properties']
             
@@ -89,10 +96,35 @@ def list_available_images_tool(
         }
 
 
-def analyze_geojson_features_tool(
-    geojson_data: Dict[str, Any],
+def _read_dataset_features(
+    dataset_name: str,
     polygon_coords: Optional[List[Dict[str, float]]] = None,
     property_filter: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Features do dataset que intersectam o polígono (interseção local com shapely).
+    Com `property_filter`, os índices de atributos do dataset são usados antes
+    de qualquer teste geométrico.
+    """
+    if property_filter:
+        geometry = Polygon([[p['lng'], p['lat']] for p in polygon_coords]) if polygon_coords else None
+        return geo_processor.select_features(dataset_name, geometry=geometry, where=property_filter)
+    if not polygon_coords:
+        return geo_processor.read_features(dataset_name)
+    
+    ring = [[p['lng'], p['lat']] for p in polygon_coords]
+    polygon = Polygon(ring)
+    meta = geo_processor.dataset_info(dataset_name)
+    table = geo_processor.read_table(dataset_name, bbox=polygon.bounds)
+    hits = shapely.intersects(geo_processor.table_geometries(table), polygon)
+    return geo_processor.table_to_features(table.filter(pa.array(hits)), meta.get('json_columns', []))
+
+
+def analyze_geojson_features_tool(
+    geojson_data: Optional[Dict[str, Any]] = None,
+    polygon_coords: Optional[List[Dict[str, float]]] = None,
+    property_filter: Optional[Dict[str, Any]] = None,
+    dataset_name: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Analisa features de um GeoJSON, opcionalmente filtrando por polígono.
@@ -101,44 +133,36 @@ def analyze_geojson_features_tool(
         geojson_data: Dados GeoJSON completos
         polygon_coords: Polígono opcional para filtrar features
         property_filter: Filtro opcional por propriedades
+        dataset_name: Arquivo da pasta data; quando informado, as features são
+            lidas do sidecar GeoParquet (só a janela do polígono) em vez de geojson_data
     
     Returns:
         Dict com estatísticas e features filtradas
     """
     try:
-        features = geojson_data.get('features', [])
+        if dataset_name:
+            features = _read_dataset_features(dataset_name, polygon_coords, property_filter)
+        else:
+            features = (geojson_data or {}).get('features', [])
         
-        # Se tem polígono, filtrar features que intersectam
-        if polygon_coords:
-            coords_ee = [[p['lng'], p['lat']] for p in polygon_coords]
-            filter_geom = ee.Geometry.Polygon([coords_ee])
+        # Se tem polígono, filtrar features que intersectam (local, como no caminho do dataset)
+        if polygon_coords and not dataset_name:
+            filter_geom = Polygon([[p['lng'], p['lat']] for p in polygon_coords])
             
             filtered_features = []
             for feature in features:
                 try:
-                    # Converter feature para geometria EE
-                    geom_type = feature['geometry']['type']
-                    coords = feature['geometry']['coordinates']
-                    
-                    if geom_type == 'Polygon':
-                        feat_geom = ee.Geometry.Polygon(coords)
-                    elif geom_type == 'MultiPolygon':
-                        feat_geom = ee.Geometry.MultiPolygon(coords)
-                    elif geom_type == 'Point':
-                        feat_geom = ee.Geometry.Point(coords)
-                    else:
+                    if feature['geometry']['type'] not in ('Polygon', 'MultiPolygon', 'Point'):
                         continue
-                    
-                    # Verificar interseção
-                    if feat_geom.intersects(filter_geom).getInfo():
+                    if shape(feature['geometry']).intersects(filter_geom):
                         filtered_features.append(feature)
-                except:
+                except Exception:
                     continue
             
             features = filtered_features
         
         # Aplicar filtro de propriedades se fornecido
-        if property_filter:
+        if property_filter and not dataset_name:
             filtered = []
             for feature in features:
                 props = feature.get('properties', {})
@@ -155,6 +179,12 @@ def analyze_geojson_features_tool(
         total_features = len(features)
         properties_summary = {}
         
+        # Totais da área pela grade pré-agregada (contagem, área e atributos somáveis)
+        area_summary = None
+        if dataset_name and polygon_coords and not property_filter:
+            ring = [[p['lng'], p['lat']] for p in polygon_coords]
+            area_summary = grid_index.summarize(dataset_name, Polygon(ring))['values']
+        
         if features:
             # Pegar propriedades únicas da primeira feature
             sample_props = features[0].get('properties', {})
@@ -183,6 +213,7 @@ def analyze_geojson_features_tool(
             'success': True,
             'total_features': total_features,
             'properties_summary': properties_summary,
+            'area_summary': area_summary,
             'features': features[:100]  # Limitar para não sobrecarregar
         }
         
@@ -193,6 +224,7 @@ def analyze_geojson_features_tool(
         }
 
 
+@ee_executor.blocking(ee_executor.BATCH)
 def calculate_image_statistics_tool(
     polygon_coords: List[Dict[str, float]],
     layer_type: str,
@@ -304,6 +336,7 @@ def calculate_image_statistics_tool(
         }
 
 
+@ee_executor.blocking(ee_executor.BATCH)
 def analyze_sar_data_tool(
     polygon_coords: List[Dict[str, float]],
     start_date: str,
@@ -379,6 +412,7 @@ def analyze_sar_data_tool(
         }
 
 
+@ee_executor.blocking(ee_executor.BATCH)
 def detect_change_tool(
     polygon_coords: List[Dict[str, float]],
     layer_type: str,
@@ -454,6 +488,7 @@ def detect_change_tool(
         }
 
 
+@ee_executor.blocking(ee_executor.BATCH)
 def calculate_urban_heat_island_tool(
     polygon_coords: List[Dict[str, float]],
     date: str
@@ -522,6 +557,7 @@ def calculate_urban_heat_island_tool(
         }
 
 
+@ee_executor.blocking(ee_executor.BATCH)
 def analyze_water_bodies_tool(
     polygon_coords: List[Dict[str, float]],
     date: str
@@ -604,7 +640,7 @@ AVAILABLE_TOOLS = {
     'analyze_geojson': {
         'function': analyze_geojson_features_tool,
         'description': 'Analisa features de GeoJSON, com filtros opcionais',
-        'parameters': ['geojson_data', 'polygon_coords', 'property_filter']
+        'parameters': ['geojson_data', 'polygon_coords', 'property_filter', 'dataset_name']
     },
     'calculate_statistics': {
         'function': calculate_image_statistics_tool,
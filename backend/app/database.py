@@ -1,9 +1,11 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 # Definição do banco de dados SQLite (o mais leve para seu notebook)
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sentinel_ia.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sentinel_ia.db")
 
 # 1. Cria a Engine de Conexão (o create_engine que estava faltando import)
 # connect_args={"check_same_thread": False} é OBRIGATÓRIO para SQLite no FastAPI
@@ -11,6 +13,15 @@ engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 
+# WAL: leituras não bloqueiam a escrita de outro worker do gunicorn
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
 # 2. Configura a Sessão de Banco de Dados
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,394 @@
+# backend/app/ee_executor.py - Camada de execução do Earth Engine com classes de prioridade
+"""
+Toda chamada bloqueante ao Earth Engine passa por aqui.
+
+Há duas classes de prioridade, cada uma com seu próprio pool de threads e,
+portanto, seu próprio orçamento de concorrência:
+
+- interactive: interação com o mapa (get_tile, list_images, get_dem, tiles do
+  proxy). Pool maior, tarefas curtas.
+- batch: análises pesadas (analyze_area, get_analysis_data, time_series,
+  timelapse, batch_analysis, ferramentas do agente). Pool menor; pedidos
+  além do orçamento esperam na fila do próprio pool.
+
+Assim um usuário rodando séries temporais ocupa no máximo EE_BATCH_WORKERS
+threads do worker, e quem liga/desliga camadas nunca espera atrás dele.
+Os endpoints continuam escritos como funções síncronas; o decorator
+`endpoint(classe)` os transforma em corrotinas que rodam no pool da classe,
+com o contexto (contextvars) da requisição copiado para a thread.
+
+Disjuntor (circuit breaker): falhas do EE (exceções e respostas 5xx) ou
+chamadas mais lentas que EE_BREAKER_SLOW_SECONDS (por classe) contam como falha; depois de
+EE_BREAKER_FAILURES seguidas o disjuntor abre e as chamadas falham na hora,
+sem esperar o timeout do EE. Após EE_BREAKER_RESET_SECONDS uma única chamada
+passa como sonda (meio-aberto): sucesso fecha, falha reabre. Com o disjuntor
+aberto (ou numa falha), o endpoint pode devolver um resultado guardado
+marcado como `stale` via `fallback`; sem ele, responde 503 com Retry-After.
+
+Revalidação em segundo plano (`revalidate`): recalcula no pool batch um
+resultado que o cache já serviu vencido (stale-while-revalidate), uma vez por
+chave, e só com o disjuntor fechado e o pool sem fila.
+
+Cancelamento: enquanto a requisição está no pool, `cancel_on_disconnect`
+verifica a cada EE_DISCONNECT_POLL_SECONDS se o cliente desconectou (aba
+fechada, polígono redesenhado). Se sim, as tarefas ainda na fila nem começam
+e os laços por imagem param na próxima volta (`check_cancelled`), liberando
+a thread e a cota do EE.
+
+Prazo (deadline): cada requisição tem um orçamento de tempo, do header
+X-Request-Timeout (segundos) ou EE_REQUEST_DEADLINE_SECONDS, abaixo do
+timeout de 120 s do gunicorn. Endpoints com várias etapas consultam
+`deadline_near()` antes de cada etapa/imagem e, sem tempo, devolvem o que já
+calcularam marcado como parcial em vez de o worker ser morto sem resposta.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+EE_INTERACTIVE_WORKERS = int(os.getenv("EE_INTERACTIVE_WORKERS", "8"))
+EE_BATCH_WORKERS = int(os.getenv("EE_BATCH_WORKERS", "3"))
+EE_BREAKER_FAILURES = int(os.getenv("EE_BREAKER_FAILURES", "5"))
+# Chamadas mais lentas que isso contam como falha (por classe: análises demoram mais)
+EE_BREAKER_SLOW_SECONDS = {
+    INTERACTIVE: float(os.getenv("EE_BREAKER_SLOW_INTERACTIVE", "20")),
+    BATCH: float(os.getenv("EE_BREAKER_SLOW_BATCH", "110")),
+}
+EE_BREAKER_RESET_SECONDS = float(os.getenv("EE_BREAKER_RESET_SECONDS", "30"))
+EE_DISCONNECT_POLL_SECONDS = float(os.getenv("EE_DISCONNECT_POLL_SECONDS", "1"))
+# Status (convenção do nginx) para requisições abandonadas pelo cliente
+CLIENT_CLOSED_REQUEST = 499
+# Orçamento padrão por requisição (o gunicorn mata o worker aos 120 s)
+EE_REQUEST_DEADLINE_SECONDS = float(os.getenv("EE_REQUEST_DEADLINE_SECONDS", "100"))
+# Folga mínima para começar mais uma etapa (uma imagem, uma redução)
+EE_DEADLINE_RESERVE_SECONDS = float(os.getenv("EE_DEADLINE_RESERVE_SECONDS", "10"))
+DEADLINE_HEADER = "x-request-timeout"
+
+BUDGETS = {INTERACTIVE: EE_INTERACTIVE_WORKERS, BATCH: EE_BATCH_WORKERS}
+
+_pools: Dict[str, ThreadPoolExecutor] = {
+    name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"ee-{name}")
+    for name, workers in BUDGETS.items()
+}
+# Classe da tarefa em execução na thread atual (None fora dos pools)
+current_priority: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("ee_priority", default=None)
+# Sinal de cancelamento da requisição atual (None fora de cancel_on_disconnect)
+cancel_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("ee_cancel", default=None)
+# Instante (time.monotonic) em que a requisição atual precisa responder; None = sem prazo
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("ee_deadline", default=None)
+
+_counts = {name: {"queued": 0, "running": 0, "completed": 0, "failed": 0, "cancelled": 0} for name in _pools}
+_counts_lock = threading.Lock()
+# Chaves com revalidação em segundo plano em andamento
+_revalidating: set = set()
+
+
+class EEUnavailable(Exception):
+    """Disjuntor aberto: a chamada nem chega ao Earth Engine."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Earth Engine temporariamente indisponível")
+        self.retry_after = retry_after
+
+
+class RequestCancelled(BaseException):
+    """
+    O cliente desconectou. Herda de BaseException (como asyncio.CancelledError)
+    para atravessar os `except Exception` dos laços por imagem.
+    """
+
+
+class CircuitBreaker:
+    """Disjuntor fechado / aberto / meio-aberto em torno das chamadas ao EE."""
+
+    def __init__(self, failures: int = EE_BREAKER_FAILURES, reset_seconds: float = EE_BREAKER_RESET_SECONDS):
+        self.max_failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error: Optional[str] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """
+        Levanta EEUnavailable se a chamada não deve ir ao EE agora. Retorna
+        True se esta chamada é a sonda do meio-aberto.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return False
+            remaining = self.opened_at + self.reset_seconds - time.time()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True  # Esta chamada é a sonda
+                return True
+            raise EEUnavailable(max(remaining, 1.0))
+
+    def record(self, ok: bool, error: Optional[str] = None) -> None:
+        with self._lock:
+            probe = self.state == "half_open" and self._probe_in_flight
+            if probe:
+                self._probe_in_flight = False
+            if ok:
+                if self.state != "closed":
+                    print("✅ Disjuntor do Earth Engine fechado")
+                self.state, self.failures = "closed", 0
+                return
+            self.failures += 1
+            self.last_error = error
+            if probe or (self.state == "closed" and self.failures >= self.max_failures):
+                if self.state != "open":
+                    print(f"⛔ Disjuntor do Earth Engine aberto ({self.failures} falhas): {error}")
+                self.state, self.opened_at = "open", time.time()
+
+    def release_probe(self) -> None:
+        """A sonda terminou sem resultado (cancelada): libera a vaga sem mudar o estado."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened_at": self.opened_at or None,
+                "last_error": self.last_error,
+            }
+
+breaker = CircuitBreaker()
+
+def check_cancelled() -> None:
+    """Levanta RequestCancelled se o cliente da requisição atual desconectou."""
+    event = cancel_event.get()
+    if event is not None and event.is_set():
+        raise RequestCancelled()
+
+def remaining() -> float:
+    """Segundos até o prazo da requisição atual (infinito sem prazo, ex.: warmup)."""
+    deadline = request_deadline.get()
+    return math.inf if deadline is None else deadline - time.monotonic()
+
+def deadline_near(reserve: float = EE_DEADLINE_RESERVE_SECONDS) -> bool:
+    """Se não há mais `reserve` segundos para outra etapa antes do prazo."""
+    return remaining() < reserve
+
+def _budget(request: Optional[Request]) -> float:
+    """Orçamento pedido no header (limitado ao padrão) ou o padrão."""
+    value = request.headers.get(DEADLINE_HEADER) if request is not None else None
+    try:
+        return min(max(float(value), 1.0), EE_REQUEST_DEADLINE_SECONDS) if value else EE_REQUEST_DEADLINE_SECONDS
+    except ValueError:
+        return EE_REQUEST_DEADLINE_SECONDS
+
+async def _watch_disconnect(request: Request, event: threading.Event) -> None:
+    while not event.is_set():
+        if await request.is_disconnected():
+            print(f"🔌 Cliente desconectou: cancelando {request.url.path}")
+            event.set()
+            return
+        await asyncio.sleep(EE_DISCONNECT_POLL_SECONDS)
+
+@contextlib.asynccontextmanager
+async def cancel_on_disconnect(request: Optional[Request]):
+    """
+    Escopo de uma requisição: o trabalho do EE iniciado aqui dentro (inclusive
+    no pool, que copia o contexto) é cancelado se o cliente desconectar.
+    RequestCancelled vira HTTP 499.
+    """
+    event = threading.Event()
+    token = cancel_event.set(event)
+    watcher = asyncio.create_task(_watch_disconnect(request, event)) if request is not None else None
+    try:
+        yield event
+    except RequestCancelled:
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Cliente desconectou")
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        cancel_event.reset(token)
+
+def _is_ee_failure(exc: BaseException) -> bool:
+    """Erros do EE (ou 5xx gerados a partir deles); 4xx são respostas válidas."""
+    if isinstance(exc, HTTPException):
+        return exc.status_code >= 500
+    return isinstance(exc, Exception)
+
+
+def _count(priority: str, **deltas: int) -> None:
+    with _counts_lock:
+        for field, delta in deltas.items():
+            _counts[priority][field] += delta
+
+def _execute(priority: str, fn: Callable[..., Any], args, kwargs, probe: bool = False) -> Any:
+    _count(priority, queued=-1, running=1)
+    token = current_priority.set(priority)
+    started = time.time()
+    try:
+        check_cancelled()  # Ficou na fila e o cliente já foi embora
+        result = fn(*args, **kwargs)
+    except RequestCancelled:
+        _count(priority, cancelled=1)  # Não diz nada sobre a saúde do EE
+        if probe:
+            breaker.release_probe()  # Sonda cancelada: a próxima chamada sonda
+        raise
+    except BaseException as e:
+        _count(priority, failed=1)
+        failed = _is_ee_failure(e)
+        breaker.record(not failed, str(getattr(e, "detail", e)) if failed else None)
+        raise
+    else:
+        _count(priority, completed=1)
+        elapsed = time.time() - started
+        slow = elapsed > EE_BREAKER_SLOW_SECONDS[priority]
+        breaker.record(not slow, f"chamada lenta ({elapsed:.0f}s)" if slow else None)
+        return result
+    finally:
+        current_priority.reset(token)
+        _count(priority, running=-1)
+
+async def run(priority: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Executa `fn` no pool da classe sem bloquear o event loop."""
+    probe = breaker.before_call()
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    _count(priority, queued=1)
+    return await loop.run_in_executor(
+        _pools[priority], functools.partial(ctx.run, _execute, priority, fn, args, kwargs, probe)
+    )
+
+def call(priority: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Versão síncrona de `run`. Se a thread atual já é de um pool do EE, executa
+    direto (evita deadlock esperando por uma vaga no mesmo pool).
+    """
+    check_cancelled()
+    if current_priority.get() is not None:
+        return fn(*args, **kwargs)
+    probe = breaker.before_call()
+    ctx = contextvars.copy_context()
+    _count(priority, queued=1)
+    return _pools[priority].submit(ctx.run, _execute, priority, fn, args, kwargs, probe).result()
+
+def revalidate(key: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> bool:
+    """
+    Agenda `fn` no pool batch sem esperar pelo resultado. Ignora a chave se já
+    está sendo revalidada, se o disjuntor não está fechado ou se já há
+    análises na fila (quem está esperando tem prioridade). Retorna se agendou.
+    """
+    with _counts_lock:
+        if key in _revalidating or _counts[BATCH]["queued"] > 0:
+            return False
+        if breaker.state != "closed":
+            return False
+        _revalidating.add(key)
+        _counts[BATCH]["queued"] += 1
+
+    def job() -> None:
+        try:
+            _execute(BATCH, fn, args, kwargs)
+        except Exception as e:
+            print(f"⚠️ Revalidação de {key[:60]} falhou: {getattr(e, 'detail', e)}")
+        finally:
+            with _counts_lock:
+                _revalidating.discard(key)
+
+    # Roda fora do contexto da requisição que disparou (ela já respondeu)
+    try:
+        _pools[BATCH].submit(contextvars.Context().run, job)
+    except RuntimeError:  # Pool encerrado (shutdown)
+        with _counts_lock:
+            _revalidating.discard(key)
+            _counts[BATCH]["queued"] -= 1
+        return False
+    print(f"🔁 Revalidando em segundo plano: {key[:60]}")
+    return True
+
+
+def endpoint(priority: str, fallback: Optional[Callable[..., Any]] = None):
+    """
+    Decorator: endpoint síncrono que roda no pool da classe (vira corrotina
+    para o FastAPI), com o prazo da requisição em `request_deadline`. Se o
+    endpoint recebe o `Request`, o prazo pode vir do header e o trabalho é
+    cancelado quando o cliente desconecta. `fallback` recebe os mesmos argumentos do endpoint e
+    devolve um resultado guardado (ou None) quando o EE falha ou o disjuntor
+    está aberto.
+    """
+    def decorator(fn: Callable[..., Any]):
+        async def stale(*args: Any, **kwargs: Any) -> Any:
+            if fallback is None:
+                return None
+            try:
+                result = await asyncio.to_thread(fallback, *args, **kwargs)
+            except Exception as e:
+                print(f"⚠️ Fallback de {fn.__name__} falhou: {e}")
+                return None
+            if result is not None:
+                print(f"🧊 {fn.__name__}: servindo resultado guardado (stale)")
+            return result
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            request = next((v for v in kwargs.values() if isinstance(v, Request)), None)
+            token = request_deadline.set(time.monotonic() + _budget(request))
+            try:
+                async with cancel_on_disconnect(request):
+                    return await run(priority, fn, *args, **kwargs)
+            except EEUnavailable as e:
+                result = await stale(*args, **kwargs)
+                if result is not None:
+                    return result
+                retry_after = str(int(e.retry_after + 0.5))
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": retry_after})
+            except HTTPException as e:
+                if e.status_code >= 500:
+                    result = await stale(*args, **kwargs)
+                    if result is not None:
+                        return result
+                raise
+            finally:
+                request_deadline.reset(token)
+        # Anotações já resolvidas: o FastAPI lê a assinatura do wrapper, cujo
+        # módulo não conhece os modelos do endpoint
+        wrapper.__signature__ = inspect.signature(fn, eval_str=True)
+        return wrapper
+    return decorator
+
+def blocking(priority: str):
+    """Decorator: função síncrona (ex.: ferramenta do agente) executada no pool da classe."""
+    def decorator(fn: Callable[..., Any]):
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return call(priority, fn, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> Dict[str, Any]:
+    """Ocupação de cada classe e estado do disjuntor (para /health)."""
+    with _counts_lock:
+        counts: Dict[str, Any] = {name: dict(c) for name, c in _counts.items()}
+        revalidating = len(_revalidating)
+    for name, workers in BUDGETS.items():
+        counts[name]["workers"] = workers
+    counts["revalidating"] = revalidating
+    counts["breaker"] = breaker.snapshot()
+    return counts
+
+def shutdown() -> None:
+    for pool in _pools.values():
+        pool.shutdown(wait=False, cancel_futures=True)
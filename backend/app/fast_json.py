@@ -0,0 +1,53 @@
+# backend/app/fast_json.py - Serialização JSON rápida para respostas grandes
+"""
+Caminho rápido de JSON para as respostas grandes (camadas GeoJSON, séries
+temporais, timelapse).
+
+Devolver um `Response` pronto faz o FastAPI pular a validação do
+response_model e o jsonable_encoder, que percorrem o payload inteiro em
+Python. Os payloads daqui são montados pelo próprio backend (ou vêm de um
+cache que guardou um resultado já validado), então a validação não acrescenta
+nada. `response_model` continua declarado nas rotas para a documentação.
+
+orjson é opcional: sem ele, cai no json padrão (mesma saída, mais lento).
+"""
+import json
+from typing import Any, Union
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:  # orjson é opcional; sem ele, json padrão
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+MEDIA_TYPE = "application/json"
+
+
+def _default(obj: Any) -> Any:
+    """Tipos fora do JSON: modelos pydantic viram dict, o resto vira texto (como default=str)."""
+    if isinstance(obj, BaseModel):
+        return obj.dict()
+    return str(obj)
+
+def dumps(obj: Any) -> bytes:
+    """JSON compacto em UTF-8 (sem escapar acentos)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """Resposta JSON serializada com `dumps`; aceita modelos pydantic sem revalidar."""
+
+    media_type = MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def raw(body: Union[str, bytes], **kwargs: Any) -> Response:
+    """Resposta a partir de JSON já serializado (ex.: payload guardado no cache)."""
+    return Response(content=body.encode("utf-8") if isinstance(body, str) else body,
+                    media_type=MEDIA_TYPE, **kwargs)
@@ -0,0 +1,337 @@
+# backend/app/geo_formats.py - Formatos compactos de GeoJSON para a API
+"""
+Codificação das camadas GeoJSON em formatos compactos para transferência:
+
+- `geojson`: GeoJSON com coordenadas arredondadas (`precision` casas decimais)
+- `topojson`: TopoJSON com arcos compartilhados entre polígonos vizinhos,
+  coordenadas quantizadas e delta-encoded
+- `geobuf`: Geobuf (protobuf) via pacote `geobuf`
+
+Os corpos são comprimidos com brotli ou gzip conforme o Accept-Encoding e
+ficam em um cache LRU em memória por (dataset, nível, formato, precisão,
+encoding), então a serialização e a compressão acontecem uma vez por worker.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import geobuf
+
+from .fast_json import dumps
+
+try:  # brotli é opcional; sem ele, gzip
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+FORMATS = ("geojson", "topojson", "geobuf")
+FORMAT_PATTERN = "^(geojson|topojson|geobuf)$"
+DEFAULT_PRECISION = 6  # ~0,1 m no equador
+MEDIA_TYPES = {
+    "geojson": "application/geo+json",
+    "topojson": "application/json",
+    "geobuf": "application/x-protobuf",
+}
+ENCODED_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+# =========================
+# GeoJSON com precisão limitada
+# =========================
+def _round_coords(coords: Any, precision: int) -> Any:
+    if isinstance(coords, (list, tuple)):
+        if coords and isinstance(coords[0], (int, float)):
+            return [round(c, precision) for c in coords]
+        return [_round_coords(c, precision) for c in coords]
+    return coords
+
+def _round_geometry(geom: Optional[Dict[str, Any]], precision: int) -> Optional[Dict[str, Any]]:
+    if not geom:
+        return geom
+    if geom.get("type") == "GeometryCollection":
+        return {"type": "GeometryCollection",
+                "geometries": [_round_geometry(g, precision) for g in geom.get("geometries", [])]}
+    return {"type": geom["type"], "coordinates": _round_coords(geom.get("coordinates"), precision)}
+
+def quantize_geojson(gj: Dict[str, Any], precision: int) -> Dict[str, Any]:
+    """Cópia do GeoJSON com coordenadas arredondadas para `precision` casas."""
+    t = gj.get("type")
+    if t == "FeatureCollection":
+        out = {k: v for k, v in gj.items() if k != "features"}
+        out["features"] = [quantize_geojson(f, precision) for f in gj.get("features", [])]
+        return out
+    if t == "Feature":
+        out = dict(gj)
+        out["geometry"] = _round_geometry(gj.get("geometry"), precision)
+        return out
+    return _round_geometry(gj, precision)
+
+
+# =========================
+# TopoJSON (arcos compartilhados)
+# =========================
+class _TopologyBuilder:
+    """
+    Constrói a topologia no estilo do topojson de referência: quantiza as
+    coordenadas, encontra junções (pontos com vizinhos diferentes em linhas
+    distintas), corta os anéis nas junções e deduplica arcos idênticos ou
+    invertidos, que passam a ser referenciados por índice (~i = invertido).
+    """
+
+    def __init__(self, bbox: Sequence[float], precision: int):
+        x0, y0, x1, y1 = bbox
+        self.kx = 10.0 ** -precision
+        self.ky = 10.0 ** -precision
+        self.x0, self.y0 = x0, y0
+        self.lines: List[Tuple[List[Tuple[int, int]], bool]] = []  # (pontos, é anel)
+        self.arcs: List[List[Tuple[int, int]]] = []
+        self._arc_index: Dict[Tuple[Tuple[int, int], ...], int] = {}
+
+    def quantize(self, p: Sequence[float]) -> Tuple[int, int]:
+        return (int(round((p[0] - self.x0) / self.kx)), int(round((p[1] - self.y0) / self.ky)))
+
+    def add_line(self, coords: Sequence[Sequence[float]], ring: bool) -> int:
+        pts: List[Tuple[int, int]] = []
+        for p in coords:
+            q = self.quantize(p)
+            if not pts or pts[-1] != q:
+                pts.append(q)
+        if ring and len(pts) > 1 and pts[0] != pts[-1]:
+            pts.append(pts[0])
+        self.lines.append((pts, ring))
+        return len(self.lines) - 1
+
+    def _junctions(self) -> set:
+        neighbors: Dict[Tuple[int, int], Tuple] = {}
+        junctions = set()
+        for pts, ring in self.lines:
+            body = pts[:-1] if ring else pts
+            n = len(body)
+            if not ring and n:
+                junctions.add(body[0])
+                junctions.add(body[-1])
+            for i, p in enumerate(body):
+                if ring:
+                    prev, nxt = body[i - 1], body[(i + 1) % n]
+                else:
+                    prev = body[i - 1] if i > 0 else None
+                    nxt = body[i + 1] if i < n - 1 else None
+                pair = frozenset((prev, nxt))
+                seen = neighbors.get(p)
+                if seen is None:
+                    neighbors[p] = pair
+                elif seen != pair:
+                    junctions.add(p)
+        return junctions
+
+    def _arc_ref(self, arc: List[Tuple[int, int]]) -> int:
+        key = tuple(arc)
+        if key in self._arc_index:
+            return self._arc_index[key]
+        rkey = tuple(reversed(arc))
+        if rkey in self._arc_index:
+            return ~self._arc_index[rkey]
+        self._arc_index[key] = len(self.arcs)
+        self.arcs.append(arc)
+        return len(self.arcs) - 1
+
+    def build(self) -> List[List[int]]:
+        """Arcos (índices) de cada linha registrada, na ordem de add_line."""
+        junctions = self._junctions()
+        result = []
+        for pts, ring in self.lines:
+            if ring:
+                body = pts[:-1]
+                cut = [i for i, p in enumerate(body) if p in junctions]
+                if not cut:
+                    # Anel sem junções: rotação canônica para deduplicar anéis idênticos
+                    start = body.index(min(body)) if body else 0
+                    body = body[start:] + body[:start]
+                    result.append([self._arc_ref(body + body[:1])])
+                    continue
+                body = body[cut[0]:] + body[:cut[0]]
+                closed = body + body[:1]
+            else:
+                closed = pts
+            refs = []
+            arc = [closed[0]]
+            for p in closed[1:]:
+                arc.append(p)
+                if p in junctions:
+                    refs.append(self._arc_ref(arc))
+                    arc = [p]
+            if len(arc) > 1:
+                refs.append(self._arc_ref(arc))
+            result.append(refs)
+        return result
+
+    def encoded_arcs(self) -> List[List[List[int]]]:
+        """Arcos delta-encoded, como no formato TopoJSON quantizado."""
+        out = []
+        for arc in self.arcs:
+            px, py = 0, 0
+            enc = []
+            for x, y in arc:
+                enc.append([x - px, y - py])
+                px, py = x, y
+            out.append(enc)
+        return out
+
+def _geometry_bbox(features: Sequence[Dict[str, Any]]) -> List[float]:
+    xs, ys = [], []
+
+    def walk(c):
+        if isinstance(c, (list, tuple)) and c and isinstance(c[0], (int, float)):
+            xs.append(c[0])
+            ys.append(c[1])
+        elif isinstance(c, (list, tuple)):
+            for item in c:
+                walk(item)
+
+    for f in features:
+        walk((f.get("geometry") or {}).get("coordinates"))
+    return [min(xs), min(ys), max(xs), max(ys)] if xs else [0.0, 0.0, 0.0, 0.0]
+
+def to_topojson(gj: Dict[str, Any], object_name: str, precision: int = DEFAULT_PRECISION) -> Dict[str, Any]:
+    """Converte um FeatureCollection em TopoJSON com arcos compartilhados."""
+    features = gj.get("features", []) if gj.get("type") == "FeatureCollection" else [gj]
+    bbox = _geometry_bbox(features)
+    builder = _TopologyBuilder(bbox, precision)
+
+    # 1ª passada: registra linhas; guarda a estrutura para montar os objetos depois
+    pending = []
+    for f in features:
+        geom = f.get("geometry") or {}
+        t = geom.get("type")
+        coords = geom.get("coordinates")
+        if t == "Polygon":
+            shape_ = [[builder.add_line(r, True) for r in coords]]
+        elif t == "MultiPolygon":
+            shape_ = [[builder.add_line(r, True) for r in poly] for poly in coords]
+        elif t == "LineString":
+            shape_ = builder.add_line(coords, False)
+        elif t == "MultiLineString":
+            shape_ = [builder.add_line(line, False) for line in coords]
+        else:
+            shape_ = None
+        pending.append((f, t, coords, shape_))
+
+    line_arcs = builder.build()
+    geometries = []
+    for f, t, coords, shape_ in pending:
+        obj: Dict[str, Any] = {"type": t}
+        if t == "Polygon":
+            obj["arcs"] = [line_arcs[i] for i in shape_[0]]
+        elif t == "MultiPolygon":
+            obj["arcs"] = [[line_arcs[i] for i in poly] for poly in shape_]
+        elif t == "LineString":
+            obj["arcs"] = line_arcs[shape_]
+        elif t == "MultiLineString":
+            obj["arcs"] = [line_arcs[i] for i in shape_]
+        elif t == "Point":
+            obj["coordinates"] = list(builder.quantize(coords))
+        elif t == "MultiPoint":
+            obj["coordinates"] = [list(builder.quantize(p)) for p in coords]
+        else:
+            obj = {"type": None}
+        if f.get("id") is not None:
+            obj["id"] = f["id"]
+        if f.get("properties"):
+            obj["properties"] = f["properties"]
+        geometries.append(obj)
+
+    return {
+        "type": "Topology",
+        "bbox": bbox,
+        "transform": {"scale": [builder.kx, builder.ky], "translate": [builder.x0, builder.y0]},
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": builder.encoded_arcs(),
+    }
+
+
+# =========================
+# Serialização + compressão
+# =========================
+def encode(gj: Dict[str, Any], fmt: str, precision: Optional[int], object_name: str = "layer") -> bytes:
+    """Serializa o GeoJSON no formato pedido (bytes sem compressão)."""
+    if fmt == "topojson":
+        body = to_topojson(gj, object_name, precision if precision is not None else DEFAULT_PRECISION)
+        return dumps(body)
+    if fmt == "geobuf":
+        return geobuf.encode(gj, precision if precision is not None else DEFAULT_PRECISION)
+    if precision is not None:
+        gj = quantize_geojson(gj, precision)
+    return dumps(gj)
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Melhor Content-Encoding aceito pelo cliente: br > gzip > nenhum."""
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+class EncodedCache:
+    """LRU em memória de corpos já serializados e comprimidos, limitado em bytes."""
+
+    def __init__(self, max_bytes: int = ENCODED_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            body = self._items.get(key)
+            if body is not None:
+                self._items.move_to_end(key)
+            return body
+
+    def put(self, key: Hashable, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+encoded_cache = EncodedCache()
+
+def encoded_body(key: Optional[Hashable], build, fmt: str, precision: Optional[int],
+                 accept_encoding: Optional[str], object_name: str = "layer") -> Tuple[bytes, Dict[str, str]]:
+    """
+    Corpo pronto para resposta (serializado e comprimido) e headers HTTP.
+    `build` produz o GeoJSON só quando não há entrada no cache; `key=None`
+    desativa o cache (ex.: recortes por polígono).
+    """
+    encoding = negotiate_encoding(accept_encoding)
+    cache_key = (key, fmt, precision, encoding) if key is not None else None
+    body = encoded_cache.get(cache_key) if cache_key is not None else None
+    if body is None:
+        body = compress(encode(build(), fmt, precision, object_name), encoding)
+        if cache_key is not None:
+            encoded_cache.put(cache_key, body)
+
+    headers = {
+        "Content-Type": MEDIA_TYPES[fmt],
+        "Vary": "Accept-Encoding",
+        "ETag": '"' + hashlib.sha1(body).hexdigest()[:20] + '"',
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return body, headers
@@ -0,0 +1,709 @@
+# backend/app/geo_processor.py - Datasets vetoriais da pasta data (sidecars GeoParquet)
+"""
+Ingestão dos GeoJSON de backend/data em sidecars binários colunares.
+
+Cada arquivo `.json`/`.geojson` da pasta data ganha um sidecar GeoParquet em
+`cache/geodata/`, com geometria em WKB, uma coluna por propriedade e colunas
+de bbox (`__xmin`, `__ymin`, `__xmax`, `__ymax`) declaradas como *covering* no
+metadado `geo`. As features são ordenadas por curva de Morton antes da escrita,
+então cada row group cobre uma região compacta e as estatísticas de bbox dos
+row groups funcionam como índice espacial: uma leitura por janela só lê do
+disco os row groups que intersectam a janela.
+
+O sidecar também guarda uma pirâmide de simplificação: versões pré-simplificadas
+das geometrias em tolerâncias crescentes (`__geometry_t1`, `__geometry_t2`, ...).
+Para coberturas poligonais válidas a simplificação usa `coverage_simplify`, que
+preserva as fronteiras compartilhadas entre setores vizinhos; nos demais casos
+cada geometria é simplificada com `preserve_topology=True`.
+
+O sidecar é reconstruído automaticamente quando o arquivo de origem muda
+(tamanho/mtime gravados nos metadados do Parquet).
+
+Uso como etapa de ingestão:  python -m app.geo_processor
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from shapely.geometry import mapping, shape
+
+try:  # lock entre processos (workers do gunicorn); indisponível no Windows
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# =========================
+# Paths
+# =========================
+# backend/app/geo_processor.py -> base_dir = backend/
+BASE_DIR = Path(__file__).resolve().parents[1]
+DATA_DIR = (BASE_DIR / "data").resolve()  # esperado: backend/data
+CACHE_DIR = Path(os.getenv("CACHE_DIR", str(BASE_DIR / "cache"))).resolve()
+SIDECAR_DIR = CACHE_DIR / "geodata"
+
+# Incrementar quando o layout do sidecar mudar (força reconstrução)
+SIDECAR_VERSION = 2
+ROW_GROUP_SIZE = 128
+# Tolerâncias (graus) dos níveis da pirâmide de simplificação; nível 0 = original
+SIMPLIFY_TOLERANCES = (0.0001, 0.0005, 0.002, 0.01)
+DATASET_SUFFIXES = (".json", ".geojson")
+
+GEOMETRY_COLUMN = "__geometry"
+BBOX_COLUMNS = ("__xmin", "__ymin", "__xmax", "__ymax")
+ROW_COLUMN = "__row"
+ID_COLUMN = "__id"
+META_KEY = b"belem:sidecar"
+
+_build_lock = threading.Lock()
+
+
+# =========================
+# Resolução de arquivos
+# =========================
+def list_datasets() -> List[str]:
+    """Nomes dos arquivos GeoJSON disponíveis na pasta data."""
+    if not DATA_DIR.exists():
+        return []
+    return sorted(p.name for p in DATA_DIR.iterdir() if p.suffix.lower() in DATASET_SUFFIXES)
+
+def dataset_path(name: str) -> Path:
+    """Resolve o arquivo de origem dentro de DATA_DIR (sem path traversal)."""
+    target = (DATA_DIR / os.path.basename(name)).resolve()
+    if not str(target).startswith(str(DATA_DIR)) or target.suffix.lower() not in DATASET_SUFFIXES:
+        raise ValueError(f"Dataset inválido: {name}")
+    if not target.exists():
+        raise FileNotFoundError(f"Dataset '{name}' não encontrado em {DATA_DIR}")
+    return target
+
+def sidecar_path(name: str) -> Path:
+    return SIDECAR_DIR / f"{os.path.basename(name)}.parquet"
+
+def _source_signature(path: Path) -> str:
+    st = path.stat()
+    return f"{st.st_size}:{st.st_mtime_ns}:{SIDECAR_VERSION}"
+
+def _read_sidecar_meta(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        kv = pq.read_metadata(path).metadata or {}
+        return json.loads(kv[META_KEY])
+    except Exception:
+        return None
+
+
+# =========================
+# Ingestão (GeoJSON -> GeoParquet)
+# =========================
+def _normalize_features(gj: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+    t = gj.get("type")
+    if t == "FeatureCollection":
+        return t, gj.get("features", [])
+    if t == "Feature":
+        return t, [gj]
+    return t or "Geometry", [{"type": "Feature", "geometry": gj, "properties": {}}]
+
+def _property_column(values: List[Any]) -> Tuple[pa.Array, bool]:
+    """Converte valores de uma propriedade em coluna Arrow (JSON como fallback)."""
+    if any(isinstance(v, (dict, list)) for v in values):
+        return pa.array([None if v is None else json.dumps(v, ensure_ascii=False) for v in values], pa.string()), True
+    try:
+        return pa.array(values), False
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], pa.string()), False
+
+def _morton_order(bounds: np.ndarray) -> np.ndarray:
+    """Ordem das features pela curva de Morton do centro da bbox (16 bits por eixo)."""
+    if len(bounds) == 0:
+        return np.arange(0)
+    cx = (bounds[:, 0] + bounds[:, 2]) / 2
+    cy = (bounds[:, 1] + bounds[:, 3]) / 2
+    cx = np.nan_to_num(cx)
+    cy = np.nan_to_num(cy)
+
+    def scale(v):
+        span = v.max() - v.min()
+        return ((v - v.min()) / span * 65535).astype(np.uint64) if span > 0 else np.zeros(len(v), np.uint64)
+
+    def spread(v):
+        v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF)
+        v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+        v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+        v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+        return v
+
+    codes = spread(scale(cx)) | (spread(scale(cy)) << np.uint64(1))
+    return np.argsort(codes, kind="stable")
+
+def level_column(level: int) -> str:
+    """Coluna WKB de um nível da pirâmide (0 = geometria original)."""
+    return GEOMETRY_COLUMN if level == 0 else f"{GEOMETRY_COLUMN}_t{level}"
+
+def _simplify_levels(geoms: np.ndarray) -> List[np.ndarray]:
+    """Geometrias simplificadas para cada tolerância de SIMPLIFY_TOLERANCES."""
+    present = geoms[~shapely.is_missing(geoms)]
+    polygonal = len(present) > 0 and all(g.geom_type in ("Polygon", "MultiPolygon") for g in present)
+    if not polygonal:
+        return []  # pontos e linhas não ganham pirâmide
+    is_coverage = not shapely.is_missing(geoms).any() and bool(shapely.coverage_is_valid(geoms))
+    levels = []
+    for tolerance in SIMPLIFY_TOLERANCES:
+        if is_coverage:
+            simplified = shapely.coverage_simplify(geoms, tolerance)
+        else:
+            simplified = shapely.simplify(geoms, tolerance, preserve_topology=True)
+        levels.append(simplified)
+    return levels
+
+def select_level(tolerances: Sequence[float], zoom: Optional[float] = None,
+                 tolerance: Optional[float] = None) -> int:
+    """
+    Nível mais grosso da pirâmide que ainda respeita a tolerância pedida.
+    Com `zoom`, a tolerância é o tamanho de um pixel (tile de 256px) em graus.
+    """
+    if tolerance is None and zoom is not None:
+        tolerance = 360.0 / (256 * 2 ** zoom)
+    if tolerance is None:
+        return 0
+    level = 0
+    for i, t in enumerate(tolerances, start=1):
+        if t <= tolerance:
+            level = i
+    return level
+
+def build_sidecar(name: str) -> Path:
+    """Converte um GeoJSON da pasta data em sidecar GeoParquet (escrita atômica)."""
+    src = dataset_path(name)
+    signature = _source_signature(src)
+
+    with src.open("r", encoding="utf-8") as f:
+        gj = json.load(f)
+    source_type, features = _normalize_features(gj)
+
+    geoms = np.array([
+        shape(feat["geometry"]) if feat.get("geometry") else None
+        for feat in features
+    ], dtype=object)
+    bounds = shapely.bounds(geoms) if len(geoms) else np.empty((0, 4))
+    order = _morton_order(bounds)
+    geoms = geoms[order]
+    bounds = bounds[order]
+    features = [features[i] for i in order]
+
+    columns: Dict[str, pa.Array] = {
+        ROW_COLUMN: pa.array(order.astype(np.int64)),
+        GEOMETRY_COLUMN: pa.array(shapely.to_wkb(geoms), pa.binary()),
+    }
+    for col, idx in zip(BBOX_COLUMNS, range(4)):
+        columns[col] = pa.array(bounds[:, idx], pa.float64())
+    pyramid = _simplify_levels(geoms)
+    for level, simplified in enumerate(pyramid, start=1):
+        columns[level_column(level)] = pa.array(shapely.to_wkb(simplified), pa.binary())
+
+    ids = [feat.get("id") for feat in features]
+    if any(i is not None for i in ids):
+        columns[ID_COLUMN], _ = _property_column(ids)
+
+    # Uma coluna por propriedade, na ordem em que aparecem
+    prop_names: List[str] = []
+    seen = set()
+    for feat in features:
+        for key in (feat.get("properties") or {}):
+            if key not in seen:
+                seen.add(key)
+                prop_names.append(key)
+    json_columns = []
+    for key in prop_names:
+        arr, is_json = _property_column([(feat.get("properties") or {}).get(key) for feat in features])
+        columns[key] = arr
+        if is_json:
+            json_columns.append(key)
+
+    table = pa.table(columns)
+    valid = bounds[~np.isnan(bounds).any(axis=1)] if len(bounds) else bounds
+    extent = [float(valid[:, 0].min()), float(valid[:, 1].min()),
+              float(valid[:, 2].max()), float(valid[:, 3].max())] if len(valid) else None
+    geo_meta = {
+        "version": "1.1.0",
+        "primary_column": GEOMETRY_COLUMN,
+        "columns": {
+            GEOMETRY_COLUMN: {
+                "encoding": "WKB",
+                "geometry_types": sorted({g.geom_type for g in geoms if g is not None}),
+                "bbox": extent,
+                "covering": {"bbox": {c[2:]: [c] for c in BBOX_COLUMNS}},
+            }
+        },
+    }
+    sidecar_meta = {
+        "source": src.name,
+        "source_signature": signature,
+        "source_type": source_type,
+        "collection_members": {k: v for k, v in gj.items() if k not in ("type", "features", "geometry", "properties")},
+        "feature_count": len(features),
+        "bbox": extent,
+        "properties": prop_names,
+        "json_columns": json_columns,
+        "simplify_tolerances": list(SIMPLIFY_TOLERANCES[:len(pyramid)]),
+    }
+    table = table.replace_schema_metadata({
+        b"geo": json.dumps(geo_meta).encode("utf-8"),
+        META_KEY: json.dumps(sidecar_meta, ensure_ascii=False).encode("utf-8"),
+    })
+
+    SIDECAR_DIR.mkdir(parents=True, exist_ok=True)
+    target = sidecar_path(name)
+    tmp = target.with_suffix(f".parquet.{os.getpid()}.tmp")
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE, compression="zstd", write_statistics=True)
+    os.replace(tmp, target)
+    print(f"🗜️ Sidecar gerado: {target.name} ({len(features)} features, {target.stat().st_size / 1024:.0f} KB)")
+    return target
+
+def ensure_sidecar(name: str) -> Path:
+    """Retorna o sidecar atualizado, reconstruindo se a origem mudou."""
+    src = dataset_path(name)
+    target = sidecar_path(name)
+    signature = _source_signature(src)
+    meta = _read_sidecar_meta(target) if target.exists() else None
+    if meta and meta.get("source_signature") == signature:
+        return target
+
+    with _build_lock:
+        SIDECAR_DIR.mkdir(parents=True, exist_ok=True)
+        with open(SIDECAR_DIR / ".build.lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Outro processo pode ter reconstruído enquanto esperávamos o lock
+                meta = _read_sidecar_meta(target) if target.exists() else None
+                if meta and meta.get("source_signature") == _source_signature(src):
+                    return target
+                return build_sidecar(name)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def build_all_sidecars() -> List[Path]:
+    """Etapa de ingestão: garante sidecars atualizados para todos os datasets."""
+    built = []
+    for name in list_datasets():
+        try:
+            built.append(ensure_sidecar(name))
+        except Exception as e:
+            print(f"⚠️ Falha ao gerar sidecar de {name}: {e}")
+    return built
+
+
+# =========================
+# Leitura
+# =========================
+def dataset_info(name: str) -> Dict[str, Any]:
+    """Metadados do dataset (tipo de origem, contagem, bbox, propriedades)."""
+    meta = _read_sidecar_meta(ensure_sidecar(name))
+    if meta is None:
+        raise RuntimeError(f"Sidecar de '{name}' sem metadados")
+    return meta
+
+def _row_groups_in_window(pf: pq.ParquetFile, bbox: Sequence[float]) -> List[int]:
+    """Row groups cujas estatísticas de bbox intersectam a janela."""
+    qxmin, qymin, qxmax, qymax = bbox
+    names = pf.schema_arrow.names
+    idx = {c: names.index(c) for c in BBOX_COLUMNS}
+    selected = []
+    for i in range(pf.metadata.num_row_groups):
+        rg = pf.metadata.row_group(i)
+        stats = {c: rg.column(idx[c]).statistics for c in BBOX_COLUMNS}
+        if any(s is None or not s.has_min_max for s in stats.values()):
+            selected.append(i)
+            continue
+        if (stats["__xmin"].min <= qxmax and stats["__xmax"].max >= qxmin
+                and stats["__ymin"].min <= qymax and stats["__ymax"].max >= qymin):
+            selected.append(i)
+    return selected
+
+def _select_columns(pf: pq.ParquetFile, columns: Optional[Sequence[str]],
+                    level: int) -> Tuple[List[str], str]:
+    """Colunas a ler (internas + geometria do nível + propriedades pedidas)."""
+    names = pf.schema_arrow.names
+    geometry_col = level_column(level)
+    if geometry_col not in names:
+        geometry_col = GEOMETRY_COLUMN
+    internal = [c for c in names if c.startswith("__") and not c.startswith(GEOMETRY_COLUMN)]
+    props = [c for c in names if not c.startswith("__")]
+    if columns is not None:
+        props = [c for c in columns if c in props]
+    return internal + [geometry_col] + props, geometry_col
+
+def _rename_geometry(table: pa.Table, geometry_col: str) -> pa.Table:
+    if geometry_col == GEOMETRY_COLUMN:
+        return table
+    return table.rename_columns([GEOMETRY_COLUMN if c == geometry_col else c for c in table.column_names])
+
+def read_table(name: str, bbox: Optional[Sequence[float]] = None,
+               columns: Optional[Sequence[str]] = None, level: int = 0) -> pa.Table:
+    """
+    Lê o sidecar, opcionalmente limitado a uma janela bbox (minx, miny, maxx, maxy)
+    e a um subconjunto de propriedades. As colunas internas sempre vêm junto;
+    `level` escolhe o nível da pirâmide que vai na coluna de geometria.
+    A tabela volta na ordem original do arquivo de origem.
+    """
+    pf = pq.ParquetFile(ensure_sidecar(name))
+    wanted, geometry_col = _select_columns(pf, columns, level)
+
+    if bbox is None:
+        table = pf.read(columns=wanted)
+    else:
+        groups = _row_groups_in_window(pf, bbox)
+        if not groups:
+            table = pf.schema_arrow.empty_table().select(wanted)
+        else:
+            table = pf.read_row_groups(groups, columns=wanted)
+        qxmin, qymin, qxmax, qymax = bbox
+        xmin, ymin, xmax, ymax = (table.column(c).to_numpy(zero_copy_only=False) for c in BBOX_COLUMNS)
+        mask = (xmin <= qxmax) & (xmax >= qxmin) & (ymin <= qymax) & (ymax >= qymin)
+        table = table.filter(pa.array(mask))
+
+    return _rename_geometry(table, geometry_col).sort_by(ROW_COLUMN)
+
+def table_geometries(table: pa.Table) -> np.ndarray:
+    """Array de geometrias shapely a partir da coluna WKB."""
+    return shapely.from_wkb(table.column(GEOMETRY_COLUMN).to_numpy(zero_copy_only=False))
+
+def table_properties(table: pa.Table, json_columns: Sequence[str] = ()) -> List[Dict[str, Any]]:
+    """Dicionários de propriedades (uma entrada por linha da tabela)."""
+    prop_cols = [c for c in table.column_names if not c.startswith("__")]
+    values = {c: table.column(c).to_pylist() for c in prop_cols}
+    for c in json_columns:
+        if c in values:
+            values[c] = [json.loads(v) if v is not None else None for v in values[c]]
+    return [{c: values[c][i] for c in prop_cols} for i in range(table.num_rows)]
+
+def table_to_features(table: pa.Table, json_columns: Sequence[str] = ()) -> List[Dict[str, Any]]:
+    """Reconstrói as features GeoJSON de uma tabela lida do sidecar."""
+    geoms = table_geometries(table)
+    props = table_properties(table, json_columns)
+    ids = table.column(ID_COLUMN).to_pylist() if ID_COLUMN in table.column_names else None
+    features = []
+    for i, (geom, p) in enumerate(zip(geoms, props)):
+        feat: Dict[str, Any] = {"type": "Feature"}
+        if ids is not None and ids[i] is not None:
+            feat["id"] = ids[i]
+        feat["geometry"] = mapping(geom) if geom is not None else None
+        feat["properties"] = p
+        features.append(feat)
+    return features
+
+def read_features(name: str, bbox: Optional[Sequence[float]] = None,
+                  columns: Optional[Sequence[str]] = None, level: int = 0) -> List[Dict[str, Any]]:
+    """Features GeoJSON do dataset, opcionalmente por janela bbox."""
+    meta = dataset_info(name)
+    table = read_table(name, bbox=bbox, columns=columns, level=level)
+    return table_to_features(table, meta.get("json_columns", []))
+
+# =========================
+# Leitura paginada (streaming)
+# =========================
+def scan_page(name: str, bbox: Optional[Sequence[float]] = None, start: int = 0,
+              limit: Optional[int] = None,
+              candidates: Optional[np.ndarray] = None) -> Tuple[np.ndarray, Optional[int]]:
+    """
+    Posições (na ordem do sidecar, que é espacial) das features candidatas a
+    partir de `start`, até `limit`, e o cursor da próxima página (ou None).
+    Só as colunas de bbox são lidas, um row group por vez. `candidates`
+    (posições ordenadas, ex.: vindas de um filtro de atributos) restringe a busca.
+    """
+    pf = pq.ParquetFile(ensure_sidecar(name))
+    offsets = np.concatenate([[0], np.cumsum([
+        pf.metadata.row_group(i).num_rows for i in range(pf.metadata.num_row_groups)
+    ])])
+    groups = _row_groups_in_window(pf, bbox) if bbox is not None else range(pf.metadata.num_row_groups)
+
+    wanted = limit + 1 if limit is not None else None  # uma a mais para saber se há próxima página
+    found: List[np.ndarray] = []
+    total = 0
+    for g in groups:
+        if offsets[g + 1] <= start:
+            continue
+        positions = np.arange(offsets[g], offsets[g + 1])
+        if candidates is not None:
+            positions = positions[np.isin(positions, candidates, assume_unique=True)]
+            if len(positions) == 0:
+                continue
+        if bbox is not None:
+            qxmin, qymin, qxmax, qymax = bbox
+            cols = pf.read_row_group(g, columns=list(BBOX_COLUMNS))
+            xmin, ymin, xmax, ymax = (cols.column(c).to_numpy(zero_copy_only=False) for c in BBOX_COLUMNS)
+            inside = (xmin <= qxmax) & (xmax >= qxmin) & (ymin <= qymax) & (ymax >= qymin)
+            positions = positions[inside[positions - offsets[g]]]
+        positions = positions[positions >= start]
+        found.append(positions)
+        total += len(positions)
+        if wanted is not None and total >= wanted:
+            break
+
+    positions = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+    if limit is not None and len(positions) > limit:
+        return positions[:limit], int(positions[limit])
+    return positions, None
+
+def iter_row_batches(name: str, positions: np.ndarray, columns: Optional[Sequence[str]] = None,
+                     level: int = 0) -> Iterator[pa.Table]:
+    """
+    Tabelas com as linhas `positions` (vindas de `scan_page`), um row group
+    por vez: a memória por requisição fica limitada a um row group.
+    """
+    pf = pq.ParquetFile(ensure_sidecar(name))
+    wanted, geometry_col = _select_columns(pf, columns, level)
+    offset = 0
+    for g in range(pf.metadata.num_row_groups):
+        size = pf.metadata.row_group(g).num_rows
+        local = positions[(positions >= offset) & (positions < offset + size)] - offset
+        offset += size
+        if len(local) == 0:
+            continue
+        table = pf.read_row_group(g, columns=wanted).take(pa.array(local))
+        yield _rename_geometry(table, geometry_col)
+
+def read_collection(name: str, level: int = 0, columns: Optional[Sequence[str]] = None,
+                    where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    GeoJSON completo a partir do sidecar, no mesmo tipo da origem
+    (FeatureCollection, Feature ou geometria). `columns` projeta as
+    propriedades; `where` filtra pelos índices de atributos (ver `select_features`).
+    """
+    meta = dataset_info(name)
+    if where:
+        features = select_features(name, where=where, fields=columns, level=level)
+    else:
+        features = read_features(name, columns=columns, level=level)
+    source_type = meta.get("source_type")
+    if source_type == "Feature":
+        return features[0] if features else {"type": "Feature", "geometry": None, "properties": {}}
+    if source_type != "FeatureCollection":
+        return features[0]["geometry"] if features else {}
+    collection: Dict[str, Any] = {"type": "FeatureCollection"}
+    collection.update(meta.get("collection_members", {}))
+    collection["features"] = features
+    return collection
+
+# =========================
+# Índices de atributos
+# =========================
+class AttributeIndex:
+    """
+    Índice de uma coluna de propriedade: valores não nulos ordenados e as
+    linhas correspondentes. Responde igualdade, `in` e intervalos com
+    busca binária, sem percorrer as geometrias.
+    """
+
+    def __init__(self, column: pa.ChunkedArray):
+        values = np.asarray(column.to_numpy(zero_copy_only=False))
+        if values.dtype == object:
+            valid = np.array([v is not None for v in values], dtype=bool)
+        elif values.dtype.kind == "f":
+            valid = ~np.isnan(values)
+        else:
+            valid = np.ones(len(values), dtype=bool)
+        keys = values[valid]
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.rows = np.nonzero(valid)[0][order]
+        self.numeric = self.keys.dtype.kind in "iuf"
+        self.boolean = self.keys.dtype.kind == "b"
+
+    def _coerce(self, value: Any) -> Any:
+        if self.boolean:
+            return value if isinstance(value, bool) else str(value).lower() in ("1", "true", "sim")
+        if self.numeric:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Valor não numérico para coluna numérica: {value!r}")
+        return str(value)
+
+    def equals(self, value: Any) -> np.ndarray:
+        key = self._coerce(value)
+        lo = np.searchsorted(self.keys, key, side="left")
+        hi = np.searchsorted(self.keys, key, side="right")
+        return self.rows[lo:hi]
+
+    def isin(self, values: Sequence[Any]) -> np.ndarray:
+        parts = [self.equals(v) for v in values]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def between(self, low: Any = None, high: Any = None) -> np.ndarray:
+        lo = np.searchsorted(self.keys, self._coerce(low), side="left") if low is not None else 0
+        hi = np.searchsorted(self.keys, self._coerce(high), side="right") if high is not None else len(self.keys)
+        return self.rows[lo:hi]
+
+def parse_where(where: Optional[Dict[str, Any]], meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Valida um filtro de atributos. Cada coluna recebe um valor (igualdade),
+    uma lista (`in`) ou um objeto {"min": ..., "max": ...} (intervalo fechado).
+    Com `meta`, confere também se as colunas existem e são indexáveis.
+    """
+    if not where:
+        return {}
+    if not isinstance(where, dict):
+        raise ValueError("Filtro deve ser um objeto {coluna: condição}")
+    if meta is not None:
+        indexable = set(meta.get("properties", [])) - set(meta.get("json_columns", []))
+        unknown = [c for c in where if c not in indexable]
+        if unknown:
+            raise ValueError(f"Propriedades inexistentes ou não filtráveis: {', '.join(unknown)}")
+    for column, cond in where.items():
+        if isinstance(cond, dict):
+            if not cond or set(cond) - {"min", "max"}:
+                raise ValueError(f"Intervalo inválido em '{column}': use as chaves min e/ou max")
+        elif cond is not None and not isinstance(cond, (str, int, float, bool, list)):
+            raise ValueError(f"Condição inválida em '{column}'")
+    return where
+
+def validate_fields(meta: Dict[str, Any], fields: Optional[Sequence[str]]) -> Optional[List[str]]:
+    """Confere a projeção de propriedades contra as colunas do dataset."""
+    if fields is None:
+        return None
+    fields = [f for f in fields if f]
+    unknown = [f for f in fields if f not in meta.get("properties", [])]
+    if unknown:
+        raise ValueError(f"Propriedades inexistentes: {', '.join(unknown)}")
+    return fields
+
+# =========================
+# Datasets em memória
+# =========================
+class GeoDataset:
+    """
+    Dataset carregado em memória a partir do sidecar, com STRtree para
+    consultas espaciais. Reaproveitado entre requisições enquanto a
+    assinatura da origem não mudar.
+    """
+
+    def __init__(self, name: str, signature: str, table: pa.Table, meta: Dict[str, Any]):
+        self.name = name
+        self.signature = signature
+        self.meta = meta
+        self.table = table
+        self.geometries = table_geometries(table)
+        self.bounds = np.column_stack([table.column(c).to_numpy(zero_copy_only=False) for c in BBOX_COLUMNS])
+        self.properties = table_properties(table, meta.get("json_columns", []))
+        self.tree = shapely.STRtree(self.geometries)
+        self.tolerances = meta.get("simplify_tolerances", [])
+        self._levels: Dict[int, np.ndarray] = {0: self.geometries}
+        json_columns = set(meta.get("json_columns", []))
+        self.indexes = {
+            c: AttributeIndex(table.column(c))
+            for c in table.column_names if not c.startswith("__") and c not in json_columns
+        }
+        # Posição de cada linha no sidecar (ordem espacial), para a paginação
+        rows = table.column(ROW_COLUMN).to_numpy()
+        self.ids = table.column(ID_COLUMN).to_pylist() if ID_COLUMN in table.column_names else None
+        self.positions = np.empty(len(rows), dtype=np.int64)
+        self.positions[pq.read_table(sidecar_path(name), columns=[ROW_COLUMN]).column(0).to_numpy()] = np.arange(len(rows))
+
+    def __len__(self) -> int:
+        return len(self.geometries)
+
+    def geometries_at(self, level: int) -> np.ndarray:
+        """Geometrias de um nível da pirâmide (carregadas sob demanda)."""
+        level = min(max(level, 0), len(self.tolerances))
+        if level not in self._levels:
+            pf = pq.ParquetFile(sidecar_path(self.name))
+            column = pf.read(columns=[ROW_COLUMN, level_column(level)]).sort_by(ROW_COLUMN)
+            self._levels[level] = shapely.from_wkb(column.column(1).to_numpy(zero_copy_only=False))
+        return self._levels[level]
+
+    def query(self, bbox: Sequence[float]) -> np.ndarray:
+        """Índices (ordem original) das features cuja bbox intersecta a janela."""
+        return np.sort(self.tree.query(shapely.box(*bbox)))
+
+    def select(self, where: Dict[str, Any]) -> np.ndarray:
+        """Índices (ordem original) das features que satisfazem todas as condições."""
+        result: Optional[np.ndarray] = None
+        for column, cond in parse_where(where).items():
+            index = self.indexes.get(column)
+            if index is None:
+                raise ValueError(f"Propriedade sem índice ou inexistente: {column}")
+            if isinstance(cond, dict):
+                rows = index.between(cond.get("min"), cond.get("max"))
+            elif isinstance(cond, list):
+                rows = index.isin(cond)
+            else:
+                rows = index.equals(cond)
+            rows = np.unique(rows)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if len(result) == 0:
+                break
+        return result if result is not None else np.arange(len(self))
+
+    def select_positions(self, where: Dict[str, Any]) -> np.ndarray:
+        """Como `select`, mas em posições do sidecar (ordenadas), para `scan_page`."""
+        return np.sort(self.positions[self.select(where)])
+
+    def features(self, idx: np.ndarray, level: int = 0,
+                 fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Features GeoJSON das linhas `idx`, com projeção opcional de propriedades."""
+        geoms = self.geometries_at(level)[idx]
+        features = []
+        for i, geom in zip(idx, geoms):
+            props = self.properties[i]
+            if fields is not None:
+                props = {f: props.get(f) for f in fields}
+            feat: Dict[str, Any] = {"type": "Feature"}
+            if self.ids is not None and self.ids[i] is not None:
+                feat["id"] = self.ids[i]
+            feat["geometry"] = mapping(geom) if geom is not None else None
+            feat["properties"] = props
+            features.append(feat)
+        return features
+
+_datasets: Dict[str, GeoDataset] = {}
+_datasets_lock = threading.Lock()
+
+def load_dataset(name: str) -> GeoDataset:
+    """Dataset em memória (cache por processo, invalidado quando a origem muda)."""
+    key = os.path.basename(name)
+    signature = _source_signature(dataset_path(key))
+    cached = _datasets.get(key)
+    if cached is not None and cached.signature == signature:
+        return cached
+    with _datasets_lock:
+        cached = _datasets.get(key)
+        if cached is not None and cached.signature == signature:
+            return cached
+        dataset = GeoDataset(key, signature, read_table(key), dataset_info(key))
+        _datasets[key] = dataset
+        print(f"📦 Dataset em memória: {key} ({len(dataset)} features)")
+        return dataset
+
+def select_features(name: str, bbox: Optional[Sequence[float]] = None, geometry: Any = None,
+                    where: Optional[Dict[str, Any]] = None, fields: Optional[Sequence[str]] = None,
+                    level: int = 0) -> List[Dict[str, Any]]:
+    """
+    Features do dataset em memória: filtro de atributos pelos índices primeiro,
+    depois janela bbox (STRtree) e, se houver `geometry`, interseção exata.
+    """
+    dataset = load_dataset(name)
+    idx = dataset.select(where) if where else np.arange(len(dataset))
+    if geometry is not None and bbox is None:
+        bbox = geometry.bounds
+    if bbox is not None and len(idx):
+        idx = np.intersect1d(idx, dataset.query(bbox), assume_unique=True)
+    if geometry is not None and len(idx):
+        idx = idx[shapely.intersects(dataset.geometries[idx], geometry)]
+    return dataset.features(idx, level=level, fields=fields)
+
+def polygon_bbox(coords: Sequence[Sequence[float]]) -> Tuple[float, float, float, float]:
+    """Bbox (minx, miny, maxx, maxy) de uma lista de pares [lng, lat]."""
+    xs = [c[0] for c in coords]
+    ys = [c[1] for c in coords]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+if __name__ == "__main__":
+    paths = build_all_sidecars()
+    print(f"✅ {len(paths)} sidecar(s) atualizados em {SIDECAR_DIR}")
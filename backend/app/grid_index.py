@@ -0,0 +1,312 @@
+# backend/app/grid_index.py - Agregação dos datasets em grade hierárquica (quadtree)
+"""
+Pré-agregação dos datasets da pasta data em uma grade quadrada hierárquica.
+
+A grade segue um quadtree em lng/lat: no nível L cada célula mede 360 / 2**L
+graus e é identificada por (ix, iy) = floor((lng + 180, lat + 90) / tamanho);
+o pai de uma célula é (ix >> 1, iy >> 1). Para cada dataset são guardados, em
+um `.npz` em `cache/grid/`, os ids das células não vazias e os valores
+agregados de cada nível (GRID_MIN_LEVEL..GRID_MAX_LEVEL):
+
+- `count`: pontos na célula; para polígonos, fração de cada feature na célula
+- `area_km2`: área de polígonos dentro da célula (só datasets poligonais)
+- atributos numéricos somáveis (ver `zonal.summable_columns`), ponderados pela
+  fração de área da feature na célula
+
+Uma consulta por polígono desce o quadtree só nas células que tocam a borda:
+células cobertas pelo polígono somam o agregado direto (O(células)); as de
+borda no nível mais fino são refinadas com as geometrias exatas (ou estimadas
+pela fração de área da célula com `exact=False`). Features grandes demais
+para a grade ficam fora dela e sempre entram pelo cálculo exato.
+
+Construção offline:  python -m app.grid_index
+"""
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import shapely
+
+from .geo_processor import CACHE_DIR, _source_signature, dataset_path, list_datasets, load_dataset
+from .zonal import degrees2_to_km2, summable_columns
+
+GRID_DIR = CACHE_DIR / "grid"
+GRID_VERSION = 1
+# Nível 8 ~ 1,4°; nível 16 ~ 0,0055° (~600 m no equador)
+GRID_MIN_LEVEL = 8
+GRID_MAX_LEVEL = 16
+# Features que cobrem mais células que isso no nível mais fino ficam fora da grade
+MAX_CELLS_PER_FEATURE = 4096
+
+_build_lock = threading.Lock()
+
+
+def cell_size(level: int) -> float:
+    return 360.0 / (2 ** level)
+
+def _cell_ids(ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+    return (ix.astype(np.int64) << 32) | iy.astype(np.int64)
+
+def _split_ids(ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return ids >> 32, ids & 0xFFFFFFFF
+
+def _cell_boxes(ids: np.ndarray, level: int) -> np.ndarray:
+    ix, iy = _split_ids(ids)
+    size = cell_size(level)
+    west, south = ix * size - 180.0, iy * size - 90.0
+    return shapely.box(west, south, west + size, south + size)
+
+def _point_cells(xy: np.ndarray, level: int) -> np.ndarray:
+    size = cell_size(level)
+    ix = np.floor((xy[:, 0] + 180.0) / size).astype(np.int64)
+    iy = np.floor((xy[:, 1] + 90.0) / size).astype(np.int64)
+    return _cell_ids(ix, iy)
+
+def _aggregate(ids: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Soma as linhas de `values` por id de célula (ids voltam ordenados)."""
+    unique, inverse = np.unique(ids, return_inverse=True)
+    out = np.zeros((len(unique), values.shape[1]))
+    np.add.at(out, inverse, values)
+    return unique, out
+
+def grid_path(name: str) -> Path:
+    return GRID_DIR / f"{os.path.basename(name)}.npz"
+
+
+# =========================
+# Construção
+# =========================
+def _is_polygonal(geoms: np.ndarray) -> bool:
+    types = {g.geom_type for g in geoms if g is not None}
+    return bool(types) and types <= {"Polygon", "MultiPolygon"}
+
+def _feature_values(dataset, idx: np.ndarray, fields: List[str]) -> np.ndarray:
+    """Matriz (features x campos) com 1 em `count` e os atributos numéricos."""
+    values = np.zeros((len(idx), len(fields)))
+    values[:, 0] = 1.0
+    for j, name in enumerate(fields):
+        if name in ("count", "area_km2"):
+            continue
+        for row, i in enumerate(idx):
+            v = dataset.properties[i].get(name)
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                values[row, j] = v
+    return values
+
+def build_grid(name: str) -> Path:
+    """Agrega o dataset na grade e grava o `.npz` (escrita atômica)."""
+    dataset = load_dataset(name)
+    geoms = dataset.geometries
+    polygonal = _is_polygonal(geoms)
+    fields = ["count"] + (["area_km2"] if polygonal else []) + summable_columns(dataset)
+    valid = np.array([g is not None and not g.is_empty for g in geoms], dtype=bool)
+    idx = np.nonzero(valid)[0]
+    base = _feature_values(dataset, idx, fields)
+    size = cell_size(GRID_MAX_LEVEL)
+
+    large: List[int] = []
+    if not polygonal:
+        # Pontos (ou linhas, pelo centróide): cada feature cai em uma célula
+        xy = shapely.get_coordinates(shapely.centroid(geoms[idx]))
+        ids, values = _aggregate(_point_cells(xy, GRID_MAX_LEVEL), base)
+    else:
+        all_ids, all_values = [], []
+        area_col = fields.index("area_km2")
+        for row, i in enumerate(idx):
+            geom = geoms[i]
+            minx, miny, maxx, maxy = geom.bounds
+            ix0, ix1 = int((minx + 180.0) // size), int((maxx + 180.0) // size)
+            iy0, iy1 = int((miny + 90.0) // size), int((maxy + 90.0) // size)
+            if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > MAX_CELLS_PER_FEATURE:
+                large.append(int(i))
+                continue
+            gx, gy = np.meshgrid(np.arange(ix0, ix1 + 1), np.arange(iy0, iy1 + 1))
+            cells = _cell_ids(gx.ravel(), gy.ravel())
+            pieces = shapely.area(shapely.intersection(_cell_boxes(cells, GRID_MAX_LEVEL), geom))
+            keep = pieces > 0
+            if not keep.any():
+                continue
+            fraction = pieces[keep] / geom.area
+            vals = np.outer(fraction, base[row])
+            _, cy = _split_ids(cells[keep])
+            vals[:, area_col] = degrees2_to_km2(pieces[keep], (cy + 0.5) * size - 90.0)
+            all_ids.append(cells[keep])
+            all_values.append(vals)
+        if all_ids:
+            ids, values = _aggregate(np.concatenate(all_ids), np.vstack(all_values))
+        else:
+            ids, values = np.empty(0, dtype=np.int64), np.zeros((0, len(fields)))
+
+    arrays: Dict[str, Any] = {
+        "version": np.array(GRID_VERSION),
+        "signature": np.array(dataset.signature),
+        "fields": np.array(fields),
+        "polygonal": np.array(polygonal),
+        "large": np.array(large, dtype=np.int64),
+    }
+    for level in range(GRID_MAX_LEVEL, GRID_MIN_LEVEL - 1, -1):
+        arrays[f"L{level}_ids"] = ids
+        arrays[f"L{level}_values"] = values
+        ix, iy = _split_ids(ids)
+        ids, values = _aggregate(_cell_ids(ix >> 1, iy >> 1), values)
+
+    GRID_DIR.mkdir(parents=True, exist_ok=True)
+    target = grid_path(name)
+    tmp = target.with_suffix(f".{os.getpid()}.tmp.npz")
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, target)
+    finest = len(arrays[f"L{GRID_MAX_LEVEL}_ids"])
+    print(f"🧮 Grade gerada: {target.name} ({finest} células no nível {GRID_MAX_LEVEL}, "
+          f"{len(large)} features fora da grade, {target.stat().st_size / 1024:.0f} KB)")
+    return target
+
+
+# =========================
+# Carga
+# =========================
+class GridIndex:
+    """Grade agregada de um dataset, carregada do `.npz`."""
+
+    def __init__(self, name: str, data):
+        self.name = name
+        self.signature = str(data["signature"])
+        self.fields = [str(f) for f in data["fields"]]
+        self.polygonal = bool(data["polygonal"])
+        self.large = data["large"]
+        self.ids = {l: data[f"L{l}_ids"] for l in range(GRID_MIN_LEVEL, GRID_MAX_LEVEL + 1)}
+        self.values = {l: data[f"L{l}_values"] for l in range(GRID_MIN_LEVEL, GRID_MAX_LEVEL + 1)}
+
+_grids: Dict[str, GridIndex] = {}
+
+def _read_grid(name: str) -> Optional[GridIndex]:
+    path = grid_path(name)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != GRID_VERSION:
+                return None
+            return GridIndex(os.path.basename(name), data)
+    except Exception:
+        return None
+
+def load_grid(name: str) -> GridIndex:
+    """Grade do dataset (cache por processo), reconstruída se a origem mudou."""
+    key = os.path.basename(name)
+    signature = _source_signature(dataset_path(key))
+    cached = _grids.get(key)
+    if cached is not None and cached.signature == signature:
+        return cached
+    with _build_lock:
+        grid = _read_grid(key)
+        if grid is None or grid.signature != signature:
+            build_grid(key)
+            grid = _read_grid(key)
+        _grids[key] = grid
+        return grid
+
+def build_all_grids() -> List[Path]:
+    """Etapa offline: grade atualizada para todos os datasets."""
+    built = []
+    for name in list_datasets():
+        try:
+            load_grid(name)
+            built.append(grid_path(name))
+        except Exception as e:
+            print(f"⚠️ Falha ao gerar grade de {name}: {e}")
+    return built
+
+
+# =========================
+# Consulta
+# =========================
+def _exact_values(dataset, grid: GridIndex, idx: np.ndarray, region) -> np.ndarray:
+    """Valores exatos das features `idx` dentro de `region` (mesmos campos da grade)."""
+    totals = np.zeros(len(grid.fields))
+    if len(idx) == 0 or region is None or region.is_empty:
+        return totals
+    geoms = dataset.geometries[idx]
+    base = _feature_values(dataset, idx, grid.fields)
+    if not grid.polygonal:
+        inside = shapely.covers(region, shapely.centroid(geoms))
+        return base[inside].sum(axis=0)
+    pieces = shapely.intersection(geoms, region)
+    piece_area = shapely.area(pieces)
+    fraction = np.divide(piece_area, shapely.area(geoms), out=np.zeros_like(piece_area),
+                         where=shapely.area(geoms) > 0)
+    values = base * fraction[:, None]
+    area_col = grid.fields.index("area_km2")
+    values[:, area_col] = degrees2_to_km2(piece_area, shapely.get_y(shapely.centroid(geoms)))
+    return values.sum(axis=0)
+
+def summarize(name: str, polygon, exact: bool = True) -> Dict[str, Any]:
+    """
+    Soma dos valores do dataset dentro do polígono (shapely, lng/lat).
+
+    Células cobertas pelo polígono entram pelo agregado do nível mais grosso
+    possível; só as células de borda do nível mais fino são refinadas com as
+    geometrias (ou por fração de área, com `exact=False`).
+    """
+    grid = load_grid(name)
+    shapely.prepare(polygon)
+    minx, miny, maxx, maxy = polygon.bounds
+    totals = np.zeros(len(grid.fields))
+    interior_cells = 0
+
+    level = GRID_MIN_LEVEL
+    ids = grid.ids[level]
+    size = cell_size(level)
+    ix, iy = _split_ids(ids)
+    in_window = ((ix + 1) * size - 180.0 >= minx) & (ix * size - 180.0 <= maxx) \
+        & ((iy + 1) * size - 90.0 >= miny) & (iy * size - 90.0 <= maxy)
+    rows = np.nonzero(in_window)[0]
+    boundary = np.empty(0, dtype=np.int64)
+
+    while len(rows):
+        boxes = _cell_boxes(grid.ids[level][rows], level)
+        covered = shapely.covers(polygon, boxes)
+        partial = ~covered & shapely.intersects(polygon, boxes)
+        totals += grid.values[level][rows[covered]].sum(axis=0)
+        interior_cells += int(covered.sum())
+        partial_ids = grid.ids[level][rows[partial]]
+        if level == GRID_MAX_LEVEL:
+            boundary = partial_ids
+            break
+        level += 1
+        cx, cy = _split_ids(grid.ids[level])
+        rows = np.nonzero(np.isin(_cell_ids(cx >> 1, cy >> 1), partial_ids))[0]
+
+    dataset = load_dataset(name) if (exact and len(boundary)) or len(grid.large) else None
+    if len(boundary):
+        if exact:
+            # Features com parte nas células de borda, recortadas por (borda ∩ polígono)
+            region = shapely.intersection(shapely.union_all(_cell_boxes(boundary, GRID_MAX_LEVEL)), polygon)
+            candidates = dataset.query(region.bounds) if not region.is_empty else np.empty(0, dtype=np.int64)
+            candidates = candidates[~np.isin(candidates, grid.large)]
+            if not grid.polygonal and len(candidates):
+                # Ponto pertence a uma única célula: evita contar duas vezes na divisa
+                xy = shapely.get_coordinates(shapely.centroid(dataset.geometries[candidates]))
+                candidates = candidates[np.isin(_point_cells(xy, GRID_MAX_LEVEL), boundary)]
+            totals += _exact_values(dataset, grid, candidates, polygon if not grid.polygonal else region)
+        else:
+            rows = np.searchsorted(grid.ids[GRID_MAX_LEVEL], boundary)
+            boxes = _cell_boxes(boundary, GRID_MAX_LEVEL)
+            share = shapely.area(shapely.intersection(boxes, polygon)) / shapely.area(boxes)
+            totals += (grid.values[GRID_MAX_LEVEL][rows] * share[:, None]).sum(axis=0)
+    if len(grid.large):
+        totals += _exact_values(dataset, grid, grid.large, polygon)
+
+    return {
+        "dataset": grid.name,
+        "values": {f: round(float(v), 4) for f, v in zip(grid.fields, totals)},
+        "interior_cells": interior_cells,
+        "boundary_cells": int(len(boundary)),
+        "exact": exact,
+    }
+
+
+if __name__ == "__main__":
+    paths = build_all_grids()
+    print(f"✅ {len(paths)} grade(s) atualizadas em {GRID_DIR}")
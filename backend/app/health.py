@@ -0,0 +1,165 @@
+# backend/app/health.py - Verificação de saúde em segundo plano (GEE + LLM)
+"""
+Prober de saúde que roda em uma thread de fundo.
+
+O endpoint /health não deve chamar o Earth Engine a cada requisição: os health
+checks da plataforma rodam a cada poucos segundos e, se o GEE estiver lento,
+o próprio check estoura o timeout e a plataforma reinicia workers saudáveis.
+Aqui cada serviço é sondado em intervalo fixo e o resultado fica em memória;
+os endpoints apenas leem esse estado.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+# Intervalo entre sondagens e tempo máximo de cada sondagem (segundos)
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "30"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "10"))
+# Após quanto tempo sem sondagem bem-sucedida o estado é considerado velho
+HEALTH_STALE_AFTER = float(os.getenv("HEALTH_STALE_AFTER", str(HEALTH_PROBE_INTERVAL * 3)))
+
+
+class HealthProber:
+    """
+    Mantém o último estado conhecido de cada serviço externo.
+
+    Cada probe é uma função sem argumentos que levanta exceção em caso de falha.
+    Probes marcados como `required` definem a prontidão (readiness) do worker;
+    os demais apenas aparecem como degradados.
+    """
+
+    def __init__(self, interval: float = HEALTH_PROBE_INTERVAL, timeout: float = HEALTH_PROBE_TIMEOUT,
+                 stale_after: float = HEALTH_STALE_AFTER):
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.started_at = time.time()
+        self._probes: Dict[str, Dict[str, Any]] = {}
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # Thread da última sondagem de cada probe (para não empilhar probes travados)
+        self._workers: Dict[str, threading.Thread] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, probe: Callable[[], Any], required: bool = True) -> None:
+        """Registra um probe. O estado inicial é 'unknown' até a primeira sondagem."""
+        self._probes[name] = {"probe": probe, "required": required}
+        with self._lock:
+            self._state[name] = {
+                "status": "unknown",
+                "required": required,
+                "last_checked": None,
+                "last_ok": None,
+                "latency_ms": None,
+                "error": None,
+            }
+
+    def _run_probe(self, name: str) -> None:
+        probe = self._probes[name]["probe"]
+        outcome: Dict[str, Any] = {}
+
+        # A sondagem anterior ainda não voltou: não dispara outra thread, o
+        # serviço continua em timeout até ela terminar
+        previous = self._workers.get(name)
+        if previous is not None and previous.is_alive():
+            with self._lock:
+                state = self._state[name]
+                state["last_checked"] = time.time()
+                state["status"] = "timeout"
+                state["latency_ms"] = None
+                state["error"] = "Sondagem anterior ainda sem resposta"
+            return
+
+        def target():
+            try:
+                probe()
+                outcome["ok"] = True
+            except Exception as e:
+                outcome["error"] = str(e)
+
+        started = time.time()
+        # Thread própria por sondagem: um probe travado não bloqueia os outros
+        worker = threading.Thread(target=target, name=f"health-probe-{name}", daemon=True)
+        self._workers[name] = worker
+        worker.start()
+        worker.join(self.timeout)
+        finished = time.time()
+
+        with self._lock:
+            state = self._state[name]
+            state["last_checked"] = finished
+            if worker.is_alive():
+                state["status"] = "timeout"
+                state["latency_ms"] = None
+                state["error"] = f"Sem resposta em {self.timeout:.0f}s"
+            elif outcome.get("ok"):
+                state["status"] = "ok"
+                state["latency_ms"] = round((finished - started) * 1000, 1)
+                state["last_ok"] = finished
+                state["error"] = None
+            else:
+                state["status"] = "error"
+                state["latency_ms"] = round((finished - started) * 1000, 1)
+                state["error"] = outcome.get("error")
+
+    def probe_all(self) -> None:
+        """Executa uma rodada de sondagens (usado pela thread e pelo startup)."""
+        for name in list(self._probes):
+            self._run_probe(name)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.probe_all()
+            except Exception as e:
+                print(f"⚠️ Erro no prober de saúde: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="health-prober", daemon=True)
+        self._thread.start()
+        print(f"🩺 Prober de saúde iniciado (intervalo {self.interval:.0f}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Estado atual de cada serviço, com idade da última sondagem."""
+        now = time.time()
+        services = {}
+        with self._lock:
+            for name, state in self._state.items():
+                last_checked = state["last_checked"]
+                age = now - last_checked if last_checked else None
+                services[name] = {
+                    "status": state["status"],
+                    "required": state["required"],
+                    "latency_ms": state["latency_ms"],
+                    "error": state["error"],
+                    "last_checked": datetime.fromtimestamp(last_checked).isoformat() if last_checked else None,
+                    "last_ok": datetime.fromtimestamp(state["last_ok"]).isoformat() if state["last_ok"] else None,
+                    "age_seconds": round(age, 1) if age is not None else None,
+                    "stale": age is None or age > self.stale_after,
+                }
+        return services
+
+    def is_ready(self, services: Optional[Dict[str, Dict[str, Any]]] = None) -> bool:
+        """Pronto quando todo serviço obrigatório respondeu ok e o estado não está velho."""
+        services = services if services is not None else self.snapshot()
+        return all(
+            s["status"] == "ok" and not s["stale"]
+            for s in services.values() if s["required"]
+        )
+
+    def is_alive(self) -> bool:
+        """A thread de sondagem continua rodando (ou nunca foi iniciada)."""
+        return self._thread is None or self._thread.is_alive()
+
+
+health_prober = HealthProber()
@@ -1,19 +1,23 @@
 # backend/app/main.py - GEE + Agente + GeoJSON (pasta data)
 from __future__ import annotations
 
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Tuple
 import os
 import json
+import time
 import base64
+import threading
 from datetime import datetime, timedelta
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-import geojson
 import ee
+import pyarrow as pa
+import shapely
 from shapely.geometry import shape, Polygon, MultiPolygon
 
 # Carrega variáveis do backend/.env para testes locais
@@ -21,6 +25,7 @@ load_dotenv()
 
 # Rotas do agente
 from .agent_routes import router as agent_router
+from .health import health_prober
 
 # =========================
 # Autenticação Google Earth Engine (robusta)
@@ -70,9 +75,12 @@ except Exception as e:
 # =========================
 # Paths - pasta data (GeoJSON)
 # =========================
-# backend/app/main.py -> base_dir = backend/
-BASE_DIR = Path(__file__).resolve().parents[1]
-DATA_DIR = (BASE_DIR / "data").resolve()  # esperado: backend/data
+# DATA_DIR (backend/data) e os sidecars GeoParquet ficam em geo_processor
+from . import (
+    ee_executor, fast_json, geo_formats, geo_processor, grid_index, rate_limit, result_store, services,
+    stac_catalog, tile_proxy, timelapse_video, vector_tiles, warmup, zonal,
+)
+from .geo_processor import DATA_DIR
 
 # =========================
 # FastAPI app e CORS
@@ -129,6 +137,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],  # Cursor das camadas em streaming e espera após 429
 )
 
 # Rotas do agente
@@ -156,6 +165,7 @@ class LayerResult(BaseModel):
     date: str
     layer_type: str
     tile_url: str
+    stale: bool = False  # Resultado guardado, servido com o Earth Engine indisponível
 
 class ImageListItem(BaseModel):
     date: str
@@ -175,6 +185,7 @@ class AnalysisDataResponse(BaseModel):
     stats: Dict[str, Optional[float]]
     period: Dict[str, str]
     satellite_source: str
+    stale: bool = False  # Resultado guardado, servido com o Earth Engine indisponível
 
 class DEMRequest(BaseModel):
     polygon: List[Coordinate]
@@ -198,34 +209,52 @@ class GeoJSONLoadResponse(BaseModel):
 class GeoJSONLayerRequest(BaseModel):
     filename: str  # Nome do arquivo GeoJSON
     polygon: Optional[List[Coordinate]] = None  # Polígono para recorte (opcional)
+    zoom: Optional[float] = Field(default=None, ge=0, le=24)  # Zoom do mapa -> nível da pirâmide
+    tolerance: Optional[float] = Field(default=None, ge=0)  # Tolerância de simplificação (graus)
+    format: str = Field(default="geojson", pattern=geo_formats.FORMAT_PATTERN)  # geojson, topojson, geobuf
+    precision: Optional[int] = Field(default=None, ge=0, le=15)  # Casas decimais das coordenadas
+    stream: Optional[str] = Field(default=None, pattern="^(ndjson|geojson)$")  # Entrega em streaming
+    limit: Optional[int] = Field(default=None, ge=1, le=50000)  # Features por página
+    cursor: Optional[str] = None  # Cursor retornado pela página anterior
+    fields: Optional[List[str]] = None  # Propriedades a devolver (projeção)
+    where: Optional[Dict[str, Any]] = None  # {coluna: valor | [valores] | {"min", "max"}}
 
 class AnalyzeAreaRequest(BaseModel):
     polygon: List[List[float]]  # [[lng, lat], ...]
     area_km2: float
 
 class AnalyzeAreaResponse(BaseModel):
+    # Indicadores do EE ficam None quando a etapa foi pulada pelo prazo (ver `skipped`)
     # Temperaturas
-    avg_annual_temperature: float  # Temperatura média anual
-    extreme_heat_days: int  # Dias com calor extremo (>35°C)
-    heat_island_risk: str  # LOW, MEDIUM, HIGH, CRITICAL - Risco de ilha de calor
+    avg_annual_temperature: Optional[float] = None  # Temperatura média anual
+    extreme_heat_days: Optional[int] = None  # Dias com calor extremo (>35°C)
+    heat_island_risk: Optional[str] = None  # LOW, MEDIUM, HIGH, CRITICAL - Risco de ilha de calor
     
     # Vegetação e ambiente
-    vegetation_density: float  # NDVI em %
-    vegetation_loss_risk: str  # Risco de perda de vegetação
+    vegetation_density: Optional[float] = None  # NDVI em %
+    vegetation_loss_risk: Optional[str] = None  # Risco de perda de vegetação
     
     # Riscos ambientais
     environmental_risk: str  # LOW, MEDIUM, HIGH, CRITICAL - Risco ambiental geral
-    flood_risk: str  # Risco de inundação
-    drought_risk: str  # Risco de seca
+    flood_risk: Optional[str] = None  # Risco de inundação
+    drought_risk: Optional[str] = None  # Risco de seca
     
     # Social
     favela_count: int = 0  # Número de aglomerados subnormais na área
     favela_population: int = 0  # População estimada em aglomerados
     social_vulnerability: str = "LOW"  # Vulnerabilidade social
+    census_sector_count: int = 0  # Setores censitários (FCU) que tocam a área
+    census_area_km2: float = 0.0  # Área dos setores dentro do polígono
+    census_coverage: float = 0.0  # Fração do polígono coberta por setores (0-1)
+    # Atributos numéricos ponderados por área; None quando o dataset não tem colunas numéricas
+    census_weighted: Optional[Dict[str, float]] = None
     
     # Análise IA
     ai_summary: str
     recommendations: List[str]
+    stale: bool = False  # Resultado guardado, servido com o Earth Engine indisponível
+    partial: bool = False  # Prazo da requisição esgotou antes de todas as etapas
+    skipped: List[str] = []  # Etapas não calculadas
 
 # =========================
 # Utils
@@ -242,40 +271,19 @@ def count_favelas_in_polygon(polygon_coords: List[List[float]]) -> Dict[str, Any
         
         analysis_polygon = Polygon(polygon_coords)
         
-        # Carregar arquivo FCUs_BR.json (favelas do Brasil)
-        fcus_path = DATA_DIR / "FCUs_BR.json"
-        if not fcus_path.exists():
-            return {"count": 0, "population": 0, "areas": []}
-        
-        with fcus_path.open("r", encoding="utf-8") as f:
-            fcus_data = json.load(f)
-        
-        count = 0
-        population = 0
-        areas = []
-        
-        for feature in fcus_data.get("features", []):
-            try:
-                geom = shape(feature.get("geometry", {}))
-                props = feature.get("properties", {})
-                
-                # Verificar se a geometria intersecta com a área de análise
-                if analysis_polygon.intersects(geom):
-                    count += 1
-                    # Tentar extrair população das propriedades
-                    pop = props.get("pop", props.get("population", props.get("POP", 0)))
-                    if pop and isinstance(pop, (int, float)):
-                        population += int(pop)
-                    areas.append({
-                        "name": props.get("nome", props.get("NOME", f"Área {count}"))
-                    })
-            except Exception:
-                continue
+        # FCUs_BR.json (favelas do Brasil) pela grade pré-agregada: células internas
+        # somam direto e só as células da borda consultam os pontos
+        try:
+            summary = grid_index.summarize("FCUs_BR.json", analysis_polygon)
+        except FileNotFoundError:
+            return {"count": 0, "population": 0}
         
-        return {"count": count, "population": population, "areas": areas}
+        values = summary["values"]
+        population = next((values[k] for k in ("pop", "population", "POP") if k in values), 0)
+        return {"count": int(round(values.get("count", 0))), "population": int(population)}
     except Exception as e:
         print(f"Erro ao contar favelas: {e}")
-        return {"count": 0, "population": 0, "areas": []}
+        return {"count": 0, "population": 0}
 
 def coords_to_ee_geometry(coords: List[Coordinate]) -> ee.Geometry:
     """Converte lista de coordenadas lat/lng para ee.Geometry.Polygon"""
@@ -351,6 +359,18 @@ def geojson_to_ee_geometry(gj: Dict[str, Any]) -> ee.Geometry:
         return ee.Geometry.MultiLineString(coords)
     raise ValueError(f"Tipo de geometria não suportado: {t}")
 
+def _base_url(http_request: Optional[Request]) -> str:
+    """Base da API para URLs absolutas (vazia fora de uma requisição, ex.: warmup)."""
+    return str(http_request.base_url) if http_request is not None else ""
+
+def _refresh(endpoint_fn: Callable[..., Any], *args: Any) -> Callable[[str], Any]:
+    """
+    Callback de revalidação para result_store.get_result: recalcula o endpoint
+    no pool batch, ignorando o cache, enquanto a resposta vencida já foi servida.
+    """
+    fn = result_store.bypassing(endpoint_fn.__wrapped__)
+    return lambda cache_key: ee_executor.revalidate(cache_key, fn, *args)
+
 # =========================
 # Endpoints
 # =========================
@@ -369,14 +389,24 @@ def read_root():
             "dem": "/api/get_dem",
             "geojson_list": "/api/geojson/list",
             "geojson_load": "/api/geojson/load?name=arquivo.geojson",
+            "geojson_tiles": "/api/geojson/tiles/{name}/{z}/{x}/{y}.pbf",
+            "batch_analysis": "/api/batch_analysis",
+            "timelapse_video": "/api/timelapse/video/{arquivo}",
+            "stac_search": "/api/planetary_computer/search",
+            "raster_tiles": "/api/tiles/{layer_key}/{z}/{x}/{y}.png",
+            "warmup_status": "/api/warmup/status",
             "agent_health": "/api/agent/health",
+            "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
             "docs": "/docs"
         }
     }
 
 
 @app.post("/api/list_images", response_model=ImageListResponse)
-async def list_images(request: LayerRequest):
+@ee_executor.endpoint(ee_executor.INTERACTIVE)
+def list_images(request: LayerRequest):
     """
     Lista todas as imagens disponíveis para uma camada específica.
     Retorna até 50 imagens ordenadas da mais recente para a mais antiga.
@@ -397,6 +427,13 @@ async def list_images(request: LayerRequest):
             start_date = request.start_date
         
         print(f"🔍 Listando imagens para layer_type={request.layer_type}, start={start_date}, end={end_date}")
+
+        coords = [[p.lng, p.lat] for p in request.polygon]
+        store_params = {"layer_type": request.layer_type, "cloud_percentage": request.cloud_percentage}
+        cached = result_store.get_result("list_images", coords, start_date, end_date, store_params,
+                                         refresh=_refresh(list_images, request))
+        if cached is not None:
+            return ImageListResponse(**cached)
         
         collection = None
         
@@ -507,7 +544,9 @@ async def list_images(request: LayerRequest):
         
         print(f"✅ Encontradas {len(image_list)} imagens (total no período: {total_found})")
         
-        return ImageListResponse(images=image_list, total_found=total_found)
+        response = ImageListResponse(images=image_list, total_found=total_found)
+        result_store.save_result("list_images", coords, start_date, end_date, response.dict(), store_params)
+        return response
         
     except HTTPException:
         raise
@@ -519,11 +558,33 @@ async def list_images(request: LayerRequest):
         raise HTTPException(status_code=500, detail=f"Erro ao listar imagens: {e}")
 
 
+def _tile_store_params(request: LayerRequest) -> Dict[str, Any]:
+    return {"layer_type": request.layer_type, "cloud_percentage": request.cloud_percentage,
+            "specific_date": request.specific_date}
+
+def _layer_result(cached: Dict[str, Any], http_request: Optional[Request], stale: bool = False) -> LayerResult:
+    """
+    LayerResult a partir do que foi guardado. Só a layer_key é guardada; a URL
+    é montada com a base de cada requisição (warmup não tem base, e o host/esquema
+    de quem pediu primeiro não serve para os outros). Registros antigos guardavam a URL.
+    """
+    key = cached.get("layer_key") or tile_proxy.key_from_url(cached["tile_url"])
+    return LayerResult(date=cached["date"], layer_type=cached["layer_type"],
+                       tile_url=tile_proxy.proxy_url(key, _base_url(http_request)), stale=stale)
+
+def _stale_tile(request: LayerRequest, http_request: Request = None) -> Optional[LayerResult]:
+    """Última camada gerada para a mesma área e parâmetros (tiles já em disco continuam servidos)."""
+    coords = [[p.lng, p.lat] for p in request.polygon]
+    cached = result_store.stale_result("get_tile", coords, _tile_store_params(request))
+    return _layer_result(cached, http_request, stale=True) if cached is not None else None
+
 @app.post("/api/get_tile", response_model=LayerResult)
-async def get_tile(request: LayerRequest):
+@ee_executor.endpoint(ee_executor.INTERACTIVE, fallback=_stale_tile)
+def get_tile(request: LayerRequest, http_request: Request = None):
     """
     Gera um tile de mapa para uma camada específica (ex: NDVI, LST)
-    recortado pela geometria do polígono.
+    recortado pela geometria do polígono. A URL devolvida aponta para o
+    proxy /api/tiles (não expira junto com o map ID do EE).
     """
     try:
         geometry = coords_to_ee_geometry(request.polygon)
@@ -548,6 +609,13 @@ async def get_tile(request: LayerRequest):
             print(f"🔍 Processando layer_type={request.layer_type} para data específica={request.specific_date}")
         else:
             print(f"🔍 Processando layer_type={request.layer_type}, start={start_date}, end={end_date}")
+
+        # Camada já gerada para a mesma área (vencida: servida e renovada em segundo plano)
+        coords = [[p.lng, p.lat] for p in request.polygon]
+        cached = result_store.get_result("get_tile", coords, start_date, end_date, _tile_store_params(request),
+                                         refresh=_refresh(get_tile, request))
+        if cached is not None:
+            return _layer_result(cached, http_request)
         
         image = None
         vis_params = {}
@@ -882,16 +950,18 @@ async def get_tile(request: LayerRequest):
         if vis_params:
             # Para camadas com uma banda (LST, UHI, UTFVI, índices), usar getMapId com vis_params
             if request.layer_type in ["LST", "UHI", "UTFVI", "NDVI", "NDWI"]:
-                map_id = image.getMapId(vis_params)
+                layer_key = tile_proxy.register_layer(image, vis_params)
             else:
-                map_id = image.visualize(**vis_params).getMapId()
+                layer_key = tile_proxy.register_layer(image.visualize(**vis_params))
         else:
-            map_id = image.getMapId()
-        tile_url = map_id["tile_fetcher"].url_format
+            layer_key = tile_proxy.register_layer(image)
         
         print(f"✅ Sucesso: {request.layer_type} gerado com data {date_str}")
 
-        return LayerResult(date=date_str, layer_type=request.layer_type, tile_url=tile_url)
+        # Guarda só a chave da camada; a URL depende da base de cada requisição
+        stored = {"date": date_str, "layer_type": request.layer_type, "layer_key": layer_key}
+        result_store.save_result("get_tile", coords, start_date, end_date, stored, _tile_store_params(request))
+        return _layer_result(stored, http_request)
     except HTTPException:
         raise
     except Exception as e:
@@ -906,12 +976,24 @@ async def get_tile(request: LayerRequest):
         raise HTTPException(status_code=500, detail=f"Erro ao buscar camada: {e}")
 
 
+def _stale_analysis_data(request: AnalysisDataRequest) -> Optional[AnalysisDataResponse]:
+    coords = [[p.lng, p.lat] for p in request.polygon]
+    cached = result_store.stale_result("get_analysis_data", coords, None, request.start_date, request.end_date)
+    return AnalysisDataResponse(**{**cached, "stale": True}) if cached is not None else None
+
 @app.post("/api/get_analysis_data", response_model=AnalysisDataResponse)
-async def get_analysis_data(request: AnalysisDataRequest):
+@ee_executor.endpoint(ee_executor.BATCH, fallback=_stale_analysis_data)
+def get_analysis_data(request: AnalysisDataRequest):
     """
     Extrai dados numéricos (NDVI, NDWI, LST) para a IA.
+    Resultados de janelas já fechadas ficam guardados no SQLite.
     """
     try:
+        coords = [[p.lng, p.lat] for p in request.polygon]
+        cached = result_store.get_result("get_analysis_data", coords, request.start_date, request.end_date)
+        if cached is not None:
+            return AnalysisDataResponse(**cached)
+        
         geometry = coords_to_ee_geometry(request.polygon)
         
         # Usar Sentinel-2 como base para índices
@@ -953,7 +1035,7 @@ async def get_analysis_data(request: AnalysisDataRequest):
             maxPixels=1e9
         ).getInfo()
 
-        return AnalysisDataResponse(
+        response = AnalysisDataResponse(
             stats={
                 "ndvi_mean": stats.get('ndvi'),
                 "ndwi_mean": stats.get('ndwi'),
@@ -962,12 +1044,15 @@ async def get_analysis_data(request: AnalysisDataRequest):
             period={"start": request.start_date, "end": request.end_date},
             satellite_source="Sentinel-2 (Índices) e Landsat-8 (LST)"
         )
+        result_store.save_result("get_analysis_data", coords, request.start_date, request.end_date, response.dict())
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao extrair dados para análise: {e}")
 
 
 @app.post("/api/get_dem", response_model=DEMResult)
-async def get_dem(request: DEMRequest):
+@ee_executor.endpoint(ee_executor.INTERACTIVE)
+def get_dem(request: DEMRequest, http_request: Request = None):
     """Gera um tile de mapa para o Modelo Digital de Elevação (DEM)."""
     try:
         geometry = coords_to_ee_geometry(request.polygon)
@@ -990,13 +1075,162 @@ async def get_dem(request: DEMRequest):
             "palette": ["blue", "green", "yellow", "red"],
         }
 
-        map_id = dem.visualize(**vis_params).getMapId()
-        tile_url = map_id["tile_fetcher"].url_format
+        layer_key = tile_proxy.register_layer(dem.visualize(**vis_params))
+        tile_url = tile_proxy.proxy_url(layer_key, _base_url(http_request))
 
         return DEMResult(tileUrl=tile_url, min_elevation=min_elev, max_elevation=max_elev)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter DEM: {e}")
 
+# =========================
+# Análise em lote (reduceRegions)
+# =========================
+BATCH_INDICATORS = ("ndvi", "ndwi", "lst", "elevation")
+MAX_BATCH_FEATURES = 5000
+
+class BatchAnalysisRequest(BaseModel):
+    start_date: str
+    end_date: str
+    feature_collection: Optional[Dict[str, Any]] = None  # FeatureCollection GeoJSON
+    dataset: Optional[str] = None  # Ou um dataset da pasta data...
+    where: Optional[Dict[str, Any]] = None  # ...filtrado por atributos
+    polygon: Optional[List[Coordinate]] = None  # ...e/ou por polígono
+    id_property: Optional[str] = None  # Propriedade usada como id de cada linha
+    fields: Optional[List[str]] = None  # Propriedades copiadas para a tabela
+    indicators: List[str] = Field(default=list(BATCH_INDICATORS))
+    scale: int = Field(default=30, ge=10, le=1000)
+    cloud_percentage: int = Field(default=20, ge=0, le=100)
+
+class BatchAnalysisResponse(BaseModel):
+    rows: List[Dict[str, Any]]
+    total_features: int
+    period: Dict[str, str]
+    ee_calls: int
+
+def _batch_features(req: BatchAnalysisRequest) -> List[Dict[str, Any]]:
+    """Features do lote: FeatureCollection enviada ou dataset filtrado (geometria simplificada)."""
+    if req.feature_collection is not None:
+        if req.feature_collection.get("type") != "FeatureCollection":
+            raise HTTPException(status_code=400, detail="feature_collection deve ser uma FeatureCollection")
+        return [f for f in req.feature_collection.get("features", []) if f.get("geometry")]
+    if not req.dataset:
+        raise HTTPException(status_code=400, detail="Informe feature_collection ou dataset")
+    try:
+        meta = geo_processor.dataset_info(req.dataset)
+        where = geo_processor.parse_where(req.where, meta)
+        fields = geo_processor.validate_fields(meta, req.fields)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Dataset '{req.dataset}' não encontrado")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Filtro inválido: {e}")
+    geometry = Polygon([[p.lng, p.lat] for p in req.polygon]) if req.polygon else None
+    # Nível 1 da pirâmide (~10 m): bem abaixo do pixel, e o payload para o EE encolhe
+    level = 1 if meta.get("simplify_tolerances") else 0
+    return geo_processor.select_features(req.dataset, geometry=geometry, where=where, fields=fields, level=level)
+
+@app.post("/api/batch_analysis", response_model=BatchAnalysisResponse, dependencies=[Depends(rate_limit.charge("batch_analysis"))])
+@ee_executor.endpoint(ee_executor.BATCH)
+def batch_analysis(req: BatchAnalysisRequest):
+    """
+    Indicadores (NDVI, NDWI, LST, elevação) para todas as features de uma
+    FeatureCollection ou de um dataset da pasta data filtrado.
+    Cada composição (Sentinel-2, Landsat, SRTM) é montada uma vez e reduzida
+    sobre todas as features com um único reduceRegions, e as tabelas voltam
+    num só getInfo: um município inteiro custa uma chamada ao EE em vez de uma
+    cadeia por polígono.
+    """
+    indicators = [i for i in req.indicators if i in BATCH_INDICATORS]
+    if not indicators:
+        raise HTTPException(status_code=400, detail=f"Indicadores válidos: {', '.join(BATCH_INDICATORS)}")
+    
+    features = _batch_features(req)
+    if not features:
+        return BatchAnalysisResponse(rows=[], total_features=0,
+                                     period={"start": req.start_date, "end": req.end_date}, ee_calls=0)
+    if len(features) > MAX_BATCH_FEATURES:
+        raise HTTPException(status_code=400, detail=f"Lote com {len(features)} features; máximo {MAX_BATCH_FEATURES}")
+    
+    try:
+        # Só geometria + índice vão para o EE; as propriedades são juntadas aqui
+        fc = ee.FeatureCollection([
+            ee.Feature(ee.Geometry(f["geometry"]), {"row": i}) for i, f in enumerate(features)
+        ])
+        bounds = fc.geometry().bounds()
+        
+        composites = []
+        if "ndvi" in indicators or "ndwi" in indicators:
+            s2 = (
+                ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
+                .filterBounds(bounds)
+                .filterDate(req.start_date, req.end_date)
+                .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", req.cloud_percentage))
+                .median()
+            )
+            bands, outputs = [], []
+            if "ndvi" in indicators:
+                bands.append(s2.normalizedDifference(["B8", "B4"]))
+                outputs.append("ndvi_mean")
+            if "ndwi" in indicators:
+                bands.append(s2.normalizedDifference(["B3", "B8"]))
+                outputs.append("ndwi_mean")
+            # forEach nomeia uma saída por banda; com uma banda só, o mean sairia como "mean"
+            composites.append(("sentinel2", ee.Image.cat(bands).rename(outputs),
+                               ee.Reducer.mean().forEach(outputs), req.scale))
+        if "lst" in indicators:
+            landsat = (
+                ee.ImageCollection("LANDSAT/LC08/C02/T1_L2")
+                .filterBounds(bounds)
+                .filterDate(req.start_date, req.end_date)
+                .filter(ee.Filter.lt("CLOUD_COVER", req.cloud_percentage))
+                .median()
+            )
+            lst = landsat.select("ST_B10").multiply(0.00341802).add(149.0).subtract(273.15)
+            composites.append(("landsat", lst, ee.Reducer.mean().setOutputs(["lst_mean_celsius"]), max(req.scale, 30)))
+        if "elevation" in indicators:
+            dem = ee.Image("USGS/SRTMGL1_003")
+            reducer = ee.Reducer.mean().combine(ee.Reducer.minMax(), sharedInputs=True) \
+                .setOutputs(["elevation_mean", "elevation_min", "elevation_max"])
+            composites.append(("srtm", dem, reducer, max(req.scale, 30)))
+        
+        # Um único getInfo para todas as composições: o EE as avalia em paralelo
+        # no servidor, e a chamada fica no worker batch desta requisição
+        # (orçamento, cancelamento e prazo valem para ela)
+        tables = ee.Dictionary({
+            name: image.reduceRegions(collection=fc, reducer=reducer, scale=scale, tileScale=4)
+                       .select(propertySelectors=[".*"], retainGeometry=False)
+            for name, image, reducer, scale in composites
+        }).getInfo()
+        results = []
+        for name, table in tables.items():
+            print(f"🧮 reduceRegions {name}: {len(table.get('features', []))} features")
+            results.append([f.get("properties", {}) for f in table.get("features", [])])
+        
+        rows: List[Dict[str, Any]] = []
+        for i, f in enumerate(features):
+            props = f.get("properties") or {}
+            row: Dict[str, Any] = {"id": props.get(req.id_property) if req.id_property else f.get("id", i)}
+            if req.fields is not None:
+                row.update({k: props.get(k) for k in req.fields})
+            rows.append(row)
+        for table in results:
+            for props in table:
+                i = props.pop("row", None)
+                if i is not None and 0 <= int(i) < len(rows):
+                    rows[int(i)].update(props)
+        
+        return BatchAnalysisResponse(
+            rows=rows,
+            total_features=len(rows),
+            period={"start": req.start_date, "end": req.end_date},
+            ee_calls=1,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Erro na análise em lote: {e}")
+
 # =========================
 # GeoJSON (pasta data)
 # =========================
@@ -1008,7 +1242,24 @@ async def list_geojson_files():
     return GeoJSONListResponse(files=files)
 
 @app.get("/api/geojson/load", response_model=GeoJSONLoadResponse)
-async def load_geojson_file(name: str = Query(..., description="Nome do arquivo .geojson na pasta data")):
+def load_geojson_file(
+    name: str = Query(..., description="Nome do arquivo .geojson na pasta data"),
+    zoom: Optional[float] = Query(None, ge=0, le=24, description="Zoom do mapa; escolhe o nível de simplificação"),
+    tolerance: Optional[float] = Query(None, ge=0, description="Tolerância de simplificação em graus"),
+    format: str = Query("geojson", pattern=geo_formats.FORMAT_PATTERN, description="geojson, topojson ou geobuf"),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="Casas decimais das coordenadas"),
+    fields: Optional[str] = Query(None, description="Propriedades a devolver, separadas por vírgula"),
+    where: Optional[str] = Query(None, description='Filtro JSON, ex.: {"NM_MUN": "Belém", "pop": {"min": 100}}'),
+    accept_encoding: Optional[str] = Header(None),
+):
+    """
+    Carrega um GeoJSON da pasta data. Com `format=topojson|geobuf` a resposta é
+    o próprio dataset codificado (sem o envelope GeoJSONLoadResponse); com
+    `precision`, o `raw` volta com coordenadas arredondadas. Respostas compactas
+    são comprimidas (br/gzip) e ficam em cache por dataset/formato/precisão.
+    `fields` projeta as propriedades e `where` filtra por atributos
+    (igualdade, lista ou intervalo {"min", "max"}) usando os índices do dataset.
+    """
     try:
         if not name.lower().endswith(".geojson"):
             raise HTTPException(status_code=400, detail="Informe um arquivo .geojson")
@@ -1020,43 +1271,144 @@ async def load_geojson_file(name: str = Query(..., description="Nome do arquivo
         if not path.exists():
             raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
-        with path.open("r", encoding="utf-8") as f:
-            gj_obj = geojson.load(f)
-
-        # Converter para dict puro para garantir serialização
-        gj_dict: Dict[str, Any] = json.loads(geojson.dumps(gj_obj))
-
-        polygon_coords = extract_polygon_latlng_from_geojson(gj_dict)
-        bbox = gj_dict.get("bbox")
+        # Lido do sidecar GeoParquet (reconstruído se o arquivo mudou), no nível
+        # mais grosso da pirâmide que ainda respeita o zoom/tolerância pedidos
+        meta = geo_processor.dataset_info(path.name)
+        level = geo_processor.select_level(meta.get("simplify_tolerances", []), zoom=zoom, tolerance=tolerance)
+        try:
+            field_list = geo_processor.validate_fields(meta, fields.split(",") if fields is not None else None)
+            conditions = geo_processor.parse_where(json.loads(where) if where else None, meta)
+        except ValueError as e:  # inclui JSON inválido
+            raise HTTPException(status_code=400, detail=f"Filtro inválido: {e}")
+
+        def read():
+            return geo_processor.read_collection(path.name, level=level, columns=field_list, where=conditions)
+
+        def build_load_response(gj_dict: Dict[str, Any]) -> Dict[str, Any]:
+            """Envelope GeoJSONLoadResponse montado direto (o GeoJSON vem do sidecar, sem revalidar)."""
+            polygon_coords = extract_polygon_latlng_from_geojson(gj_dict)
+            bbox = gj_dict.get("bbox")
+
+            if gj_dict.get("type") == "FeatureCollection":
+                feats_count = len(gj_dict.get("features", []))
+                gj_type = "FeatureCollection"
+            elif gj_dict.get("type") == "Feature":
+                feats_count = 1
+                gj_type = "Feature"
+            else:
+                feats_count = 0
+                gj_type = gj_dict.get("type", "Geometry")
+
+            return {
+                "name": path.name,
+                "type": gj_type,
+                "features_count": feats_count,
+                "bbox": bbox,
+                "polygon": [c.dict() for c in polygon_coords] if polygon_coords is not None else None,
+                "raw": gj_dict,
+            }
 
-        if gj_dict.get("type") == "FeatureCollection":
-            feats_count = len(gj_dict.get("features", []))
-            gj_type = "FeatureCollection"
-        elif gj_dict.get("type") == "Feature":
-            feats_count = 1
-            gj_type = "Feature"
+        # Corpo serializado (orjson) e comprimido uma vez por dataset/nível/precisão/filtro
+        cache_key = (path.name, meta["source_signature"], level, "load", precision,
+                     _query_key(field_list, conditions))
+        if format == "geojson":
+            def build():
+                raw = read()
+                if precision is not None:
+                    raw = geo_formats.quantize_geojson(raw, precision)
+                return build_load_response(raw)
+            body, headers = geo_formats.encoded_body(cache_key, build, "geojson", None, accept_encoding)
+            headers["Content-Type"] = "application/json"
         else:
-            feats_count = 0
-            gj_type = gj_dict.get("type", "Geometry")
-
-        return GeoJSONLoadResponse(
-            name=path.name,
-            type=gj_type,
-            features_count=feats_count,
-            bbox=bbox,
-            polygon=polygon_coords,
-            raw=gj_dict,
-        )
+            body, headers = geo_formats.encoded_body(
+                cache_key, read, format, precision, accept_encoding, object_name=path.stem,
+            )
+        return Response(content=body, headers=headers)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao carregar GeoJSON: {e}")
 
 
+def _query_key(fields: Optional[List[str]], where: Dict[str, Any]) -> str:
+    """Chave canônica de projeção + filtro para os caches de respostas."""
+    return json.dumps([fields, where], sort_keys=True, ensure_ascii=False, default=str)
+
+def _parse_cursor(cursor: Optional[str]) -> int:
+    if cursor is None:
+        return 0
+    try:
+        start = int(cursor)
+    except ValueError:
+        start = -1
+    if start < 0:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return start
+
+def stream_geojson_layer(name: str, meta: Dict[str, Any], level: int, request: GeoJSONLayerRequest,
+                         fields: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> StreamingResponse:
+    """
+    Resposta em streaming de uma camada: NDJSON (uma feature por linha) ou
+    FeatureCollection em chunks. A página (posições no sidecar) é decidida
+    antes de escrever o corpo, então o próximo cursor vai no header
+    `X-Next-Cursor` (e em `next_cursor` na FeatureCollection). Com polígono,
+    o filtro exato por geometria pode deixar a página com menos de `limit`
+    features; continue até não haver próximo cursor.
+    """
+    start = _parse_cursor(request.cursor)
+    window = None
+    if request.polygon:
+        lats = [p.lat for p in request.polygon]
+        lngs = [p.lng for p in request.polygon]
+        window = (min(lngs), min(lats), max(lngs), max(lats))
+    candidates = geo_processor.load_dataset(name).select_positions(where) if where else None
+    positions, next_cursor = geo_processor.scan_page(
+        name, bbox=window, start=start, limit=request.limit, candidates=candidates
+    )
+    json_columns = meta.get("json_columns", [])
+    ndjson = request.stream == "ndjson"
+    print(f"🌊 Streaming de {len(positions)} candidatas ({'ndjson' if ndjson else 'geojson'}), cursor={start}")
+
+    def features():
+        for table in geo_processor.iter_row_batches(name, positions, columns=fields, level=level):
+            if window is not None:
+                hits = shapely.intersects(geo_processor.table_geometries(table), shapely.box(*window))
+                table = table.filter(pa.array(hits))
+            for feat in geo_processor.table_to_features(table, json_columns):
+                if request.precision is not None:
+                    feat = geo_formats.quantize_geojson(feat, request.precision)
+                yield json.dumps(feat, ensure_ascii=False, separators=(",", ":"))
+
+    def body():
+        if ndjson:
+            for line in features():
+                yield line + "\n"
+            return
+        yield '{"type":"FeatureCollection","next_cursor":' + json.dumps(
+            str(next_cursor) if next_cursor is not None else None
+        ) + ',"features":['
+        first = True
+        for line in features():
+            yield line if first else "," + line
+            first = False
+        yield "]}"
+
+    headers = {}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return StreamingResponse(
+        body(),
+        media_type="application/x-ndjson" if ndjson else "application/geo+json",
+        headers=headers,
+    )
+
+
 @app.post("/api/geojson/render_layer")
-async def render_geojson_layer(request: GeoJSONLayerRequest):
+def render_geojson_layer(request: GeoJSONLayerRequest, accept_encoding: Optional[str] = Header(None)):
     """
     Render a GeoJSON layer, optionally filtered by a polygon.
+    `format`/`precision` select a compact, compressed wire format
+    (precision-limited GeoJSON, TopoJSON or Geobuf).
     """
     print(f"🔍 render_geojson_layer chamado com filename={request.filename}")
     print(f"📍 Polygon: {len(request.polygon) if request.polygon else 0} pontos")
@@ -1076,14 +1428,27 @@ async def render_geojson_layer(request: GeoJSONLayerRequest):
             print(f"❌ Arquivo não encontrado: {geojson_path}")
             raise HTTPException(status_code=404, detail=f"GeoJSON file '{request.filename}' not found")
         
-        print(f"📂 Carregando arquivo: {geojson_path}")
-        with geojson_path.open('r', encoding='utf-8') as f:
-            geojson_data = geojson.load(f)
-        
-        total_features = len(geojson_data.get('features', []))
-        print(f"📊 Total de features no arquivo: {total_features}")
-        
-        # If polygon is provided, filter features using bounding box (faster)
+        # Coarsest simplification level that still looks right at the requested zoom
+        meta = geo_processor.dataset_info(geojson_path.name)
+        level = geo_processor.select_level(
+            meta.get("simplify_tolerances", []), zoom=request.zoom, tolerance=request.tolerance
+        )
+        if level:
+            print(f"🔻 Nível de simplificação {level} (tolerância {meta['simplify_tolerances'][level - 1]}°)")
+        compact = request.format != "geojson" or request.precision is not None
+        try:
+            fields = geo_processor.validate_fields(meta, request.fields)
+            where = geo_processor.parse_where(request.where, meta)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Filtro inválido: {e}")
+        
+        # Streaming / paginação: features escritas uma a uma, um row group por vez
+        if request.stream or request.limit is not None or request.cursor is not None:
+            if request.format != "geojson":
+                raise HTTPException(status_code=400, detail="Streaming disponível apenas em formato geojson")
+            return stream_geojson_layer(geojson_path.name, meta, level, request, fields, where)
+        
+        # If polygon is provided, read only the bbox window from the sidecar
         if request.polygon:
             # Get bounding box of the polygon
             lats = [p.lat for p in request.polygon]
@@ -1093,40 +1458,21 @@ async def render_geojson_layer(request: GeoJSONLayerRequest):
             
             print(f"🗺️ Bounding box: lat=[{min_lat}, {max_lat}], lng=[{min_lng}, {max_lng}]")
             
-            # Filter features by bounding box overlap
-            filtered_features = []
-            for feature in geojson_data.get('features', []):
-                try:
-                    geom = feature.get('geometry', {})
-                    coords = geom.get('coordinates', [])
-                    
-                    # Extract all coordinate pairs
-                    def extract_coords(obj):
-                        if isinstance(obj, list):
-                            if len(obj) == 2 and isinstance(obj[0], (int, float)):
-                                return [obj]
-                            else:
-                                result = []
-                                for item in obj:
-                                    result.extend(extract_coords(item))
-                                return result
-                        return []
-                    
-                    all_coords = extract_coords(coords)
-                    
-                    # Check if any coordinate is within bounding box
-                    for coord in all_coords:
-                        lng, lat = coord[0], coord[1]
-                        if min_lng <= lng <= max_lng and min_lat <= lat <= max_lat:
-                            filtered_features.append(feature)
-                            break
-                            
-                except Exception as ex:
-                    # Skip features that can't be processed
-                    print(f"⚠️ Erro ao processar feature: {ex}")
-                    continue
-            
-            print(f"✅ Features filtradas: {len(filtered_features)}")
+            window = (min_lng, min_lat, max_lng, max_lat)
+            if where:
+                # Attribute indexes first, then the spatial window (no full geometry scan)
+                filtered_features = geo_processor.select_features(
+                    geojson_path.name, geometry=shapely.box(*window), where=where, fields=fields, level=level
+                )
+            else:
+                table = geo_processor.read_table(geojson_path.name, bbox=window, columns=fields, level=level)
+                
+                # Keep features whose geometry actually touches the bounding box
+                hits = shapely.intersects(geo_processor.table_geometries(table), shapely.box(*window))
+                table = table.filter(pa.array(hits))
+                filtered_features = geo_processor.table_to_features(table, meta.get("json_columns", []))
+            
+            print(f"✅ Features filtradas: {len(filtered_features)} de {meta.get('feature_count')}")
             
             # Create filtered GeoJSON
             filtered_geojson = {
@@ -1134,13 +1480,33 @@ async def render_geojson_layer(request: GeoJSONLayerRequest):
                 "features": filtered_features
             }
             
-            return filtered_geojson
-        
-        # Return full GeoJSON if no polygon filter
-        print(f"✅ Retornando {total_features} features (sem filtro)")
-        # Convert to dict for proper serialization
-        gj_dict: Dict[str, Any] = json.loads(geojson.dumps(geojson_data))
-        return gj_dict
+            if compact:
+                body, headers = geo_formats.encoded_body(
+                    None, lambda: filtered_geojson, request.format, request.precision,
+                    accept_encoding, object_name=geojson_path.stem,
+                )
+                return Response(content=body, headers=headers)
+            return fast_json.FastJSONResponse(filtered_geojson)
+        
+        # Compact formats for the full layer are cached per (dataset, level, format, precision)
+        if compact:
+            print(f"✅ Retornando camada completa em {request.format} (precisão {request.precision})")
+            body, headers = geo_formats.encoded_body(
+                (geojson_path.name, meta["source_signature"], level, "layer", _query_key(fields, where)),
+                lambda: geo_processor.read_collection(geojson_path.name, level=level, columns=fields, where=where),
+                request.format, request.precision, accept_encoding, object_name=geojson_path.stem,
+            )
+            return Response(content=body, headers=headers)
+        
+        # Return full GeoJSON if no polygon filter (serialized once per worker, like the compact formats)
+        print(f"✅ Retornando camada completa (sem filtro)")
+        body, headers = geo_formats.encoded_body(
+            (geojson_path.name, meta["source_signature"], level, "layer", _query_key(fields, where)),
+            lambda: geo_processor.read_collection(geojson_path.name, level=level, columns=fields, where=where),
+            "geojson", None, accept_encoding,
+        )
+        headers["Content-Type"] = "application/json"
+        return Response(content=body, headers=headers)
         
     except HTTPException:
         raise
@@ -1151,11 +1517,42 @@ async def render_geojson_layer(request: GeoJSONLayerRequest):
         raise HTTPException(status_code=500, detail=f"Erro ao renderizar camada GeoJSON: {e}")
 
 
+@app.get("/api/geojson/tiles/{name}/{z}/{x}/{y}.pbf")
+def get_geojson_vector_tile(name: str, z: int, x: int, y: int):
+    """
+    Vector tile (MVT) de um dataset da pasta data, recortado e simplificado
+    para o zoom. Tiles ficam em cache em disco até o arquivo de origem mudar.
+    """
+    try:
+        data = vector_tiles.get_tile(name, z, x, y)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Erro ao gerar vector tile {name} {z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao gerar vector tile: {e}")
+    return Response(
+        content=data,
+        media_type="application/vnd.mapbox-vector-tile",
+        headers={"Cache-Control": "public, max-age=86400"},
+    )
+
+
 # =========================
 # Análise de Área com IA - RISCO AMBIENTAL
 # =========================
-@app.post("/api/analyze_area", response_model=AnalyzeAreaResponse)
-async def analyze_area(req: AnalyzeAreaRequest):
+# Folga mínima para começar uma etapa de analyze_area (cada uma são 2-3 reduções no EE)
+ANALYZE_STEP_RESERVE = float(os.getenv("ANALYZE_STEP_RESERVE_SECONDS", "20"))
+
+def _stale_analyze_area(req: AnalyzeAreaRequest, http_request: Request = None) -> Optional[AnalyzeAreaResponse]:
+    """Análise mais recente da mesma área (de qualquer dia)."""
+    cached = result_store.stale_result("analyze_area", req.polygon, {"area_km2": round(req.area_km2, 4)})
+    return AnalyzeAreaResponse(**{**cached, "stale": True}) if cached is not None else None
+
+@app.post("/api/analyze_area", response_model=AnalyzeAreaResponse, dependencies=[Depends(rate_limit.charge("analyze_area"))])
+@ee_executor.endpoint(ee_executor.BATCH, fallback=_stale_analyze_area)
+def analyze_area(req: AnalyzeAreaRequest, http_request: Request = None):
     """
     Analisa uma área definida por polígono com foco em RISCO AMBIENTAL:
     - Temperatura média anual e dias de calor extremo
@@ -1163,6 +1560,8 @@ async def analyze_area(req: AnalyzeAreaRequest):
     - Densidade de vegetação e risco de perda
     - Risco de inundação e seca
     - Vulnerabilidade social (favelas)
+    Se o prazo da requisição (header X-Request-Timeout) esgotar, devolve os
+    indicadores já calculados e lista as etapas puladas em `skipped`.
     """
     try:
         # Criar geometria do polígono
@@ -1177,179 +1576,211 @@ async def analyze_area(req: AnalyzeAreaRequest):
         favela_count = favela_info.get("count", 0)
         favela_population = favela_info.get("population", 0)
         
+        # Junção zonal com os setores censitários (ponderada pela área dentro do polígono)
+        try:
+            census = zonal.zonal_stats(Polygon(polygon_coords))
+        except FileNotFoundError:
+            census = {"sector_count": 0, "covered_area_km2": 0.0, "coverage_fraction": 0.0, "weighted": {}}
+        print(f"🏘️ Setores censitários: {census['sector_count']} ({census['coverage_fraction'] * 100:.1f}% da área)")
+        
         # Período de análise: últimos 2 anos (mais dados disponíveis)
         end_date = datetime.now()
         start_date_annual = end_date - timedelta(days=730)
         start_str_annual = start_date_annual.strftime("%Y-%m-%d")
         end_str = end_date.strftime("%Y-%m-%d")
         
+        # Mesma área já analisada (vencida: servida e recalculada em segundo plano)
+        store_params = {"area_km2": round(req.area_km2, 4)}
+        cached = result_store.get_result("analyze_area", polygon_coords, start_str_annual, end_str, store_params,
+                                         refresh=_refresh(analyze_area, req))
+        if cached is not None:
+            print("♻️ Análise recuperada do armazenamento")
+            return AnalyzeAreaResponse(**cached)
+        
+        # Etapas no EE: sem tempo para a próxima, devolve o que já tem (indicadores ausentes = None)
+        skipped: List[str] = []
+        avg_annual_temp = extreme_heat_days = heat_island_risk = None
+        ndvi_value = vegetation_density = vegetation_loss_risk = None
+        ndwi_value = avg_elevation = flood_risk = None
+
         # 1. TEMPERATURA ANUAL E DIAS EXTREMOS (MODIS LST)
-        print(f"🌡️ Analisando temperatura MODIS para período {start_str_annual} a {end_str}")
+        if ee_executor.deadline_near(ANALYZE_STEP_RESERVE):
+            skipped.append("temperatura (MODIS LST)")
+        else:
+            print(f"🌡️ Analisando temperatura MODIS para período {start_str_annual} a {end_str}")
         
-        # MODIS tem cobertura global, então não precisa filterBounds inicial
-        modis_lst = ee.ImageCollection("MODIS/061/MOD11A2") \
-            .filterDate(start_str_annual, end_str) \
-            .select("LST_Day_1km")
+            # MODIS tem cobertura global, então não precisa filterBounds inicial
+            modis_lst = ee.ImageCollection("MODIS/061/MOD11A2") \
+                .filterDate(start_str_annual, end_str) \
+                .select("LST_Day_1km")
         
-        modis_count = modis_lst.size().getInfo()
-        print(f"📊 Total de imagens MODIS LST disponíveis: {modis_count}")
+            modis_count = modis_lst.size().getInfo()
+            print(f"📊 Total de imagens MODIS LST disponíveis: {modis_count}")
         
-        if modis_count == 0:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Nenhuma imagem MODIS LST encontrada para o período {start_str_annual} a {end_str}. MODIS pode estar temporariamente indisponível."
-            )
+            if modis_count == 0:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Nenhuma imagem MODIS LST encontrada para o período {start_str_annual} a {end_str}. MODIS pode estar temporariamente indisponível."
+                )
         
-        # Converter para Celsius
-        lst_celsius = modis_lst.map(lambda img: img.multiply(0.02).subtract(273.15))
+            # Converter para Celsius
+            lst_celsius = modis_lst.map(lambda img: img.multiply(0.02).subtract(273.15))
         
-        # Temperatura média anual
-        lst_mean = lst_celsius.mean()
-        temp_stats = lst_mean.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=geometry,
-            scale=1000,
-            maxPixels=1e9
-        ).getInfo()
+            # Temperatura média anual
+            lst_mean = lst_celsius.mean()
+            temp_stats = lst_mean.reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=geometry,
+                scale=1000,
+                maxPixels=1e9
+            ).getInfo()
         
-        avg_annual_temp = temp_stats.get("LST_Day_1km")
-        if avg_annual_temp is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Falha ao calcular temperatura média. Dados MODIS LST inválidos."
-            )
+            avg_annual_temp = temp_stats.get("LST_Day_1km")
+            if avg_annual_temp is None:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Falha ao calcular temperatura média. Dados MODIS LST inválidos."
+                )
         
-        print(f"✅ Temperatura média anual calculada: {avg_annual_temp:.2f}°C")
+            print(f"✅ Temperatura média anual calculada: {avg_annual_temp:.2f}°C")
         
-        # Contar dias com calor extremo (>35°C)
-        extreme_count = lst_celsius.map(lambda img: img.gt(35).selfMask()).sum()
-        extreme_stats = extreme_count.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=geometry,
-            scale=1000,
-            maxPixels=1e9
-        ).getInfo()
-        extreme_heat_days = int(extreme_stats.get("LST_Day_1km", 0) or 0)
-        print(f"🔥 Dias com calor extremo (>35°C): {extreme_heat_days}")
-        
-        # Calcular risco de ilha de calor
-        if avg_annual_temp > 32 or extreme_heat_days > 60:
-            heat_island_risk = "CRITICAL"
-        elif avg_annual_temp > 30 or extreme_heat_days > 40:
-            heat_island_risk = "HIGH"
-        elif avg_annual_temp > 28 or extreme_heat_days > 20:
-            heat_island_risk = "MEDIUM"
-        else:
-            heat_island_risk = "LOW"
+            # Contar dias com calor extremo (>35°C)
+            extreme_count = lst_celsius.map(lambda img: img.gt(35).selfMask()).sum()
+            extreme_stats = extreme_count.reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=geometry,
+                scale=1000,
+                maxPixels=1e9
+            ).getInfo()
+            extreme_heat_days = int(extreme_stats.get("LST_Day_1km", 0) or 0)
+            print(f"🔥 Dias com calor extremo (>35°C): {extreme_heat_days}")
+        
+            # Calcular risco de ilha de calor
+            if avg_annual_temp > 32 or extreme_heat_days > 60:
+                heat_island_risk = "CRITICAL"
+            elif avg_annual_temp > 30 or extreme_heat_days > 40:
+                heat_island_risk = "HIGH"
+            elif avg_annual_temp > 28 or extreme_heat_days > 20:
+                heat_island_risk = "MEDIUM"
+            else:
+                heat_island_risk = "LOW"
         
         # 2. VEGETAÇÃO (NDVI) - Sentinel-2
-        print(f"🌿 Analisando vegetação Sentinel-2 para período {start_str_annual} a {end_str}")
-        
         s2_collection = ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED") \
             .filterDate(start_str_annual, end_str) \
             .filterBounds(geometry) \
             .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", 20))
         
-        s2_count = s2_collection.size().getInfo()
-        print(f"📊 Encontradas {s2_count} imagens Sentinel-2")
+        if ee_executor.deadline_near(ANALYZE_STEP_RESERVE):
+            skipped.append("vegetação (Sentinel-2 NDVI)")
+        else:
+            print(f"🌿 Analisando vegetação Sentinel-2 para período {start_str_annual} a {end_str}")
         
-        if s2_count == 0:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Nenhuma imagem Sentinel-2 encontrada para a área no período {start_str_annual} a {end_str}. Tente uma área diferente ou aumente a tolerância de nuvens."
-            )
+            s2_count = s2_collection.size().getInfo()
+            print(f"📊 Encontradas {s2_count} imagens Sentinel-2")
         
-        def calc_ndvi(img):
-            ndvi = img.normalizedDifference(["B8", "B4"]).rename("NDVI")
-            return img.addBands(ndvi)
+            if s2_count == 0:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Nenhuma imagem Sentinel-2 encontrada para a área no período {start_str_annual} a {end_str}. Tente uma área diferente ou aumente a tolerância de nuvens."
+                )
         
-        ndvi_collection = s2_collection.map(calc_ndvi)
-        ndvi_mean = ndvi_collection.select("NDVI").mean()
+            def calc_ndvi(img):
+                ndvi = img.normalizedDifference(["B8", "B4"]).rename("NDVI")
+                return img.addBands(ndvi)
         
-        ndvi_stats = ndvi_mean.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=geometry,
-            scale=100,
-            maxPixels=1e9
-        ).getInfo()
+            ndvi_collection = s2_collection.map(calc_ndvi)
+            ndvi_mean = ndvi_collection.select("NDVI").mean()
         
-        ndvi_value = ndvi_stats.get("NDVI")
-        if ndvi_value is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Falha ao calcular NDVI. Dados Sentinel-2 inválidos."
-            )
+            ndvi_stats = ndvi_mean.reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=geometry,
+                scale=100,
+                maxPixels=1e9
+            ).getInfo()
         
-        vegetation_density = max(0, min(100, (ndvi_value + 1) * 50))
-        print(f"✅ NDVI médio: {ndvi_value:.3f} | Densidade vegetal: {vegetation_density:.1f}%")
+            ndvi_value = ndvi_stats.get("NDVI")
+            if ndvi_value is None:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Falha ao calcular NDVI. Dados Sentinel-2 inválidos."
+                )
         
-        # Risco de perda de vegetação
-        if vegetation_density < 20:
-            vegetation_loss_risk = "CRITICAL"
-        elif vegetation_density < 35:
-            vegetation_loss_risk = "HIGH"
-        elif vegetation_density < 50:
-            vegetation_loss_risk = "MEDIUM"
-        else:
-            vegetation_loss_risk = "LOW"
+            vegetation_density = max(0, min(100, (ndvi_value + 1) * 50))
+            print(f"✅ NDVI médio: {ndvi_value:.3f} | Densidade vegetal: {vegetation_density:.1f}%")
+        
+            # Risco de perda de vegetação
+            if vegetation_density < 20:
+                vegetation_loss_risk = "CRITICAL"
+            elif vegetation_density < 35:
+                vegetation_loss_risk = "HIGH"
+            elif vegetation_density < 50:
+                vegetation_loss_risk = "MEDIUM"
+            else:
+                vegetation_loss_risk = "LOW"
         
         # 3. RISCO DE INUNDAÇÃO E SECA (NDWI + elevação)
-        print(f"💧 Analisando índice de água (NDWI)")
+        if ee_executor.deadline_near(ANALYZE_STEP_RESERVE):
+            skipped.append("água e elevação (NDWI, SRTM)")
+        else:
+            print(f"💧 Analisando índice de água (NDWI)")
         
-        def calc_ndwi(img):
-            ndwi = img.normalizedDifference(["B3", "B8"]).rename("NDWI")
-            return img.addBands(ndwi)
+            def calc_ndwi(img):
+                ndwi = img.normalizedDifference(["B3", "B8"]).rename("NDWI")
+                return img.addBands(ndwi)
         
-        ndwi_collection = s2_collection.map(calc_ndwi)
-        ndwi_mean = ndwi_collection.select("NDWI").mean()
+            ndwi_collection = s2_collection.map(calc_ndwi)
+            ndwi_mean = ndwi_collection.select("NDWI").mean()
         
-        ndwi_stats = ndwi_mean.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=geometry,
-            scale=100,
-            maxPixels=1e9
-        ).getInfo()
+            ndwi_stats = ndwi_mean.reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=geometry,
+                scale=100,
+                maxPixels=1e9
+            ).getInfo()
         
-        ndwi_value = ndwi_stats.get("NDWI")
-        if ndwi_value is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Falha ao calcular NDWI. Dados Sentinel-2 inválidos."
-            )
+            ndwi_value = ndwi_stats.get("NDWI")
+            if ndwi_value is None:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Falha ao calcular NDWI. Dados Sentinel-2 inválidos."
+                )
         
-        print(f"✅ NDWI médio: {ndwi_value:.3f}")
+            print(f"✅ NDWI médio: {ndwi_value:.3f}")
         
-        # Elevação
-        print(f"🏔️ Analisando elevação (DEM)")
-        dem = ee.Image("USGS/SRTMGL1_003")
-        elev_stats = dem.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=geometry,
-            scale=90,
-            maxPixels=1e9
-        ).getInfo()
+            # Elevação
+            print(f"🏔️ Analisando elevação (DEM)")
+            dem = ee.Image("USGS/SRTMGL1_003")
+            elev_stats = dem.reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=geometry,
+                scale=90,
+                maxPixels=1e9
+            ).getInfo()
         
-        avg_elevation = elev_stats.get("elevation")
-        if avg_elevation is None:
-            raise HTTPException(
-                status_code=500,
-                detail="Falha ao calcular elevação. Dados DEM inválidos."
-            )
+            avg_elevation = elev_stats.get("elevation")
+            if avg_elevation is None:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Falha ao calcular elevação. Dados DEM inválidos."
+                )
         
-        print(f"✅ Elevação média: {avg_elevation:.1f}m")
+            print(f"✅ Elevação média: {avg_elevation:.1f}m")
         
-        # Risco de inundação
-        if ndwi_value > 0.3 or avg_elevation < 10:
-            flood_risk = "CRITICAL"
-        elif ndwi_value > 0.2 or avg_elevation < 50:
-            flood_risk = "HIGH"
-        elif ndwi_value > 0.1 or avg_elevation < 100:
-            flood_risk = "MEDIUM"
-        else:
-            flood_risk = "LOW"
+            # Risco de inundação
+            if ndwi_value > 0.3 or avg_elevation < 10:
+                flood_risk = "CRITICAL"
+            elif ndwi_value > 0.2 or avg_elevation < 50:
+                flood_risk = "HIGH"
+            elif ndwi_value > 0.1 or avg_elevation < 100:
+                flood_risk = "MEDIUM"
+            else:
+                flood_risk = "LOW"
         
         # Risco de seca (baixo NDWI + baixa vegetação)
-        if ndwi_value < -0.2 and vegetation_density < 30:
+        if ndwi_value is None or vegetation_density is None:
+            drought_risk = None
+        elif ndwi_value < -0.2 and vegetation_density < 30:
             drought_risk = "CRITICAL"
         elif ndwi_value < -0.1 and vegetation_density < 40:
             drought_risk = "HIGH"
@@ -1392,20 +1823,36 @@ async def analyze_area(req: AnalyzeAreaRequest):
         else:
             social_vulnerability = "LOW"
         
+        # Setores de favelas cobrindo boa parte da área elevam a vulnerabilidade
+        census_coverage = census["coverage_fraction"]
+        levels = ["LOW", "MEDIUM", "HIGH", "CRITICAL"]
+        if census_coverage > 0.25:
+            census_level = "CRITICAL"
+        elif census_coverage > 0.10:
+            census_level = "HIGH"
+        elif census["sector_count"] > 0:
+            census_level = "MEDIUM"
+        else:
+            census_level = "LOW"
+        social_vulnerability = max(social_vulnerability, census_level, key=levels.index)
+        
         # 5. GERAR RESUMO E RECOMENDAÇÕES COM IA
         ai_summary = f"📊 ANÁLISE AMBIENTAL - Área de {req.area_km2:.2f} km²\n\n"
         
         # Análise climática
-        ai_summary += f"🌡️ CLIMA: Temperatura média anual de {avg_annual_temp:.1f}°C"
-        if extreme_heat_days > 0:
-            ai_summary += f", com {extreme_heat_days} dias de calor extremo (>35°C) no último ano"
-        ai_summary += ". "
+        if avg_annual_temp is not None:
+            ai_summary += f"🌡️ CLIMA: Temperatura média anual de {avg_annual_temp:.1f}°C"
+            if extreme_heat_days > 0:
+                ai_summary += f", com {extreme_heat_days} dias de calor extremo (>35°C) no último ano"
+            ai_summary += ". "
         
         if heat_island_risk in ["HIGH", "CRITICAL"]:
             ai_summary += "⚠️ Área identificada como ILHA DE CALOR URBANA - temperaturas significativamente acima da média regional. "
         
         # Vegetação
-        if vegetation_density < 25:
+        if vegetation_density is None:
+            pass
+        elif vegetation_density < 25:
             ai_summary += f"🌱 VEGETAÇÃO CRÍTICA: Apenas {vegetation_density:.0f}% de cobertura vegetal - área altamente impermeabilizada. "
         elif vegetation_density < 45:
             ai_summary += f"🌿 Cobertura vegetal moderada ({vegetation_density:.0f}%) com potencial de melhoria. "
@@ -1424,9 +1871,23 @@ async def analyze_area(req: AnalyzeAreaRequest):
             if favela_population > 0:
                 ai_summary += f" com ~{favela_population:,} habitantes".replace(",", ".")
             ai_summary += ". População em situação de maior exposição aos riscos ambientais. "
+        if census["sector_count"] > 0:
+            ai_summary += (
+                f"\n🗺️ SETORES CENSITÁRIOS: {census['sector_count']} setor(es) de favelas e comunidades urbanas "
+                f"ocupam {census['covered_area_km2']:.2f} km² ({census_coverage * 100:.1f}% da área analisada). "
+            )
+            if census["weighted"]:
+                ai_summary += "Ponderado pela área: " + ", ".join(
+                    f"{name} {value:,.0f}".replace(",", ".") for name, value in census["weighted"].items()
+                ) + ". "
         
         # Conclusão
         ai_summary += f"\n\n🎯 RISCO AMBIENTAL GERAL: {environmental_risk}"
+        if skipped:
+            ai_summary += (
+                f"\n\n⏱️ ANÁLISE PARCIAL: {', '.join(skipped)} não calculado(s) dentro do prazo; "
+                "o risco geral considera apenas os indicadores disponíveis."
+            )
         
         # RECOMENDAÇÕES
         recommendations = []
@@ -1463,11 +1924,11 @@ async def analyze_area(req: AnalyzeAreaRequest):
         # Monitoramento
         recommendations.append("📡 Estabelecer monitoramento contínuo via satélite (NDVI, LST, NDWI) para acompanhar evolução")
         
-        return AnalyzeAreaResponse(
-            avg_annual_temperature=round(avg_annual_temp, 2),
+        response = AnalyzeAreaResponse(
+            avg_annual_temperature=round(avg_annual_temp, 2) if avg_annual_temp is not None else None,
             extreme_heat_days=extreme_heat_days,
             heat_island_risk=heat_island_risk,
-            vegetation_density=round(vegetation_density, 2),
+            vegetation_density=round(vegetation_density, 2) if vegetation_density is not None else None,
             vegetation_loss_risk=vegetation_loss_risk,
             environmental_risk=environmental_risk,
             flood_risk=flood_risk,
@@ -1475,9 +1936,22 @@ async def analyze_area(req: AnalyzeAreaRequest):
             favela_count=favela_count,
             favela_population=favela_population,
             social_vulnerability=social_vulnerability,
+            census_sector_count=census["sector_count"],
+            census_area_km2=census["covered_area_km2"],
+            census_coverage=census_coverage,
+            census_weighted=census["weighted"] or None,
             ai_summary=ai_summary,
-            recommendations=recommendations
+            recommendations=recommendations,
+            partial=bool(skipped),
+            skipped=skipped
         )
+        if skipped:
+            print(f"⏱️ Análise parcial, etapas puladas: {skipped}")
+        else:
+            # Resultado parcial não vai para o cache (o próximo pedido tenta completo)
+            result_store.save_result("analyze_area", polygon_coords, start_str_annual, end_str,
+                                     response.dict(), store_params)
+        return response
         
     except Exception as e:
         import traceback
@@ -1492,6 +1966,7 @@ class TimeSeriesRequest(BaseModel):
     polygon: List[List[float]]
     start_date: str
     end_date: str
+    resolution: Optional[str] = Field(default=None, pattern="^(week|month|season)$")  # Composições por período
 
 class TimeSeriesDataPoint(BaseModel):
     date: str
@@ -1499,15 +1974,341 @@ class TimeSeriesDataPoint(BaseModel):
     ndvi: Optional[float] = None
     ndwi: Optional[float] = None
     precipitation: Optional[float] = None
+    period_end: Optional[str] = None  # Fim (exclusivo) do período, com `resolution`
+    image_count: Optional[int] = None  # Cenas Sentinel-2 usadas na composição
 
 class TimeSeriesResponse(BaseModel):
     timeseries: List[TimeSeriesDataPoint]
     total_points: int
+    resolution: Optional[str] = None
+    stale: bool = False  # Resultado guardado, servido com o Earth Engine indisponível
+    partial: bool = False  # Prazo da requisição esgotou: só as datas já processadas
+    skipped: List[str] = []  # Trechos (sensor: início a fim) que ficaram de fora
+
+# Limite de imagens processadas por busca (cada uma custa getInfo)
+TIME_SERIES_MAX_IMAGES = 100
+
+def _next_day(date_str: str) -> str:
+    return (datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+def _fetch_modis_lst(geometry: ee.Geometry, start_date: str, end_date: str):
+    """
+    Temperatura (MODIS LST) por data em [start_date, end_date).
+    Retorna as observações, até onde a janela foi de fato coberta (menos que
+    end_date quando o limite de imagens, o prazo ou um erro interrompe a busca)
+    e o erro do EE que interrompeu, se houve (a data da imagem que falhou não
+    conta como coberta).
+    """
+    modis_lst = ee.ImageCollection('MODIS/061/MOD11A2') \
+        .filterBounds(geometry) \
+        .filterDate(start_date, end_date) \
+        .select('LST_Day_1km') \
+        .sort('system:time_start')
+    
+    observations: Dict[str, Dict[str, Any]] = {}
+    modis_list = modis_lst.toList(TIME_SERIES_MAX_IMAGES + 1)
+    modis_size = modis_lst.size().getInfo()
+    print(f"🌡️ Processando {modis_size} imagens MODIS LST ({start_date} a {end_date})")
+    
+    last_date = None
+    stopped = False
+    error: Optional[Exception] = None
+    for i in range(min(modis_size, TIME_SERIES_MAX_IMAGES)):
+        ee_executor.check_cancelled()
+        if ee_executor.deadline_near():
+            print(f"⏱️ MODIS: prazo da requisição esgotando, parando no índice {i}")
+            stopped = True
+            break
+        try:
+            img = ee.Image(modis_list.get(i))
+            timestamp = img.get('system:time_start').getInfo()
+            date_str = datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d')
+            last_date = date_str
+            
+            # Calcular temperatura média
+            lst_celsius = img.multiply(0.02).subtract(273.15)
+            temp_stats = lst_celsius.reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=geometry,
+                scale=1000,
+                maxPixels=1e9
+            ).getInfo()
+            
+            temp_val = temp_stats.get('LST_Day_1km')
+            if temp_val is not None:
+                observations[date_str] = {'temperature': round(float(temp_val), 2)}
+        except Exception as e:
+            # Falha do EE (cota, timeout): para aqui em vez de marcar as datas seguintes como sem dado
+            print(f"⚠️ Erro MODIS no índice {i}: {e}")
+            error, stopped = e, True
+            break
+    
+    if stopped:
+        # A data da última imagem pode ter outras cenas ainda não processadas (ou ser a que falhou)
+        covered_until = last_date or start_date
+    else:
+        covered_until = end_date if modis_size <= TIME_SERIES_MAX_IMAGES or last_date is None else _next_day(last_date)
+    return observations, covered_until, error
+
+def _fetch_s2_indices(geometry: ee.Geometry, start_date: str, end_date: str):
+    """NDVI e NDWI (Sentinel-2) por data em [start_date, end_date); mesmo retorno de _fetch_modis_lst."""
+    s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
+        .filterBounds(geometry) \
+        .filterDate(start_date, end_date) \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 10)) \
+        .sort('system:time_start')
+    
+    observations: Dict[str, Dict[str, Any]] = {}
+    s2_list = s2.toList(TIME_SERIES_MAX_IMAGES + 1)
+    s2_size = s2.size().getInfo()
+    print(f"🌿 Processando {s2_size} imagens Sentinel-2 ({start_date} a {end_date})")
+    
+    last_date = None
+    stopped = False
+    error: Optional[Exception] = None
+    for i in range(min(s2_size, TIME_SERIES_MAX_IMAGES)):
+        ee_executor.check_cancelled()
+        if ee_executor.deadline_near():
+            print(f"⏱️ S2: prazo da requisição esgotando, parando no índice {i}")
+            stopped = True
+            break
+        try:
+            img = ee.Image(s2_list.get(i))
+            timestamp = img.get('system:time_start').getInfo()
+            date_str = datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d')
+            last_date = date_str
+            
+            # NDVI
+            ndvi_img = img.normalizedDifference(['B8', 'B4'])
+            ndvi_stats = ndvi_img.reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=geometry,
+                scale=100,
+                maxPixels=1e9
+            ).getInfo()
+            
+            ndvi_val = ndvi_stats.get('nd')
+            
+            # NDWI
+            ndwi_img = img.normalizedDifference(['B3', 'B8'])
+            ndwi_stats = ndwi_img.reduceRegion(
+                reducer=ee.Reducer.mean(),
+                geometry=geometry,
+                scale=100,
+                maxPixels=1e9
+            ).getInfo()
+            
+            ndwi_val = ndwi_stats.get('nd')
+            
+            values = observations.setdefault(date_str, {})
+            if ndvi_val is not None:
+                values['ndvi'] = round(float(ndvi_val), 3)
+            if ndwi_val is not None:
+                values['ndwi'] = round(float(ndwi_val), 3)
+                
+        except Exception as e:
+            # Falha do EE (cota, timeout): para aqui em vez de marcar as datas seguintes como sem dado
+            print(f"⚠️ Erro S2 no índice {i}: {e}")
+            error, stopped = e, True
+            break
+    
+    if stopped or (s2_size > TIME_SERIES_MAX_IMAGES and last_date is not None):
+        # A data da última imagem pode ter outras cenas (granules) ainda não
+        # processadas, ou ser a que falhou: fica para a próxima busca
+        covered_until = last_date or start_date
+    else:
+        covered_until = end_date
+    return observations, covered_until, error
+
+# Sensores da série temporal: cada um é cacheado por (polígono, sensor, data)
+TIME_SERIES_SENSORS = {
+    "modis_lst": _fetch_modis_lst,
+    "sentinel2": _fetch_s2_indices,
+}
+
+def _sensor_observations(sensor: str, coords: List[List[float]], geometry: ee.Geometry,
+                         start_date: str, end_date: str) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """
+    Observações do sensor na janela: cache local + busca só dos trechos que faltam.
+    Também devolve os trechos que ficaram sem buscar (prazo da requisição ou
+    limite de imagens); o que foi buscado fica guardado para o próximo pedido.
+    Um erro do EE é propagado depois de guardar o que veio antes dele.
+    """
+    fetch = TIME_SERIES_SENSORS[sensor]
+    gaps = result_store.missing_ranges(coords, sensor, start_date, end_date)
+    observations = result_store.get_observations(coords, sensor, start_date, end_date)
+    if not gaps:
+        print(f"♻️ {sensor}: {len(observations)} observações do cache, nada a buscar")
+    skipped: List[str] = []
+    for gap_start, gap_end in gaps:
+        if ee_executor.deadline_near():
+            skipped.append(f"{sensor}: {gap_start} a {gap_end}")
+            continue
+        fetched, covered_until, error = fetch(geometry, gap_start, gap_end)
+        observations.update(fetched)
+        result_store.save_observations(coords, sensor, gap_start, covered_until, fetched)
+        if error is not None:
+            raise error
+        if covered_until < gap_end:
+            skipped.append(f"{sensor}: {covered_until} a {gap_end}")
+    return observations, skipped
+
+def _time_series_periods(start_date: str, end_date: str, resolution: str) -> List[tuple]:
+    """
+    Períodos [início, fim) cobrindo a janela: semanas de 7 dias a partir do
+    início, meses do calendário ou estações de 3 meses (dez-fev, mar-mai, jun-ago, set-nov).
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    if resolution == "week":
+        period_start = start
+    elif resolution == "month":
+        period_start = start.replace(day=1)
+    else:
+        month = start.month - (start.month % 3)  # 12 -> 12, 1-2 -> 12 do ano anterior
+        year = start.year - 1 if month == 0 else start.year
+        period_start = start.replace(year=year, month=month or 12, day=1)
+    
+    periods = []
+    while period_start < end:
+        if resolution == "week":
+            period_end = period_start + timedelta(days=7)
+        else:
+            step = 1 if resolution == "month" else 3
+            month_index = period_start.month - 1 + step
+            period_end = period_start.replace(year=period_start.year + month_index // 12, month=month_index % 12 + 1)
+        periods.append((max(period_start, start), min(period_end, end)))
+        period_start = period_end
+    return periods
+
+def _mask_s2_clouds(img: ee.Image) -> ee.Image:
+    """Remove sombra, nuvem, cirrus e neve pela banda SCL do Sentinel-2 L2A."""
+    scl = img.select('SCL')
+    clear = scl.neq(3).And(scl.neq(8)).And(scl.neq(9)).And(scl.neq(10)).And(scl.neq(11))
+    return img.updateMask(clear)
+
+def _composite_time_series(geometry: ee.Geometry, start_date: str, end_date: str,
+                           resolution: str) -> List[TimeSeriesDataPoint]:
+    """
+    Uma composição por período, toda montada no EE: mediana do Sentinel-2 com
+    máscara de nuvens (NDVI/NDWI) e média do MODIS LST. Todos os períodos são
+    reduzidos em um único getInfo, então o custo não cresce com o número de cenas.
+    """
+    periods = _time_series_periods(start_date, end_date, resolution)
+    if not periods:
+        return []
+    
+    s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
+        .filterBounds(geometry) \
+        .filterDate(start_date, end_date) \
+        .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 60)) \
+        .map(_mask_s2_clouds)
+    modis = ee.ImageCollection('MODIS/061/MOD11A2') \
+        .filterDate(start_date, end_date) \
+        .select('LST_Day_1km')
+    # Imagens totalmente mascaradas para períodos sem cenas: a redução devolve null
+    empty_indices = ee.Image.constant([0, 0]).rename(['ndvi', 'ndwi']).updateMask(0)
+    empty_lst = ee.Image.constant(0).rename('temperature').updateMask(0)
+    
+    def reduce_period(period):
+        period = ee.List(period)
+        p_start, p_end = ee.Date(period.get(0)), ee.Date(period.get(1))
+        s2_period = s2.filterDate(p_start, p_end)
+        median = s2_period.median()
+        indices = ee.Image(ee.Algorithms.If(
+            s2_period.size().gt(0),
+            median.normalizedDifference(['B8', 'B4']).rename('ndvi')
+                .addBands(median.normalizedDifference(['B3', 'B8']).rename('ndwi')),
+            empty_indices,
+        ))
+        modis_period = modis.filterDate(p_start, p_end)
+        lst = ee.Image(ee.Algorithms.If(
+            modis_period.size().gt(0),
+            modis_period.mean().multiply(0.02).subtract(273.15).rename('temperature'),
+            empty_lst,
+        ))
+        index_stats = indices.reduceRegion(reducer=ee.Reducer.mean(), geometry=geometry, scale=100, maxPixels=1e9)
+        lst_stats = lst.reduceRegion(reducer=ee.Reducer.mean(), geometry=geometry, scale=1000, maxPixels=1e9)
+        return ee.Feature(None, index_stats.combine(lst_stats).set('image_count', s2_period.size()))
+    
+    period_list = ee.List([[a.strftime('%Y-%m-%d'), b.strftime('%Y-%m-%d')] for a, b in periods])
+    table = ee.FeatureCollection(period_list.map(reduce_period)).getInfo()
+    
+    points = []
+    for (p_start, p_end), feat in zip(periods, table.get('features', [])):
+        props = feat.get('properties', {})
+        points.append(TimeSeriesDataPoint(
+            date=p_start.strftime('%Y-%m-%d'),
+            period_end=p_end.strftime('%Y-%m-%d'),
+            temperature=round(props['temperature'], 2) if props.get('temperature') is not None else None,
+            ndvi=round(props['ndvi'], 3) if props.get('ndvi') is not None else None,
+            ndwi=round(props['ndwi'], 3) if props.get('ndwi') is not None else None,
+            image_count=props.get('image_count'),
+        ))
+    return points
+
+def _observations_response(data_by_date: Dict[str, Dict[str, Any]]) -> TimeSeriesResponse:
+    """Série diária a partir das observações por data (todas as variáveis juntas)."""
+    # Converter dicionário para lista ordenada
+    timeseries = []
+    temp_count = 0
+    ndvi_count = 0
+    ndwi_count = 0
+    
+    for date_str in sorted(data_by_date.keys()):
+        data = data_by_date[date_str]
+        temp_val = data.get('temperature')
+        ndvi_val = data.get('ndvi')
+        ndwi_val = data.get('ndwi')
+        
+        if temp_val is not None:
+            temp_count += 1
+        if ndvi_val is not None:
+            ndvi_count += 1
+        if ndwi_val is not None:
+            ndwi_count += 1
+        
+        # Valores já numéricos vindos do EE/cache: sem validação
+        timeseries.append(TimeSeriesDataPoint.construct(
+            date=date_str,
+            temperature=temp_val,
+            ndvi=ndvi_val,
+            ndwi=ndwi_val,
+            precipitation=None  # TODO: Adicionar dados de precipitação
+        ))
+    
+    print(f"✅ Time series gerado: {len(timeseries)} pontos | Temp: {temp_count} | NDVI: {ndvi_count} | NDWI: {ndwi_count}")
+    
+    return TimeSeriesResponse.construct(
+        timeseries=timeseries,
+        total_points=len(timeseries)
+    )
 
-@app.post("/api/time_series", response_model=TimeSeriesResponse)
-async def get_time_series(req: TimeSeriesRequest):
+def _stale_time_series(req: TimeSeriesRequest, http_request: Request = None) -> Optional[TimeSeriesResponse]:
+    """Composições guardadas ou, na série diária, só as observações já em cache."""
+    coords = [[coord[0], coord[1]] for coord in req.polygon]
+    if coords[0] != coords[-1]:
+        coords.append(coords[0])
+    if req.resolution:
+        cached = result_store.stale_result("time_series", coords, {"resolution": req.resolution},
+                                           req.start_date, req.end_date)
+        return TimeSeriesResponse(**{**cached, "stale": True}) if cached is not None else None
+    data_by_date: Dict[str, Dict[str, Any]] = {}
+    for sensor in TIME_SERIES_SENSORS:
+        for date_str, values in result_store.get_observations(coords, sensor, req.start_date, req.end_date).items():
+            data_by_date.setdefault(date_str, {}).update(values)
+    if not data_by_date:
+        return None
+    response = _observations_response(data_by_date)
+    response.stale = True
+    return response
+
+@app.post("/api/time_series", response_model=TimeSeriesResponse, dependencies=[Depends(rate_limit.charge("time_series"))])
+@ee_executor.endpoint(ee_executor.BATCH, fallback=_stale_time_series)
+def get_time_series(req: TimeSeriesRequest, http_request: Request = None):
     """
-    Retorna séries temporais de dados ambientais para a área especificada
+    Retorna séries temporais de dados ambientais para a área especificada.
+    Se o cliente desconectar, a busca para na próxima imagem.
     """
     try:
         # Criar geometria
@@ -1523,127 +2324,34 @@ async def get_time_series(req: TimeSeriesRequest):
         
         print(f"📊 Buscando time series de {req.start_date} a {req.end_date}")
         
-        # Coleções
-        modis_lst = ee.ImageCollection('MODIS/061/MOD11A2') \
-            .filterBounds(geometry) \
-            .filterDate(req.start_date, req.end_date) \
-            .select('LST_Day_1km')
-        
-        s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
-            .filterBounds(geometry) \
-            .filterDate(req.start_date, req.end_date) \
-            .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 10))
-        
-        # Criar dicionário de dados por data
-        data_by_date = {}
-        
-        # Processar MODIS LST (temperatura)
-        modis_list = modis_lst.toList(1000)
-        modis_size = modis_lst.size().getInfo()
-        print(f"🌡️ Processando {modis_size} imagens MODIS LST")
-        
-        for i in range(min(modis_size, 100)):  # Limitar a 100 pontos
-            try:
-                img = ee.Image(modis_list.get(i))
-                timestamp = img.get('system:time_start').getInfo()
-                date_str = datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d')
-                
-                # Calcular temperatura média
-                lst_celsius = img.multiply(0.02).subtract(273.15)
-                temp_stats = lst_celsius.reduceRegion(
-                    reducer=ee.Reducer.mean(),
-                    geometry=geometry,
-                    scale=1000,
-                    maxPixels=1e9
-                ).getInfo()
-                
-                temp_val = temp_stats.get('LST_Day_1km')
-                if temp_val is not None:
-                    if date_str not in data_by_date:
-                        data_by_date[date_str] = {}
-                    data_by_date[date_str]['temperature'] = round(float(temp_val), 2)
-            except Exception as e:
-                print(f"⚠️ Erro MODIS no índice {i}: {e}")
-                continue
-        
-        # Processar Sentinel-2 (NDVI e NDWI)
-        s2_list = s2.toList(1000)
-        s2_size = s2.size().getInfo()
-        print(f"🌿 Processando {s2_size} imagens Sentinel-2")
-        
-        for i in range(min(s2_size, 100)):  # Limitar a 100 pontos
-            try:
-                img = ee.Image(s2_list.get(i))
-                timestamp = img.get('system:time_start').getInfo()
-                date_str = datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d')
-                
-                # NDVI
-                ndvi_img = img.normalizedDifference(['B8', 'B4'])
-                ndvi_stats = ndvi_img.reduceRegion(
-                    reducer=ee.Reducer.mean(),
-                    geometry=geometry,
-                    scale=100,
-                    maxPixels=1e9
-                ).getInfo()
-                
-                ndvi_val = ndvi_stats.get('nd')
-                
-                # NDWI
-                ndwi_img = img.normalizedDifference(['B3', 'B8'])
-                ndwi_stats = ndwi_img.reduceRegion(
-                    reducer=ee.Reducer.mean(),
-                    geometry=geometry,
-                    scale=100,
-                    maxPixels=1e9
-                ).getInfo()
-                
-                ndwi_val = ndwi_stats.get('nd')
-                
-                if date_str not in data_by_date:
-                    data_by_date[date_str] = {}
-                
-                if ndvi_val is not None:
-                    data_by_date[date_str]['ndvi'] = round(float(ndvi_val), 3)
-                if ndwi_val is not None:
-                    data_by_date[date_str]['ndwi'] = round(float(ndwi_val), 3)
-                    
-            except Exception as e:
-                print(f"⚠️ Erro S2 no índice {i}: {e}")
-                continue
-        
-        # Converter dicionário para lista ordenada
-        timeseries = []
-        temp_count = 0
-        ndvi_count = 0
-        ndwi_count = 0
-        
-        for date_str in sorted(data_by_date.keys()):
-            data = data_by_date[date_str]
-            temp_val = data.get('temperature')
-            ndvi_val = data.get('ndvi')
-            ndwi_val = data.get('ndwi')
-            
-            if temp_val is not None:
-                temp_count += 1
-            if ndvi_val is not None:
-                ndvi_count += 1
-            if ndwi_val is not None:
-                ndwi_count += 1
-            
-            timeseries.append(TimeSeriesDataPoint(
-                date=date_str,
-                temperature=temp_val,
-                ndvi=ndvi_val,
-                ndwi=ndwi_val,
-                precipitation=None  # TODO: Adicionar dados de precipitação
-            ))
-        
-        print(f"✅ Time series gerado: {len(timeseries)} pontos | Temp: {temp_count} | NDVI: {ndvi_count} | NDWI: {ndwi_count}")
-        
-        return TimeSeriesResponse(
-            timeseries=timeseries,
-            total_points=len(timeseries)
-        )
+        # Composições por período (semana/mês/estação): uma chamada ao EE para a janela toda
+        if req.resolution:
+            store_params = {"resolution": req.resolution}
+            cached = result_store.get_result("time_series", coords, req.start_date, req.end_date, store_params,
+                                             raw=True)
+            if cached is not None:
+                return fast_json.raw(cached)  # Já serializado no armazenamento
+            points = _composite_time_series(geometry, req.start_date, req.end_date, req.resolution)
+            print(f"✅ Time series ({req.resolution}): {len(points)} períodos")
+            response = TimeSeriesResponse(timeseries=points, total_points=len(points), resolution=req.resolution)
+            result_store.save_result("time_series", coords, req.start_date, req.end_date,
+                                     response.dict(), store_params)
+            return fast_json.FastJSONResponse(response)
+        
+        # Observações por sensor: o que já foi buscado vem do SQLite, só as lacunas vão ao EE
+        data_by_date: Dict[str, Dict[str, Any]] = {}
+        skipped: List[str] = []
+        for sensor in TIME_SERIES_SENSORS:
+            observations, sensor_skipped = _sensor_observations(sensor, coords, geometry, req.start_date, req.end_date)
+            for date_str, values in observations.items():
+                data_by_date.setdefault(date_str, {}).update(values)
+            skipped.extend(sensor_skipped)
+        
+        response = _observations_response(data_by_date)
+        if skipped:
+            print(f"⏱️ Série temporal parcial, faltando: {skipped}")
+            response.partial, response.skipped = True, skipped
+        return fast_json.FastJSONResponse(response)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao gerar séries temporais: {str(e)}")
@@ -1657,6 +2365,11 @@ class TimelapseRequest(BaseModel):
     start_date: str
     end_date: str
     layer_type: str = "NDVI"
+    mode: str = Field(default="frames", pattern="^(frames|video)$")  # video: um único GIF/MP4
+    video_format: str = Field(default="gif", pattern="^(gif|mp4)$")
+    dimensions: int = Field(default=512, ge=64, le=1080)
+    fps: int = Field(default=4, ge=1, le=30)
+    max_frames: int = Field(default=100, ge=1, le=300)
 
 class TimelapseFrame(BaseModel):
     date: str
@@ -1667,11 +2380,17 @@ class TimelapseFrame(BaseModel):
 class TimelapseResponse(BaseModel):
     frames: List[TimelapseFrame]
     total_frames: int
+    video_url: Optional[str] = None  # Com mode=video: arquivo único, servido com Range
+    partial: bool = False  # Prazo da requisição esgotou antes de todos os frames
+    skipped: List[str] = []
 
-@app.post("/api/timelapse", response_model=TimelapseResponse)
-async def get_timelapse(req: TimelapseRequest):
+@app.post("/api/timelapse", response_model=TimelapseResponse, dependencies=[Depends(rate_limit.charge("timelapse"))])
+@ee_executor.endpoint(ee_executor.BATCH)
+def get_timelapse(req: TimelapseRequest, http_request: Request = None):
     """
-    Gera sequência de imagens (timelapse) para a área especificada
+    Gera sequência de imagens (timelapse) para a área especificada.
+    Com mode=video, a coleção processada vira um único GIF/MP4 renderizado
+    no EE, cacheado em disco e servido por /api/timelapse/video/{arquivo}.
     """
     try:
         # Criar geometria
@@ -1679,6 +2398,20 @@ async def get_timelapse(req: TimelapseRequest):
         if coords[0] != coords[-1]:
             coords.append(coords[0])
         
+        video_key = None
+        if req.mode == "video":
+            video_key = timelapse_video.video_key(
+                coords, req.start_date, req.end_date, req.layer_type,
+                req.video_format, req.dimensions, req.fps, req.max_frames,
+            )
+            cached = timelapse_video.cached_video(video_key, req.video_format)
+            if cached is not None:
+                print(f"♻️ Timelapse em cache: {video_key}.{req.video_format}")
+                return fast_json.FastJSONResponse(TimelapseResponse(
+                    frames=[], total_frames=cached["frames"],
+                    video_url=timelapse_video.video_url(video_key, req.video_format, _base_url(http_request)),
+                ))
+        
         geometry = ee.Geometry.Polygon([coords])
         centroid = geometry.centroid().coordinates().getInfo()
         
@@ -1769,23 +2502,37 @@ async def get_timelapse(req: TimelapseRequest):
             
             processed = collection.map(process_rgb)
         
+        if video_key is not None:
+            meta = timelapse_video.render_video(
+                processed, geometry, video_key, req.video_format, req.dimensions, req.fps, req.max_frames
+            )
+            return fast_json.FastJSONResponse(TimelapseResponse(
+                frames=[], total_frames=meta["frames"],
+                video_url=timelapse_video.video_url(video_key, req.video_format, _base_url(http_request)),
+            ))
+        
         # Obter lista de imagens
         img_list = processed.toList(100)  # Limitar a 100 frames
         size = img_list.size().getInfo()
         
         frames = []
-        for i in range(min(size, 100)):
+        total = min(size, 100)
+        skipped = []
+        for i in range(total):
+            ee_executor.check_cancelled()  # Cliente desconectou: para antes do próximo frame
+            if ee_executor.deadline_near():
+                skipped.append(f"frames {i + 1} a {total} de {total} (prazo da requisição)")
+                print(f"⏱️ Timelapse parcial: {i} de {total} frames")
+                break
             try:
                 img = ee.Image(img_list.get(i))
                 timestamp = img.get('system:time_start').getInfo()
                 date = datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d')
                 
-                # Gerar tile URL (imagem completa)
-                map_id = img.getMapId({
-                    'dimensions': 512,
-                    'region': geometry,
-                    'format': 'png'
-                })
+                # Gerar tile URL (imagem completa), servida pelo proxy de tiles.
+                # Os frames já vêm visualizados, então a camada vai sem vis_params
+                # (dimensions/region são de thumbnail e não servem para tiles)
+                layer_key = tile_proxy.register_layer(img)
                 
                 # Thumbnail (menor resolução)
                 thumbnail_url = img.getThumbUrl({
@@ -1805,9 +2552,9 @@ async def get_timelapse(req: TimelapseRequest):
                 except:
                     pass
                 
-                frames.append(TimelapseFrame(
+                frames.append(TimelapseFrame.construct(
                     date=date,
-                    image_url=map_id['tile_fetcher'].url_format,
+                    image_url=tile_proxy.proxy_url(layer_key, _base_url(http_request)),
                     thumbnail_url=thumbnail_url,
                     cloud_cover=cloud_cover
                 ))
@@ -1816,30 +2563,123 @@ async def get_timelapse(req: TimelapseRequest):
                 print(f"Erro ao processar frame {i}: {e}")
                 continue
         
-        return TimelapseResponse(
+        return fast_json.FastJSONResponse(TimelapseResponse.construct(
             frames=frames,
-            total_frames=len(frames)
-        )
+            total_frames=len(frames),
+            partial=bool(skipped),
+            skipped=skipped
+        ))
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao gerar timelapse: {str(e)}")
 
 
+def _tile_response(body: bytes) -> Response:
+    return Response(content=body, media_type="image/png", headers={"Cache-Control": "public, max-age=86400"})
+
+def _stale_raster_tile(layer_key: str, z: int, x: int, y: int) -> Optional[Response]:
+    body = tile_proxy.cached_tile(layer_key, z, x, y)
+    return _tile_response(body) if body is not None else None
+
+@app.get("/api/tiles/{layer_key}/{z}/{x}/{y}.png")
+@ee_executor.endpoint(ee_executor.INTERACTIVE, fallback=_stale_raster_tile)
+def get_raster_tile(layer_key: str, z: int, x: int, y: int):
+    """Tile PNG de uma camada EE registrada (cache em disco, map ID renovado sob demanda)."""
+    if not re.fullmatch(r"[0-9a-f]{40}", layer_key):
+        raise HTTPException(status_code=400, detail="Chave de camada inválida")
+    return _tile_response(tile_proxy.get_tile(layer_key, z, x, y))
+
+
+@app.get("/api/timelapse/video/{filename}")
+def get_timelapse_video(filename: str):
+    """Vídeo do timelapse em cache, com suporte a Range (206) para streaming."""
+    return timelapse_video.video_response(timelapse_video.resolve_video(filename))
+
+
 # =========================
 # Health
 # =========================
+def _probe_gee():
+    ee.Number(1).getInfo()
+
+def _probe_llm():
+    from .agent_sacy_chat import sacy_chat_agent
+    if sacy_chat_agent is None:
+        raise RuntimeError("Agente não inicializado. Verifique GOOGLE_API_KEY.")
+    sacy_chat_agent.client.models.get(model="gemini-2.0-flash-exp")
+
+health_prober.register("gee", _probe_gee, required=True)
+health_prober.register("llm", _probe_llm, required=False)
+
+@app.on_event("startup")
+async def start_health_prober():
+    health_prober.start()
+
+@app.on_event("startup")
+async def build_geodata_sidecars():
+    # Ingestão dos GeoJSON da pasta data em segundo plano (sidecars GeoParquet + grades agregadas)
+    def ingest():
+        geo_processor.build_all_sidecars()
+        grid_index.build_all_grids()
+    threading.Thread(target=ingest, name="geodata-ingest", daemon=True).start()
+
+@app.on_event("startup")
+async def start_cache_warmup():
+    warmup.start()
+
+@app.on_event("shutdown")
+async def stop_health_prober():
+    health_prober.stop()
+    warmup.stop()
+    ee_executor.shutdown()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await services.close_http_client()
+    tile_proxy.close()
+
+@app.get("/api/warmup/status")
+def get_warmup_status():
+    """Estado do pré-aquecimento de caches por área configurada."""
+    return warmup.status()
+
 @app.get("/health")
 async def health_check():
-    gee_status = "ok"
-    try:
-        ee.Number(1).getInfo()
-    except Exception:
-        gee_status = "error"
+    """Estado em cache dos serviços externos (não chama o GEE na requisição)."""
+    services = health_prober.snapshot()
+    ready = health_prober.is_ready(services)
     return {
-        "status": "ok" if gee_status == "ok" else "degraded",
-        "services": {"gee": gee_status},
+        "status": "ok" if ready else "degraded",
+        "ready": ready,
+        "services": services,
+        "probe_interval_seconds": health_prober.interval,
+        "prober_alive": health_prober.is_alive(),
+        "ee_executor": ee_executor.snapshot(),
+        "uptime_seconds": round(time.time() - health_prober.started_at, 1),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+@app.get("/health/live")
+async def liveness_check():
+    """
+    Liveness: o processo responde. Não depende de serviços externos nem do
+    prober (se ele parar, o estado envelhece e só a readiness cai).
+    """
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: GEE respondeu na última sondagem e o estado não está velho."""
+    services = health_prober.snapshot()
+    ready = health_prober.is_ready(services)
+    content = {
+        "status": "ready" if ready else "not_ready",
+        "services": services,
         "timestamp": datetime.now().isoformat(),
     }
+    return JSONResponse(status_code=200 if ready else 503, content=content)
 
 
 # =========================
@@ -1848,23 +2688,54 @@ async def health_check():
 class PlanetaryComputerRequest(BaseModel):
     polygon: List[Coordinate]
     layer_type: str = "LST"  # LST or URBANIZATION
+    start_date: Optional[str] = None  # Padrão: últimos STAC_DEFAULT_WINDOW_DAYS dias
+    end_date: Optional[str] = None
+    max_cloud_cover: float = Field(default=10.0, ge=0, le=100)
 
 class PlanetaryComputerResponse(BaseModel):
     tile_url: str
     date: str
     source: str
 
+class PlanetaryComputerSearchRequest(BaseModel):
+    polygon: List[Coordinate]
+    start_date: Optional[str] = None  # Padrão: últimos STAC_DEFAULT_WINDOW_DAYS dias
+    end_date: Optional[str] = None
+    max_cloud_cover: float = Field(default=10.0, ge=0, le=100)
+    limit: int = Field(default=5, ge=1, le=50)
+
+class PlanetaryComputerSearchResponse(BaseModel):
+    scenes: List[Dict[str, Any]]
+    period: Dict[str, str]
+
+@app.post("/api/planetary_computer/search", response_model=PlanetaryComputerSearchResponse)
+async def search_planetary_computer_scenes(request: PlanetaryComputerSearchRequest):
+    """
+    Cenas Sentinel-2 L2A do Planetary Computer que intersectam o polígono,
+    menos nubladas primeiro. Busca assíncrona e paginada sob demanda, que
+    para nas `limit` primeiras (ver services.search_planetary_computer).
+    """
+    date_from, date_to = stac_catalog.datetime_range(request.start_date, request.end_date).split("/")
+    scenes = await services.search_planetary_computer(
+        date_from=date_from,
+        date_to=date_to,
+        cloud_cover=request.max_cloud_cover,
+        polygon=[[c.lng, c.lat] for c in request.polygon],
+        limit=request.limit,
+    )
+    return PlanetaryComputerSearchResponse(scenes=scenes, period={"start": date_from, "end": date_to})
+
 @app.post("/api/planetary_computer", response_model=PlanetaryComputerResponse)
-async def get_planetary_computer_layer(request: PlanetaryComputerRequest):
+def get_planetary_computer_layer(request: PlanetaryComputerRequest):
     """
     Obtém camadas do Microsoft Planetary Computer:
     - URBANIZATION: Sentinel-2 False Color para visualização urbana
     (Nota: MODIS_LST foi substituído por LST, UHI e UTFVI usando Landsat 8/9)
+
+    Uma única busca STAC limitada (janela de datas, max_items, ordenada por
+    nuvens) com cliente e URLs assinadas reaproveitados (ver stac_catalog.py).
     """
     try:
-        from pystac_client import Client
-        import planetary_computer as pc
-        
         # Converter polígono para GeoJSON
         coords = [[c.lng, c.lat] for c in request.polygon]
         if coords[0] != coords[-1]:
@@ -1875,41 +2746,21 @@ async def get_planetary_computer_layer(request: PlanetaryComputerRequest):
             "coordinates": [coords]
         }
         
-        # Conectar ao catálogo
-        catalog = Client.open("https://planetarycomputer.microsoft.com/api/stac/v1")
-        
         if request.layer_type == "URBANIZATION":
             # Sentinel-2 para visualização de urbanização (falso-color)
-            search = catalog.search(
-                filter_lang="cql2-json",
-                filter={
-                    "op": "and",
-                    "args": [
-                        {"op": "s_intersects", "args": [{"property": "geometry"}, aoi]},
-                        {"op": "=", "args": [{"property": "collection"}, "sentinel-2-l2a"]},
-                        {"op": "<=", "args": [{"property": "eo:cloud_cover"}, 10]}
-                    ]
-                }
-            )
-            
-            items = list(search.get_items())
-            if not items:
+            window = stac_catalog.datetime_range(request.start_date, request.end_date)
+            item = stac_catalog.best_item("sentinel-2-l2a", aoi, window, request.max_cloud_cover)
+            if item is None:
                 raise HTTPException(status_code=404, detail="Nenhuma imagem Sentinel-2 encontrada com baixa cobertura de nuvens")
             
-            first_item = items[0]
-            signed_item = pc.sign_item(first_item)
-            
             # URL para renderização (visual ou rendered_preview)
-            if 'rendered_preview' in signed_item.assets:
-                tile_url = signed_item.assets['rendered_preview'].href
-            elif 'visual' in signed_item.assets:
-                tile_url = signed_item.assets['visual'].href
-            else:
-                tile_url = list(signed_item.assets.values())[0].href
+            tile_url = stac_catalog.signed_href(item, ["rendered_preview", "visual"])
+            if tile_url is None:
+                raise HTTPException(status_code=404, detail="Item Sentinel-2 sem assets disponíveis")
             
             return PlanetaryComputerResponse(
                 tile_url=tile_url,
-                date=first_item.datetime.strftime("%Y-%m-%d") if first_item.datetime else "N/A",
+                date=item.datetime.strftime("%Y-%m-%d") if item.datetime else "N/A",
                 source="Sentinel-2 L2A (False Color Urban)"
             )
         
@@ -0,0 +1,93 @@
+# backend/app/models.py - Tabelas SQLAlchemy (SQLite definido em database.py)
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Integer, String, Text, UniqueConstraint
+
+from .database import Base
+
+
+class AnalysisResult(Base):
+    """
+    Resultado de um endpoint de análise para (polígono canônico, parâmetros,
+    janela de datas). Janelas fechadas valem para sempre; janelas abertas
+    (que terminam perto de hoje) valem só até `valid_until`.
+    """
+    __tablename__ = "analysis_results"
+    __table_args__ = (
+        UniqueConstraint("endpoint", "polygon_key", "params_key", "start_date", "end_date", name="uq_analysis_result"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    endpoint = Column(String(64), nullable=False)
+    polygon_key = Column(String(64), nullable=False, index=True)
+    params_key = Column(String(64), nullable=False)
+    start_date = Column(String(10), nullable=False)
+    end_date = Column(String(10), nullable=False)
+    closed = Column(Boolean, nullable=False, default=False)
+    valid_until = Column(DateTime, nullable=True)  # None = permanente
+    payload = Column(Text, nullable=False)  # JSON da resposta
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Observation(Base):
+    """
+    Observação de um sensor em uma data para um polígono canônico
+    (ex.: temperatura MODIS, NDVI/NDWI Sentinel-2). `values` é um JSON
+    pequeno com as variáveis do sensor naquela data.
+    """
+    __tablename__ = "observations"
+    __table_args__ = (
+        UniqueConstraint("polygon_key", "sensor", "date", name="uq_observation"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    polygon_key = Column(String(64), nullable=False)
+    sensor = Column(String(32), nullable=False)
+    date = Column(String(10), nullable=False)
+    values = Column(Text, nullable=False)
+
+
+class ObservationCoverage(Base):
+    """
+    Intervalo [start_date, end_date) já buscado no EE para (polígono, sensor).
+    Datas cobertas sem linha em `observations` são dias sem imagem válida.
+    """
+    __tablename__ = "observation_coverage"
+
+    id = Column(Integer, primary_key=True)
+    polygon_key = Column(String(64), nullable=False, index=True)
+    sensor = Column(String(32), nullable=False)
+    start_date = Column(String(10), nullable=False)
+    end_date = Column(String(10), nullable=False)  # exclusivo
+
+
+class TileLayer(Base):
+    """
+    Camada raster servida por /api/tiles/{layer_key}/... . Guarda a expressão
+    EE serializada e os parâmetros de visualização para que qualquer worker
+    (ou o mesmo após reiniciar) consiga gerar um novo map ID quando o atual
+    expira. `url_format` é o último map ID obtido.
+    """
+    __tablename__ = "tile_layers"
+
+    id = Column(Integer, primary_key=True)
+    layer_key = Column(String(40), nullable=False, unique=True)
+    expression = Column(Text, nullable=False)  # ee.Image.serialize()
+    vis_params = Column(Text, nullable=True)  # JSON
+    url_format = Column(Text, nullable=True)
+    mapid_created_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class RateBucket(Base):
+    """
+    Balde de tokens de um cliente (chave `ip:<endereço>`) para os endpoints caros.
+    Compartilhado entre os workers do gunicorn pelo SQLite; `updated_at` é o
+    instante (epoch) do último débito e serve de versão na atualização.
+    """
+    __tablename__ = "rate_buckets"
+
+    client_key = Column(String(128), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
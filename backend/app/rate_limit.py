@@ -0,0 +1,122 @@
+# backend/app/rate_limit.py - Controle de admissão por cliente para endpoints caros
+"""
+Baldes de tokens por cliente, com custo declarado por endpoint.
+
+Cada cliente (IP) tem um balde de
+RATE_LIMIT_CAPACITY tokens que se recarrega a RATE_LIMIT_REFILL_PER_MINUTE
+tokens por minuto. Cada chamada debita o custo do endpoint (ENDPOINT_COSTS);
+sem saldo, a resposta é 429 com Retry-After indicando quando haverá tokens
+suficientes. Protege a cota do projeto GEE e a chave do Gemini de um script
+ou de um frontend em loop.
+
+O estado fica no SQLite (tabela rate_buckets), compartilhado pelos workers do
+gunicorn. A atualização é otimista: o débito só vale se `updated_at` não
+mudou desde a leitura; em conflito, lê de novo. Falhas do banco liberam a
+requisição (o limite não pode derrubar a API).
+
+O IP vem do X-Forwarded-For contado a partir da direita: cada proxy confiável
+acrescenta o endereço de quem o chamou no fim, então só as últimas
+RATE_LIMIT_PROXY_HOPS entradas são confiáveis. As anteriores (e qualquer
+outro header) são escritas pelo cliente e trocá-las não pode render um balde novo.
+"""
+import math
+import os
+import time
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from .database import SessionLocal
+from .models import RateBucket
+from .result_store import init_store
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_CAPACITY = float(os.getenv("RATE_LIMIT_CAPACITY", "60"))
+RATE_LIMIT_REFILL_PER_MINUTE = float(os.getenv("RATE_LIMIT_REFILL_PER_MINUTE", "20"))
+# Proxies confiáveis na frente da API (0 = conexão direta, usa o IP do socket; o
+# render.yaml define 1). Sem proxy, o X-Forwarded-For é do cliente e não pode valer
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+MAX_ATTEMPTS = 5
+
+# Custo em tokens de cada endpoint protegido
+ENDPOINT_COSTS = {
+    "analyze_area": 10,
+    "time_series": 8,
+    "timelapse": 15,
+    "batch_analysis": 20,
+    "agent_analyze": 10,
+    "agent_chat": 4,
+}
+
+
+def client_key(request: Request) -> str:
+    """IP do cliente como visto pelo proxy confiável mais externo."""
+    if RATE_LIMIT_PROXY_HOPS > 0:
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if len(hops) >= RATE_LIMIT_PROXY_HOPS:
+            return f"ip:{hops[-RATE_LIMIT_PROXY_HOPS]}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def _refill(tokens: float, updated_at: float, now: float) -> float:
+    return min(RATE_LIMIT_CAPACITY, tokens + (now - updated_at) * RATE_LIMIT_REFILL_PER_MINUTE / 60.0)
+
+def consume(key: str, cost: float, now: Optional[float] = None) -> Tuple[bool, float]:
+    """
+    Debita `cost` do balde do cliente. Retorna (admitido, segundos até haver
+    saldo suficiente; 0 quando admitido).
+    """
+    init_store()
+    for _ in range(MAX_ATTEMPTS):
+        t = now if now is not None else time.time()
+        with SessionLocal() as db:
+            row = db.get(RateBucket, key)
+            if row is None:
+                if cost > RATE_LIMIT_CAPACITY:
+                    return False, math.inf
+                db.add(RateBucket(client_key=key, tokens=RATE_LIMIT_CAPACITY - cost, updated_at=t))
+                try:
+                    db.commit()
+                    return True, 0.0
+                except IntegrityError:
+                    db.rollback()  # Outro worker criou o balde; tenta de novo
+                    continue
+
+            available = _refill(row.tokens, row.updated_at, t)
+            if available < cost:
+                wait = (cost - available) * 60.0 / RATE_LIMIT_REFILL_PER_MINUTE if RATE_LIMIT_REFILL_PER_MINUTE else math.inf
+                return False, wait
+            result = db.execute(
+                update(RateBucket)
+                .where(RateBucket.client_key == key, RateBucket.updated_at == row.updated_at)
+                .values(tokens=available - cost, updated_at=t)
+            )
+            db.commit()
+            if result.rowcount == 1:
+                return True, 0.0
+        # Conflito com outro worker: relê o balde
+    return True, 0.0
+
+def charge(endpoint: str) -> Callable[[Request], None]:
+    """Dependência FastAPI que debita o custo do endpoint ou responde 429."""
+    cost = ENDPOINT_COSTS[endpoint]
+
+    def dependency(request: Request) -> None:
+        if not RATE_LIMIT_ENABLED:
+            return
+        key = client_key(request)
+        try:
+            admitted, wait = consume(key, cost)
+        except SQLAlchemyError as e:
+            print(f"⚠️ Controle de admissão indisponível: {e}")
+            return
+        if not admitted:
+            retry_after = max(1, math.ceil(wait)) if math.isfinite(wait) else 3600
+            print(f"🚦 429 para {key} em {endpoint} (custo {cost}, tentar em {retry_after}s)")
+            raise HTTPException(
+                status_code=429,
+                detail=f"Limite de uso atingido para {endpoint}. Tente novamente em {retry_after}s.",
+                headers={"Retry-After": str(retry_after)},
+            )
+    return dependency
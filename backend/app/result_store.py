@@ -0,0 +1,321 @@
+# backend/app/result_store.py - Armazenamento persistente de resultados de análise
+"""
+Cache durável (SQLite, via database.py) dos resultados de /api/get_analysis_data,
+/api/analyze_area e /api/time_series.
+
+Para os resultados agregados a chave é (endpoint, polígono canônico,
+parâmetros, janela de datas):
+
+- polígono canônico: coordenadas arredondadas, sem o vértice de fechamento,
+  orientação anti-horária e começando no menor vértice; o mesmo polígono
+  desenhado a partir de outro ponto ou no outro sentido gera a mesma chave
+- janela fechada (termina antes de hoje - RESULT_SETTLE_DAYS): o resultado não
+  muda mais e fica guardado para sempre
+- janela aberta: os dados recentes ainda podem chegar (composições MODIS de
+  8 dias, processamento do Sentinel-2). O resultado tem dois prazos:
+  até RESULT_SOFT_TTL_HOURS é servido como está; entre esse e
+  RESULT_HARD_TTL_HOURS é servido na hora enquanto o endpoint o recalcula em
+  segundo plano (stale-while-revalidate, via `refresh`); depois disso é
+  recalculado na requisição. Janelas que terminam "hoje" andam um dia por
+  dia, então com `refresh` também vale o resultado da mesma janela
+  (mesma duração) calculado nos dias anteriores
+
+Séries temporais são guardadas como observações por (polígono, sensor, data),
+com os intervalos já buscados registrados à parte. Um pedido calcula quais
+trechos da janela ainda faltam, busca só esses no EE e junta com o resto:
+ampliar a janela de 6 para 12 meses ou voltar a uma área custa só as datas novas.
+"""
+import contextvars
+import functools
+import hashlib
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from .database import Base, SessionLocal, engine
+from .models import AnalysisResult, Observation, ObservationCoverage
+
+# Dias até uma data ser considerada definitiva nas coleções de satélite
+RESULT_SETTLE_DAYS = int(os.getenv("RESULT_SETTLE_DAYS", "10"))
+# Janelas abertas: fresco até o prazo curto, servido vencido (e revalidado) até o longo
+RESULT_SOFT_TTL = timedelta(hours=float(os.getenv("RESULT_SOFT_TTL_HOURS", "6")))
+RESULT_HARD_TTL = timedelta(hours=float(os.getenv("RESULT_HARD_TTL_HOURS", "72")))
+# Quantos resultados anteriores da mesma área examinar atrás da janela deslocada
+SLIDING_CANDIDATES = 10
+POLYGON_PRECISION = 6
+
+_initialized = False
+# Ligado durante uma revalidação: get_result ignora o que está guardado
+_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar("result_store_bypass", default=False)
+
+
+def init_store() -> None:
+    """Cria as tabelas (idempotente)."""
+    global _initialized
+    if not _initialized:
+        Base.metadata.create_all(bind=engine)
+        _initialized = True
+
+
+# =========================
+# Chaves canônicas
+# =========================
+def canonical_polygon(coords: Sequence[Sequence[float]]) -> List[Tuple[float, float]]:
+    """Anel [lng, lat] normalizado (arredondado, aberto, anti-horário, começando no menor vértice)."""
+    ring = [(round(float(c[0]), POLYGON_PRECISION), round(float(c[1]), POLYGON_PRECISION)) for c in coords]
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+    # Remove vértices repetidos em sequência
+    ring = [p for i, p in enumerate(ring) if i == 0 or p != ring[i - 1]]
+    signed_area = sum(
+        ring[i][0] * ring[(i + 1) % len(ring)][1] - ring[(i + 1) % len(ring)][0] * ring[i][1]
+        for i in range(len(ring))
+    )
+    if signed_area < 0:
+        ring = ring[::-1]
+    start = ring.index(min(ring))
+    return ring[start:] + ring[:start]
+
+def polygon_key(coords: Sequence[Sequence[float]]) -> str:
+    return hashlib.sha256(json.dumps(canonical_polygon(coords)).encode("utf-8")).hexdigest()
+
+def params_key(params: Optional[Dict[str, Any]] = None) -> str:
+    return hashlib.sha256(json.dumps(params or {}, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+def stable_until(today: Optional[date] = None) -> date:
+    """Primeira data ainda não definitiva (datas anteriores não mudam mais)."""
+    return (today or date.today()) - timedelta(days=RESULT_SETTLE_DAYS)
+
+def is_closed(end_date: str, today: Optional[date] = None) -> bool:
+    """Janela que termina antes das datas ainda instáveis."""
+    return date.fromisoformat(end_date[:10]) <= stable_until(today)
+
+
+# =========================
+# Resultados agregados
+# =========================
+def get_result(endpoint: str, coords: Sequence[Sequence[float]], start_date: str, end_date: str,
+               params: Optional[Dict[str, Any]] = None,
+               refresh: Optional[Callable[[str], Any]] = None, raw: bool = False) -> Optional[Any]:
+    """
+    Resultado guardado e ainda utilizável, ou None (falhas do banco viram cache miss).
+    Com `raw`, devolve o JSON como foi guardado (texto), para responder sem
+    desserializar e serializar de novo.
+
+    Sem `refresh`, uma janela aberta só vale até RESULT_SOFT_TTL. Com ele, vale
+    até RESULT_HARD_TTL (ou é a mesma janela de dias anteriores) e, passado o
+    prazo curto, `refresh(chave)` é chamado para recalcular em segundo plano.
+    """
+    if _bypass.get():
+        return None
+    try:
+        found = _get_result(endpoint, coords, start_date, end_date, params, refresh is not None)
+    except SQLAlchemyError as e:
+        print(f"⚠️ Armazenamento de resultados indisponível: {e}")
+        return None
+    if found is None:
+        return None
+    payload, fresh = found
+    if not fresh:
+        refresh(f"{endpoint}:{polygon_key(coords)[:16]}:{params_key(params)[:8]}:{start_date[:10]}:{end_date[:10]}")
+    return payload if raw else json.loads(payload)
+
+def _window_days(start_date: str, end_date: str) -> int:
+    return (date.fromisoformat(end_date[:10]) - date.fromisoformat(start_date[:10])).days
+
+def _get_result(endpoint, coords, start_date, end_date, params, allow_stale):
+    """(payload em JSON, fresco?) ou None."""
+    init_store()
+    with SessionLocal() as db:
+        query = db.query(AnalysisResult).filter_by(
+            endpoint=endpoint, polygon_key=polygon_key(coords), params_key=params_key(params),
+        )
+        row = query.filter_by(start_date=start_date[:10], end_date=end_date[:10]).one_or_none()
+        if row is not None and row.closed:
+            return row.payload, True
+        shifted = False
+        if row is None and allow_stale and not is_closed(end_date):
+            # Mesma janela deslocada: o pedido de ontem para "últimos N dias"
+            span = _window_days(start_date, end_date)
+            candidates = (query.filter_by(closed=False).order_by(AnalysisResult.updated_at.desc())
+                          .limit(SLIDING_CANDIDATES).all())
+            row = next((c for c in candidates if c.end_date < end_date[:10]
+                        and _window_days(c.start_date, c.end_date) == span), None)
+            shifted = row is not None
+        if row is None:
+            return None
+        age = datetime.utcnow() - row.updated_at
+        if age <= RESULT_SOFT_TTL and not shifted:
+            return row.payload, True
+        if allow_stale and age <= RESULT_HARD_TTL:
+            return row.payload, False
+        return None
+
+def bypassing(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """`fn` executada ignorando o que está guardado (recalcula e regrava)."""
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        token = _bypass.set(True)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _bypass.reset(token)
+    return wrapper
+
+def stale_result(endpoint: str, coords: Sequence[Sequence[float]], params: Optional[Dict[str, Any]] = None,
+                 start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Resultado mais recente guardado para o polígono e parâmetros, mesmo vencido
+    e (sem datas) de qualquer janela. Usado como resposta de contingência
+    quando o Earth Engine está indisponível.
+    """
+    try:
+        init_store()
+        with SessionLocal() as db:
+            query = db.query(AnalysisResult).filter_by(
+                endpoint=endpoint, polygon_key=polygon_key(coords), params_key=params_key(params),
+            )
+            if start_date:
+                query = query.filter_by(start_date=start_date[:10])
+            if end_date:
+                query = query.filter_by(end_date=end_date[:10])
+            row = query.order_by(AnalysisResult.updated_at.desc()).first()
+            return json.loads(row.payload) if row is not None else None
+    except SQLAlchemyError as e:
+        print(f"⚠️ Armazenamento de resultados indisponível: {e}")
+        return None
+
+def save_result(endpoint: str, coords: Sequence[Sequence[float]], start_date: str, end_date: str,
+                payload: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> None:
+    """Guarda (ou substitui) o resultado; janelas abertas podem ser servidas até RESULT_HARD_TTL."""
+    try:
+        _save_result(endpoint, coords, start_date, end_date, payload, params)
+    except SQLAlchemyError as e:
+        print(f"⚠️ Falha ao guardar resultado: {e}")
+
+def _save_result(endpoint, coords, start_date, end_date, payload, params):
+    init_store()
+    closed = is_closed(end_date)
+    valid_until = None if closed else datetime.utcnow() + RESULT_HARD_TTL
+    key = dict(
+        endpoint=endpoint, polygon_key=polygon_key(coords), params_key=params_key(params),
+        start_date=start_date[:10], end_date=end_date[:10],
+    )
+    body = json.dumps(payload, ensure_ascii=False, default=str)
+    with SessionLocal() as db:
+        row = db.query(AnalysisResult).filter_by(**key).one_or_none()
+        if row is None:
+            db.add(AnalysisResult(closed=closed, valid_until=valid_until, payload=body, **key))
+        else:
+            row.closed, row.valid_until, row.payload = closed, valid_until, body
+            row.updated_at = datetime.utcnow()
+        try:
+            db.commit()
+        except IntegrityError:
+            # Outro worker gravou a mesma chave ao mesmo tempo; o resultado é equivalente
+            db.rollback()
+
+
+# =========================
+# Observações por data (séries temporais)
+# =========================
+def _merge_ranges(ranges: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Une intervalos [início, fim) sobrepostos ou encostados."""
+    merged: List[Tuple[str, str]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _coverage(db, pkey: str, sensor: str) -> List[Tuple[str, str]]:
+    rows = db.query(ObservationCoverage).filter_by(polygon_key=pkey, sensor=sensor).all()
+    return _merge_ranges([(r.start_date, r.end_date) for r in rows])
+
+def missing_ranges(coords: Sequence[Sequence[float]], sensor: str, start_date: str,
+                   end_date: str) -> List[Tuple[str, str]]:
+    """Partes de [start_date, end_date) ainda não buscadas para (polígono, sensor)."""
+    start, end = start_date[:10], end_date[:10]
+    try:
+        init_store()
+        with SessionLocal() as db:
+            covered = _coverage(db, polygon_key(coords), sensor)
+    except SQLAlchemyError as e:
+        print(f"⚠️ Cache de observações indisponível: {e}")
+        covered = []
+    gaps = []
+    cursor = start
+    for c_start, c_end in covered:
+        if c_end <= cursor or c_start >= end:
+            continue
+        if c_start > cursor:
+            gaps.append((cursor, c_start))
+        cursor = max(cursor, c_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+def get_observations(coords: Sequence[Sequence[float]], sensor: str, start_date: str,
+                     end_date: str) -> Dict[str, Dict[str, Any]]:
+    """Observações guardadas em [start_date, end_date), por data."""
+    try:
+        init_store()
+        with SessionLocal() as db:
+            rows = db.query(Observation).filter(
+                Observation.polygon_key == polygon_key(coords),
+                Observation.sensor == sensor,
+                Observation.date >= start_date[:10],
+                Observation.date < end_date[:10],
+            ).all()
+            return {r.date: json.loads(r.values) for r in rows}
+    except SQLAlchemyError as e:
+        print(f"⚠️ Cache de observações indisponível: {e}")
+        return {}
+
+def save_observations(coords: Sequence[Sequence[float]], sensor: str, start_date: str, end_date: str,
+                      observations: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Guarda as observações buscadas em [start_date, end_date) e marca o intervalo
+    como coberto. Só a parte já definitiva (antes de `stable_until`) é guardada;
+    datas recentes serão buscadas de novo no próximo pedido.
+    """
+    end = min(end_date[:10], stable_until().isoformat())
+    start = start_date[:10]
+    if end <= start:
+        return
+    pkey = polygon_key(coords)
+    try:
+        init_store()
+        with SessionLocal() as db:
+            existing = {
+                r.date: r for r in db.query(Observation).filter(
+                    Observation.polygon_key == pkey, Observation.sensor == sensor,
+                    Observation.date >= start, Observation.date < end,
+                ).all()
+            }
+            for day, values in observations.items():
+                if not (start <= day < end):
+                    continue
+                body = json.dumps(values)
+                if day in existing:
+                    existing[day].values = body
+                else:
+                    db.add(Observation(polygon_key=pkey, sensor=sensor, date=day, values=body))
+            merged = _merge_ranges(_coverage(db, pkey, sensor) + [(start, end)])
+            db.query(ObservationCoverage).filter_by(polygon_key=pkey, sensor=sensor).delete()
+            db.add_all([
+                ObservationCoverage(polygon_key=pkey, sensor=sensor, start_date=a, end_date=b)
+                for a, b in merged
+            ])
+            db.commit()
+    except IntegrityError:
+        # Outro worker buscou as mesmas datas ao mesmo tempo; fica a versão dele
+        pass
+    except SQLAlchemyError as e:
+        print(f"⚠️ Falha ao guardar observações: {e}")
@@ -1,55 +1,120 @@
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
 import httpx
-from pystac_client import Client
-from datetime import datetime, timezone
-import json
 
-# URL do Catálogo STAC do Planetary Computer
-STAC_URL = "https://planetarycomputer.microsoft.com/api/stac/v1"
+from .stac_catalog import STAC_URL
+
+# Tempo máximo de cada requisição ao STAC (segundos)
+STAC_HTTP_TIMEOUT = float(os.getenv("STAC_HTTP_TIMEOUT", "20"))
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP assíncrono compartilhado (pool de conexões keep-alive)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=STAC_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _http_client
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def iter_stac_items(body: Dict[str, Any], max_items: int, base_url: str = STAC_URL,
+                          client: Optional[httpx.AsyncClient] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Itens de um POST /search, página a página, parando em `max_items`.
+    A próxima página só é pedida quando a atual acaba (link rel="next").
+    """
+    client = client or get_http_client()
+    url: Optional[str] = f"{base_url.rstrip('/')}/search"
+    method, payload = "POST", dict(body)
+    yielded = 0
+    while url and yielded < max_items:
+        if method == "POST":
+            response = await client.post(url, json=payload)
+        else:
+            response = await client.get(url)
+        response.raise_for_status()
+        page = response.json()
+        for feature in page.get("features", []):
+            yield feature
+            yielded += 1
+            if yielded >= max_items:
+                return
+        next_link = next((l for l in page.get("links", []) if l.get("rel") == "next"), None)
+        if next_link is None:
+            return
+        url = next_link.get("href")
+        method = next_link.get("method", "GET").upper()
+        if method == "POST":
+            next_body = next_link.get("body") or {}
+            payload = {**payload, **next_body} if next_link.get("merge") else next_body
+
 
-async def search_planetary_computer(latitude: float, longitude: float, date_from: str, date_to: str, cloud_cover: float = 10.0):
+async def search_planetary_computer(latitude: Optional[float] = None, longitude: Optional[float] = None,
+                                    date_from: str = "", date_to: str = "", cloud_cover: float = 10.0,
+                                    polygon: Optional[Sequence[Sequence[float]]] = None, limit: int = 5,
+                                    base_url: str = STAC_URL,
+                                    client: Optional[httpx.AsyncClient] = None) -> List[Dict[str, Any]]:
     """
     Busca imagens Sentinel-2 no MPC para a área e período especificados.
+
+    A área é o polígono desenhado ([lng, lat]); sem polígono, um bbox de ±0.01°
+    em torno do ponto. Os itens vêm ordenados por nuvens no servidor e só os
+    `limit` primeiros são baixados. `base_url`/`client` permitem apontar para
+    outro servidor STAC (ex.: um STAC local em testes).
     """
     try:
-        # Define a área de interesse (Bounding Box simples para a POC)
-        # Para produção, você usaria um buffer maior e mais robusto.
-        buffer = 0.01  # Pequena área ao redor do ponto
-        bbox = [longitude - buffer, latitude - buffer, longitude + buffer, latitude + buffer]
-        
-        # Conecta ao cliente STAC
-        catalog = Client.open(STAC_URL)
-
-        # Realiza a busca. Usando Sentinel-2 L2A.
-        search = catalog.search(
-            collections=["sentinel-2-l2a"],
-            bbox=bbox,
-            datetime=f"{date_from}/{date_to}",
-            query={"eo:cloud_cover": {"lte": cloud_cover}}
-        )
+        body: Dict[str, Any] = {
+            "collections": ["sentinel-2-l2a"],
+            "datetime": f"{date_from}/{date_to}",
+            "query": {"eo:cloud_cover": {"lte": cloud_cover}},
+            "sortby": [
+                {"field": "properties.eo:cloud_cover", "direction": "asc"},
+                {"field": "properties.datetime", "direction": "desc"},
+            ],
+            "limit": limit,
+        }
+        if polygon:
+            ring = [[float(c[0]), float(c[1])] for c in polygon]
+            if ring[0] != ring[-1]:
+                ring.append(ring[0])
+            body["intersects"] = {"type": "Polygon", "coordinates": [ring]}
+        elif latitude is not None and longitude is not None:
+            buffer = 0.01  # Pequena área ao redor do ponto
+            body["bbox"] = [longitude - buffer, latitude - buffer, longitude + buffer, latitude + buffer]
+        else:
+            raise ValueError("Informe o polígono ou latitude/longitude")
 
-        items = search.get_all_items()
-        
         results = []
-        for item in items[:5]: # Limita a 5 resultados para agilidade
+        async for item in iter_stac_items(body, limit, base_url=base_url, client=client):
             # Extrai as URLs mais importantes
-            assets = item.assets
-            
+            assets = item.get("assets", {})
+
             # Tenta encontrar uma URL de visualização útil
-            visual_asset = assets.get('visual') or assets.get('B4') # Visual ou Banda 4 (vermelho)
-            
+            visual_asset = assets.get('visual') or assets.get('B04') or assets.get('B4')  # Visual ou Banda 4 (vermelho)
+
             if visual_asset:
+                props = item.get("properties", {})
                 results.append({
-                    "id": item.id,
-                    "datetime": item.datetime.isoformat(),
-                    "cloud_cover": item.properties.get('eo:cloud_cover'),
-                    "visual_url": visual_asset.href, # URL que o Cesium pode usar ou a IA analisar
-                    "center_coords": (latitude, longitude)
+                    "id": item.get("id"),
+                    "datetime": props.get("datetime"),
+                    "cloud_cover": props.get('eo:cloud_cover'),
+                    "visual_url": visual_asset.get("href"), # URL que o Cesium pode usar ou a IA analisar
+                    "center_coords": (latitude, longitude) if latitude is not None else None,
                 })
-        
+
         return results
 
     except Exception as e:
         print(f"Erro na busca STAC: {e}")
         return []
-
-# NOTA: O 'pystac-client' é uma dependência leve que usa apenas HTTP.
\ No newline at end of file
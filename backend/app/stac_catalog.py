@@ -0,0 +1,136 @@
+# backend/app/stac_catalog.py - Cliente STAC do Planetary Computer reaproveitado entre requisições
+"""
+Acesso ao catálogo STAC do Microsoft Planetary Computer para /api/planetary_computer.
+
+- O cliente (`Client.open`, que baixa o catálogo raiz) é criado uma única vez
+  por processo e reaproveitado.
+- Buscas são sempre limitadas: janela de datas, `max_items` e ordenação por
+  cobertura de nuvens no servidor, então o primeiro item já é o melhor e
+  nunca se pagina o histórico inteiro da coleção.
+- O item escolhido por (área, coleção, janela) fica em memória por
+  STAC_SEARCH_TTL segundos.
+- As URLs assinadas (token SAS) ficam em cache até o vencimento do token
+  (parâmetro `se` da URL), menos uma margem de segurança.
+"""
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+STAC_URL = os.getenv("STAC_URL", "https://planetarycomputer.microsoft.com/api/stac/v1")
+STAC_MAX_ITEMS = int(os.getenv("STAC_MAX_ITEMS", "10"))
+STAC_SEARCH_TTL = float(os.getenv("STAC_SEARCH_TTL", "3600"))
+# Janela padrão da busca quando o pedido não informa datas
+STAC_DEFAULT_WINDOW_DAYS = int(os.getenv("STAC_DEFAULT_WINDOW_DAYS", "120"))
+# Margem antes do vencimento do token SAS para assinar de novo (segundos)
+SIGNED_HREF_MARGIN = 300
+# Validade assumida quando a URL assinada não traz `se`
+SIGNED_HREF_FALLBACK_TTL = 1800
+
+_client = None
+_client_lock = threading.Lock()
+_search_cache: Dict[str, Tuple[float, Any]] = {}
+_signed_cache: Dict[Tuple[str, str, str], Tuple[float, str]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_client():
+    """Cliente STAC único do processo (o catálogo raiz é baixado só na primeira vez)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from pystac_client import Client
+                _client = Client.open(STAC_URL)
+                print(f"🛰️ Cliente STAC conectado: {STAC_URL}")
+    return _client
+
+
+def _search_key(collection: str, aoi: Dict[str, Any], window: str, max_cloud: float) -> str:
+    return json.dumps([collection, aoi, window, max_cloud], sort_keys=True)
+
+def best_item(collection: str, aoi: Dict[str, Any], window: str, max_cloud: float = 10.0):
+    """
+    Item menos nublado (e, no empate, mais recente) da coleção que intersecta
+    a área na janela `inicio/fim`, ou None. Uma única consulta limitada.
+    """
+    key = _search_key(collection, aoi, window, max_cloud)
+    now = time.time()
+    with _cache_lock:
+        cached = _search_cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+    search = get_client().search(
+        collections=[collection],
+        intersects=aoi,
+        datetime=window,
+        query={"eo:cloud_cover": {"lte": max_cloud}},
+        sortby=[
+            {"field": "properties.eo:cloud_cover", "direction": "asc"},
+            {"field": "properties.datetime", "direction": "desc"},
+        ],
+        max_items=STAC_MAX_ITEMS,
+        limit=STAC_MAX_ITEMS,
+    )
+    item = next(iter(search.items()), None)
+
+    with _cache_lock:
+        _search_cache[key] = (now + STAC_SEARCH_TTL, item)
+        # Descarta entradas vencidas para o dicionário não crescer sem limite
+        for k in [k for k, (expires, _) in _search_cache.items() if expires <= now]:
+            del _search_cache[k]
+    return item
+
+
+def _token_expiry(href: str) -> float:
+    """Vencimento (epoch) do token SAS embutido na URL assinada."""
+    values = parse_qs(urlparse(href).query).get("se")
+    if values:
+        try:
+            expires = datetime.fromisoformat(values[0].replace("Z", "+00:00"))
+            if expires.tzinfo is None:
+                expires = expires.replace(tzinfo=timezone.utc)
+            return expires.timestamp()
+        except ValueError:
+            pass
+    return time.time() + SIGNED_HREF_FALLBACK_TTL
+
+def signed_href(item, asset_keys: Sequence[str]) -> Optional[str]:
+    """
+    URL assinada do primeiro asset disponível entre `asset_keys` (ou do
+    primeiro asset do item), reaproveitada enquanto o token for válido.
+    """
+    key_name = next((k for k in asset_keys if k in item.assets), None)
+    if key_name is None:
+        if not item.assets:
+            return None
+        key_name = next(iter(item.assets))
+
+    cache_key = (item.collection_id or "", item.id, key_name)
+    now = time.time()
+    with _cache_lock:
+        cached = _signed_cache.get(cache_key)
+        if cached is not None and cached[0] - SIGNED_HREF_MARGIN > now:
+            return cached[1]
+
+    import planetary_computer as pc
+    href = pc.sign(item.assets[key_name].href)
+    with _cache_lock:
+        _signed_cache[cache_key] = (_token_expiry(href), href)
+        for k in [k for k, (expires, _) in _signed_cache.items() if expires - SIGNED_HREF_MARGIN <= now]:
+            del _signed_cache[k]
+    return href
+
+
+def datetime_range(start_date: Optional[str], end_date: Optional[str]) -> str:
+    """Intervalo STAC `inicio/fim`; sem datas, os últimos STAC_DEFAULT_WINDOW_DAYS dias."""
+    end = end_date[:10] if end_date else datetime.now(timezone.utc).date().isoformat()
+    if start_date:
+        start = start_date[:10]
+    else:
+        start = (date.fromisoformat(end) - timedelta(days=STAC_DEFAULT_WINDOW_DAYS)).isoformat()
+    return f"{start}/{end}"
@@ -0,0 +1,274 @@
+# backend/app/tile_proxy.py - Proxy de tiles raster do EE com cache em disco
+"""
+URLs de tile estáveis para as camadas do Earth Engine.
+
+`get_tile`, `get_dem` e `get_timelapse` registram a imagem aqui e devolvem
+`/api/tiles/{layer_key}/{z}/{x}/{y}.png` em vez da URL do map ID do EE, que
+expira em poucas horas e faz cada navegador buscar cada tile no EE.
+
+- layer_key: sha1 da expressão EE serializada + parâmetros de visualização;
+  a mesma camada pedida por usuários diferentes gera a mesma chave
+- a definição da camada fica no SQLite (tabela tile_layers), então qualquer
+  worker consegue recriar o map ID quando ele vence (por idade ou quando o EE
+  recusa o tile) sem o cliente perceber
+- os tiles são buscados com um cliente HTTP com pool de conexões e guardados
+  em `cache/tiles/`, limitado a TILE_CACHE_MAX_BYTES (remove os menos usados)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import ee
+import httpx
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from .database import SessionLocal
+from .geo_processor import CACHE_DIR
+from .models import TileLayer
+from .result_store import init_store
+
+TILE_DIR = CACHE_DIR / "tiles"
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Ao passar do limite, remove tiles até ficar abaixo desta fração
+TILE_CACHE_LOW_WATER = 0.9
+# Idade máxima de um map ID antes de pedir outro ao EE (segundos)
+TILE_MAPID_TTL = float(os.getenv("TILE_MAPID_TTL", str(3 * 3600)))
+TILE_FETCH_TIMEOUT = float(os.getenv("TILE_FETCH_TIMEOUT", "30"))
+TILE_MAX_ZOOM = 24
+# Base pública da API para montar as URLs (atrás de proxy reverso)
+PUBLIC_API_URL = os.getenv("PUBLIC_API_URL", "").rstrip("/")
+# Respostas do EE que indicam map ID vencido/inválido
+EXPIRED_STATUSES = {400, 401, 403, 404}
+
+_layers: Dict[str, Dict[str, Any]] = {}
+_layers_lock = threading.Lock()
+_refresh_locks: Dict[str, threading.Lock] = {}
+_http: Optional[httpx.Client] = None
+_http_lock = threading.Lock()
+_disk_bytes: Optional[int] = None
+_disk_lock = threading.Lock()
+
+
+def _http_client() -> httpx.Client:
+    """Cliente HTTP compartilhado (keep-alive com o servidor de tiles do EE)."""
+    global _http
+    if _http is None:
+        with _http_lock:
+            if _http is None:
+                _http = httpx.Client(
+                    timeout=TILE_FETCH_TIMEOUT,
+                    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                )
+    return _http
+
+def close() -> None:
+    global _http
+    if _http is not None:
+        _http.close()
+        _http = None
+
+
+# =========================
+# Registro de camadas
+# =========================
+def layer_key(expression: str, vis_params: Optional[Dict[str, Any]]) -> str:
+    payload = json.dumps([expression, vis_params or {}], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def proxy_url(key: str, base_url: str = "") -> str:
+    """URL do tile no formato {z}/{x}/{y} (absoluta quando há base)."""
+    base = PUBLIC_API_URL or base_url.rstrip("/")
+    return f"{base}/api/tiles/{key}/{{z}}/{{x}}/{{y}}.png"
+
+def key_from_url(url: str) -> str:
+    """layer_key de uma URL do proxy (absoluta ou relativa)."""
+    return url.rsplit("/api/tiles/", 1)[1].split("/", 1)[0]
+
+def _get_map_id(image: ee.Image, vis_params: Optional[Dict[str, Any]]) -> str:
+    map_id = image.getMapId(vis_params) if vis_params else image.getMapId()
+    return map_id["tile_fetcher"].url_format
+
+def register_layer(image: ee.Image, vis_params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Registra a camada e devolve a layer_key. O map ID é obtido já aqui, então
+    erros da expressão (coleção vazia etc.) continuam aparecendo no endpoint.
+    """
+    expression = image.serialize()
+    key = layer_key(expression, vis_params)
+    with _layers_lock:
+        layer = _layers.get(key)
+    if layer is not None and time.time() - layer["created"] < TILE_MAPID_TTL:
+        return key
+
+    url_format = _get_map_id(image, vis_params)
+    now = time.time()
+    with _layers_lock:
+        _layers[key] = {"image": image, "vis": vis_params, "url_format": url_format, "created": now}
+    _save_layer(key, expression, vis_params, url_format, now)
+    return key
+
+def _save_layer(key: str, expression: str, vis_params: Optional[Dict[str, Any]], url_format: str,
+                created: float) -> None:
+    try:
+        init_store()
+        with SessionLocal() as db:
+            row = db.query(TileLayer).filter_by(layer_key=key).one_or_none()
+            mapid_created = datetime.utcfromtimestamp(created)
+            if row is None:
+                db.add(TileLayer(
+                    layer_key=key, expression=expression, vis_params=json.dumps(vis_params, default=str),
+                    url_format=url_format, mapid_created_at=mapid_created,
+                ))
+            else:
+                row.url_format, row.mapid_created_at = url_format, mapid_created
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+    except SQLAlchemyError as e:
+        print(f"⚠️ Falha ao guardar camada de tiles: {e}")
+
+def _load_layer(key: str) -> Optional[Dict[str, Any]]:
+    """Camada em memória ou, na primeira vez neste worker, a partir do SQLite."""
+    with _layers_lock:
+        layer = _layers.get(key)
+    if layer is not None:
+        return layer
+    try:
+        init_store()
+        with SessionLocal() as db:
+            row = db.query(TileLayer).filter_by(layer_key=key).one_or_none()
+            if row is None:
+                return None
+            expression, vis_json = row.expression, row.vis_params
+            url_format, mapid_created = row.url_format, row.mapid_created_at
+    except SQLAlchemyError as e:
+        print(f"⚠️ Camadas de tiles indisponíveis: {e}")
+        return None
+    layer = {
+        "image": ee.Image(ee.deserializer.fromCloudApiJSON(expression)),
+        "vis": json.loads(vis_json) if vis_json else None,
+        "url_format": url_format,
+        # datetime salvo em UTC (naive)
+        "created": (mapid_created - datetime(1970, 1, 1)).total_seconds() if mapid_created else 0.0,
+    }
+    with _layers_lock:
+        return _layers.setdefault(key, layer)
+
+def _refresh_map_id(key: str, layer: Dict[str, Any], seen_url: Optional[str]) -> str:
+    """Novo map ID para a camada (uma única chamada ao EE por camada ao mesmo tempo)."""
+    with _layers_lock:
+        lock = _refresh_locks.setdefault(key, threading.Lock())
+    with lock:
+        # Outra thread já renovou enquanto esperávamos
+        if layer["url_format"] != seen_url and time.time() - layer["created"] < TILE_MAPID_TTL:
+            return layer["url_format"]
+        print(f"🔄 Renovando map ID da camada {key[:12]}")
+        url_format = _get_map_id(layer["image"], layer["vis"])
+        layer["url_format"], layer["created"] = url_format, time.time()
+        _save_layer(key, layer["image"].serialize(), layer["vis"], url_format, layer["created"])
+        return url_format
+
+
+# =========================
+# Cache em disco
+# =========================
+def tile_path(key: str, z: int, x: int, y: int) -> Path:
+    return TILE_DIR / key / str(z) / str(x) / f"{y}.png"
+
+def _scan_disk() -> Tuple[int, list]:
+    files = []
+    total = 0
+    for root, _, names in os.walk(TILE_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    return total, files
+
+def _account(added: int) -> None:
+    """Soma o tile novo ao total e, passando do limite, remove os menos usados."""
+    global _disk_bytes
+    with _disk_lock:
+        if _disk_bytes is None:
+            _disk_bytes = _scan_disk()[0]
+        else:
+            _disk_bytes += added
+        if _disk_bytes <= TILE_CACHE_MAX_BYTES:
+            return
+        total, files = _scan_disk()
+        target = TILE_CACHE_MAX_BYTES * TILE_CACHE_LOW_WATER
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        _disk_bytes = total
+        print(f"🧹 Cache de tiles: {removed} tiles removidos ({total / 1024 ** 2:.0f} MB)")
+
+
+# =========================
+# Tiles
+# =========================
+def _fetch(url_format: str, z: int, x: int, y: int) -> httpx.Response:
+    return _http_client().get(url_format.format(z=z, x=x, y=y))
+
+def cached_tile(key: str, z: int, x: int, y: int) -> Optional[bytes]:
+    """PNG do tile se estiver em disco (sem ir ao EE)."""
+    path = tile_path(key, z, x, y)
+    try:
+        body = path.read_bytes()
+        os.utime(path)  # Marca como usado recentemente
+        return body
+    except FileNotFoundError:
+        return None
+
+def get_tile(key: str, z: int, x: int, y: int) -> bytes:
+    """PNG do tile: do disco, ou do EE (renovando o map ID se necessário)."""
+    if not (0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Coordenadas de tile inválidas")
+    body = cached_tile(key, z, x, y)
+    if body is not None:
+        return body
+    path = tile_path(key, z, x, y)
+
+    layer = _load_layer(key)
+    if layer is None:
+        raise HTTPException(status_code=404, detail="Camada de tiles não encontrada")
+
+    url_format = layer["url_format"]
+    if not url_format or time.time() - layer["created"] >= TILE_MAPID_TTL:
+        url_format = _refresh_map_id(key, layer, url_format)
+    try:
+        response = _fetch(url_format, z, x, y)
+        if response.status_code in EXPIRED_STATUSES:
+            # Map ID vencido antes do TTL: renova e tenta uma vez mais
+            url_format = _refresh_map_id(key, layer, url_format)
+            response = _fetch(url_format, z, x, y)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Falha ao buscar tile no Earth Engine: {e}")
+    if response.status_code != 200:
+        raise HTTPException(status_code=502, detail=f"Earth Engine respondeu {response.status_code} para o tile")
+
+    body = response.content
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(body)
+    os.replace(tmp, path)
+    _account(len(body))
+    return body
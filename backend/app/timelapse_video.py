@@ -0,0 +1,126 @@
+# backend/app/timelapse_video.py - Timelapse renderizado no EE (GIF/MP4) com cache em disco
+"""
+Vídeo único para o timelapse em vez de uma URL de tile por frame.
+
+A coleção já processada (saídas de process_ndvi / process_ndwi / process_lst /
+process_rgb) é renderizada pelo próprio Earth Engine com getVideoThumbURL,
+baixada uma vez e guardada em `cache/timelapse/`, com nome derivado do pedido
+canônico (polígono normalizado, janela, camada, formato, dimensões, fps).
+Janelas que terminam hoje ou depois ainda recebem cenas novas: a chave delas
+muda a cada TIMELAPSE_OPEN_WINDOW_TTL, então o vídeo é renderizado de novo.
+O arquivo é servido com FileResponse (Range/206 pelo Starlette), então o
+player faz streaming de um único arquivo e pode pular para qualquer ponto.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import ee
+import requests
+from fastapi import HTTPException
+from fastapi.responses import FileResponse
+
+from .geo_processor import CACHE_DIR
+from .result_store import canonical_polygon
+from .tile_proxy import PUBLIC_API_URL
+
+TIMELAPSE_DIR = CACHE_DIR / "timelapse"
+VIDEO_MEDIA_TYPES = {"gif": "image/gif", "mp4": "video/mp4"}
+DOWNLOAD_TIMEOUT = float(os.getenv("TIMELAPSE_DOWNLOAD_TIMEOUT", "300"))
+# Validade do vídeo de uma janela ainda aberta (end_date >= hoje), em segundos
+TIMELAPSE_OPEN_WINDOW_TTL = int(os.getenv("TIMELAPSE_OPEN_WINDOW_TTL", "21600"))
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{40}\.(gif|mp4)$")
+
+
+def video_key(coords: Sequence[Sequence[float]], start_date: str, end_date: str, layer_type: str,
+              video_format: str, dimensions: int, fps: int, max_frames: int) -> str:
+    """
+    Chave estável do pedido (mesma área desenhada em outra ordem = mesma chave).
+    Com janela aberta, inclui o período de TTL corrente.
+    """
+    request = {
+        "polygon": canonical_polygon(coords),
+        "start": start_date[:10],
+        "end": end_date[:10],
+        "layer": layer_type,
+        "format": video_format,
+        "dimensions": dimensions,
+        "fps": fps,
+        "max_frames": max_frames,
+    }
+    if end_date[:10] >= date.today().isoformat():
+        request["ttl_bucket"] = int(time.time() // TIMELAPSE_OPEN_WINDOW_TTL)
+    return hashlib.sha1(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+def video_path(key: str, video_format: str) -> Path:
+    return TIMELAPSE_DIR / f"{key}.{video_format}"
+
+def video_url(key: str, video_format: str, base_url: str = "") -> str:
+    """URL pública do vídeo (absoluta quando há base, como as URLs de tile)."""
+    base = PUBLIC_API_URL or base_url.rstrip("/")
+    return f"{base}/api/timelapse/video/{key}.{video_format}"
+
+def cached_video(key: str, video_format: str) -> Optional[Dict[str, Any]]:
+    """Metadados do vídeo já renderizado ({"frames": n}) ou None."""
+    target = video_path(key, video_format)
+    meta = target.with_suffix(".json")
+    if not target.exists() or not meta.exists():
+        return None
+    try:
+        return json.loads(meta.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def render_video(processed: ee.ImageCollection, geometry: ee.Geometry, key: str, video_format: str,
+                 dimensions: int, fps: int, max_frames: int) -> Dict[str, Any]:
+    """Renderiza o vídeo no EE, baixa para o cache e devolve os metadados."""
+    frames = processed.sort("system:time_start").limit(max_frames)
+    frame_count = frames.size().getInfo()
+    if frame_count == 0:
+        raise HTTPException(status_code=404, detail="Nenhuma imagem encontrada para o timelapse no período")
+    url = frames.getVideoThumbURL({
+        "dimensions": dimensions,
+        "region": geometry,
+        "framesPerSecond": fps,
+        "format": video_format,
+    })
+    print(f"🎞️ Renderizando timelapse {video_format} com {frame_count} frames ({dimensions}px, {fps} fps)")
+
+    target = video_path(key, video_format)
+    TIMELAPSE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+        resp.raise_for_status()
+        with open(tmp, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+    os.replace(tmp, target)
+    meta = {"frames": frame_count}
+    # Metadados por último e atômicos: cached_video só vê o par completo
+    meta_tmp = target.with_suffix(f".json.{os.getpid()}.tmp")
+    meta_tmp.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(meta_tmp, target.with_suffix(".json"))
+    print(f"✅ Timelapse em cache: {target.name} ({target.stat().st_size / 1024:.0f} KB)")
+    return meta
+
+def resolve_video(filename: str) -> Path:
+    """Arquivo de vídeo em cache a partir do nome público (valida o formato do nome)."""
+    if not _KEY_PATTERN.match(filename):
+        raise HTTPException(status_code=400, detail="Nome de vídeo inválido")
+    path = TIMELAPSE_DIR / filename
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Vídeo não encontrado (gere novamente pelo /api/timelapse)")
+    return path
+
+def video_response(path: Path) -> FileResponse:
+    """Arquivo em streaming; o Starlette responde Range com 206 (e 416 fora do tamanho)."""
+    return FileResponse(
+        path,
+        media_type=VIDEO_MEDIA_TYPES.get(path.suffix.lstrip("."), "application/octet-stream"),
+        headers={"Cache-Control": "public, max-age=86400, immutable"},
+    )
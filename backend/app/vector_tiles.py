@@ -0,0 +1,133 @@
+# backend/app/vector_tiles.py - Mapbox Vector Tiles dos datasets da pasta data
+"""
+Geração de vector tiles (MVT/.pbf) a partir dos datasets em memória.
+
+Cada tile é recortado no retângulo do tile (com margem), simplificado com
+tolerância proporcional ao tamanho do pixel naquele zoom e codificado em MVT.
+O resultado fica em cache em disco, em um diretório que inclui a assinatura
+da origem: quando o GeoJSON muda, os tiles antigos deixam de ser usados.
+"""
+import hashlib
+import math
+import os
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import mapbox_vector_tile
+import numpy as np
+import shapely
+
+from .geo_processor import CACHE_DIR, load_dataset, select_level
+
+VECTOR_TILE_DIR = CACHE_DIR / "vector_tiles"
+TILE_EXTENT = 4096
+# Margem em torno do tile (fração do tamanho do tile) para evitar costuras
+TILE_BUFFER = 64 / TILE_EXTENT
+# Tolerância de simplificação em pixels de um tile de 256px
+SIMPLIFY_PIXELS = 0.5
+MAX_ZOOM = 22
+
+# Web Mercator (EPSG:3857)
+EARTH_RADIUS = 6378137.0
+ORIGIN_SHIFT = math.pi * EARTH_RADIUS
+MAX_LAT = 85.0511287798066
+
+
+def tile_bounds_mercator(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Bounds (minx, miny, maxx, maxy) do tile em metros Web Mercator."""
+    size = 2 * ORIGIN_SHIFT / (2 ** z)
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def mercator_to_lnglat(mx: float, my: float) -> Tuple[float, float]:
+    lng = mx / ORIGIN_SHIFT * 180.0
+    lat = math.degrees(2 * math.atan(math.exp(my / EARTH_RADIUS)) - math.pi / 2)
+    return lng, lat
+
+def _lnglat_to_mercator(coords: np.ndarray) -> np.ndarray:
+    lng = coords[:, 0]
+    lat = np.clip(coords[:, 1], -MAX_LAT, MAX_LAT)
+    mx = lng * ORIGIN_SHIFT / 180.0
+    my = np.log(np.tan((90.0 + lat) * math.pi / 360.0)) * EARTH_RADIUS
+    return np.column_stack([mx, my])
+
+def tile_pixel_size(z: int) -> float:
+    """Tamanho de um pixel (tile de 256px) em metros Web Mercator no zoom z."""
+    return 2 * ORIGIN_SHIFT / (2 ** z) / 256
+
+def validate_tile(z: int, x: int, y: int) -> None:
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError(f"Zoom fora do intervalo 0-{MAX_ZOOM}")
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError(f"Tile {z}/{x}/{y} fora da grade")
+
+def _mvt_properties(props: Dict[str, Any]) -> Dict[str, Any]:
+    """MVT só aceita string/número/booleano; valores nulos são omitidos."""
+    clean = {}
+    for key, value in props.items():
+        if value is None:
+            continue
+        clean[key] = value if isinstance(value, (str, int, float, bool)) else str(value)
+    return clean
+
+def _cache_path(name: str, signature: str, z: int, x: int, y: int) -> Path:
+    version = hashlib.sha1(signature.encode("utf-8")).hexdigest()[:12]
+    return VECTOR_TILE_DIR / os.path.basename(name) / version / str(z) / str(x) / f"{y}.pbf"
+
+def render_tile(name: str, z: int, x: int, y: int) -> bytes:
+    """Codifica o tile z/x/y do dataset em MVT (sem cache)."""
+    dataset = load_dataset(name)
+    minx, miny, maxx, maxy = tile_bounds_mercator(z, x, y)
+    buffer = (maxx - minx) * TILE_BUFFER
+    clip_box = (minx - buffer, miny - buffer, maxx + buffer, maxy + buffer)
+
+    west, south = mercator_to_lnglat(clip_box[0], clip_box[1])
+    east, north = mercator_to_lnglat(clip_box[2], clip_box[3])
+    idx = dataset.query((west, south, east, north))
+    if len(idx) == 0:
+        return b""
+
+    # Parte do nível da pirâmide adequado ao zoom; a simplificação fina é feita no tile
+    level = select_level(dataset.tolerances, zoom=z)
+    geoms = shapely.transform(dataset.geometries_at(level)[idx], _lnglat_to_mercator)
+    geoms = shapely.simplify(geoms, tile_pixel_size(z) * SIMPLIFY_PIXELS, preserve_topology=True)
+    geoms = shapely.clip_by_rect(geoms, *clip_box)
+
+    features = []
+    for i, geom in zip(idx, geoms):
+        if geom is None or geom.is_empty:
+            continue
+        features.append({
+            "id": int(i),
+            "geometry": geom,
+            "properties": _mvt_properties(dataset.properties[i]),
+        })
+    if not features:
+        return b""
+
+    layer_name = Path(dataset.name).stem
+    return mapbox_vector_tile.encode(
+        [{"name": layer_name, "features": features}],
+        default_options={
+            "quantize_bounds": (minx, miny, maxx, maxy),
+            "extents": TILE_EXTENT,
+            "on_invalid_geometry": mapbox_vector_tile.encoder.on_invalid_geometry_make_valid,
+        },
+    )
+
+def get_tile(name: str, z: int, x: int, y: int) -> bytes:
+    """Tile MVT com cache em disco (tiles vazios também são cacheados)."""
+    validate_tile(z, x, y)
+    dataset = load_dataset(name)
+    path = _cache_path(dataset.name, dataset.signature, z, x, y)
+    if path.exists():
+        return path.read_bytes()
+
+    data = render_tile(dataset.name, z, x, y)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return data
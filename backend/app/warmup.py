@@ -0,0 +1,284 @@
+# backend/app/warmup.py - Pré-aquecimento periódico dos caches para áreas configuradas
+"""
+Aquece os caches para as áreas mais acessadas (bairros de Belém e extensões
+municipais padrão) antes de os usuários chegarem.
+
+Para cada área nomeada, com os mesmos parâmetros que o frontend envia:
+
+- get_tile para cada layer_type e get_dem (registra a camada no proxy de
+  tiles e baixa os tiles da área nos zooms WARMUP_TILE_ZOOMS)
+- get_analysis_data (janela de 365 dias)
+- analyze_area (área calculada como no frontend, para a chave coincidir)
+- time_series (30, 90 e 365 dias)
+
+Todo acesso ao EE passa pelo pool batch do ee_executor (e pelo disjuntor):
+o warmup nunca ocupa a classe interativa e para quando o EE está fora.
+
+Roda em uma thread de fundo (WARMUP_ENABLED=1, a cada WARMUP_INTERVAL_HOURS)
+ou pela linha de comando: `python -m app.warmup [nome_da_area ...]`.
+Com vários workers, só um executa por vez (lock de arquivo em cache/).
+O estado por área fica em cache/warmup_status.json e em /api/warmup/status.
+"""
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+from . import ee_executor, tile_proxy
+from .geo_processor import CACHE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "0") == "1"
+WARMUP_INTERVAL_HOURS = float(os.getenv("WARMUP_INTERVAL_HOURS", "6"))
+# Espera após o startup antes da primeira rodada (segundos)
+WARMUP_INITIAL_DELAY = float(os.getenv("WARMUP_INITIAL_DELAY", "60"))
+WARMUP_AOIS_FILE = os.getenv("WARMUP_AOIS_FILE", "")
+WARMUP_TILE_ZOOMS = [int(z) for z in os.getenv("WARMUP_TILE_ZOOMS", "12,13,14").split(",") if z.strip()]
+WARMUP_MAX_TILES_PER_LAYER = int(os.getenv("WARMUP_MAX_TILES_PER_LAYER", "256"))
+# Tiles em paralelo; abaixo de EE_BATCH_WORKERS para sobrar vaga batch para os usuários
+WARMUP_TILE_WORKERS = int(os.getenv("WARMUP_TILE_WORKERS", "2"))
+STATUS_PATH = CACHE_DIR / "warmup_status.json"
+LOCK_PATH = CACHE_DIR / "warmup.lock"
+
+# Parâmetros padrão do frontend (App.tsx)
+TILE_WINDOW_DAYS = 365
+TILE_CLOUD_PERCENTAGE = 5
+TIME_SERIES_WINDOWS = (30, 90, 365)
+TILE_LAYER_TYPES = (
+    "SENTINEL2_RGB", "SENTINEL2_FALSE_COLOR", "LANDSAT_RGB", "SENTINEL1_VV",
+    "NDVI", "NDWI", "LST", "UHI", "UTFVI",
+)
+
+def _box(west: float, south: float, east: float, north: float) -> List[List[float]]:
+    return [[west, south], [east, south], [east, north], [west, north]]
+
+# Áreas padrão ([lng, lat]); substituíveis por um JSON em WARMUP_AOIS_FILE
+# no formato [{"name": "...", "polygon": [[lng, lat], ...]}, ...]
+DEFAULT_AOIS = [
+    {"name": "belem_municipio", "polygon": _box(-48.52, -1.48, -48.38, -1.28)},
+    {"name": "belem_centro", "polygon": _box(-48.505, -1.465, -48.475, -1.440)},
+    {"name": "belem_jurunas_condor", "polygon": _box(-48.500, -1.478, -48.475, -1.460)},
+    {"name": "belem_guama_terra_firme", "polygon": _box(-48.475, -1.470, -48.440, -1.445)},
+    {"name": "belem_marco_pedreira", "polygon": _box(-48.475, -1.445, -48.445, -1.415)},
+]
+
+_status: Dict[str, Dict[str, Any]] = {}
+_status_lock = threading.Lock()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def load_aois() -> List[Dict[str, Any]]:
+    if WARMUP_AOIS_FILE:
+        with open(WARMUP_AOIS_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_AOIS
+
+def frontend_area_km2(polygon: Sequence[Sequence[float]]) -> float:
+    """Mesma aproximação de área do AIAnalystModal (a chave do analyze_area inclui a área)."""
+    area = 0.0
+    for i in range(len(polygon)):
+        j = (i + 1) % len(polygon)
+        area += polygon[i][0] * polygon[j][1] - polygon[j][0] * polygon[i][1]
+    return abs(area / 2) * 12364
+
+
+# =========================
+# Tiles
+# =========================
+def _tile_range(polygon: Sequence[Sequence[float]], z: int):
+    """Tiles XYZ (Web Mercator) que cobrem o retângulo envolvente do polígono."""
+    lngs = [p[0] for p in polygon]
+    lats = [p[1] for p in polygon]
+    n = 2 ** z
+
+    def to_xy(lng, lat):
+        x = int((lng + 180.0) / 360.0 * n)
+        lat_rad = math.radians(lat)
+        y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    x0, y0 = to_xy(min(lngs), max(lats))
+    x1, y1 = to_xy(max(lngs), min(lats))
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+def prefetch_tiles(tile_url: str, polygon: Sequence[Sequence[float]]) -> int:
+    """Baixa para o cache em disco os tiles da área; devolve quantos foram buscados."""
+    key = tile_proxy.key_from_url(tile_url)
+    tiles = [(z, x, y) for z in WARMUP_TILE_ZOOMS for x, y in _tile_range(polygon, z)]
+    tiles = tiles[:WARMUP_MAX_TILES_PER_LAYER]
+    with ThreadPoolExecutor(max_workers=WARMUP_TILE_WORKERS) as pool:
+        list(pool.map(lambda t: ee_executor.call(ee_executor.BATCH, tile_proxy.get_tile, key, *t), tiles))
+    return len(tiles)
+
+
+# =========================
+# Tarefas por área
+# =========================
+def _tasks(aoi: Dict[str, Any]) -> Dict[str, Callable[[], Any]]:
+    from . import main as api
+
+    ring = [[float(p[0]), float(p[1])] for p in aoi["polygon"]]
+    coords = [api.Coordinate(lng=p[0], lat=p[1]) for p in ring]
+    today = date.today()
+    end = today.isoformat()
+    start = (today - timedelta(days=TILE_WINDOW_DAYS)).isoformat()
+    tasks: Dict[str, Callable[[], Any]] = {}
+
+    # get_tile/get_dem são interativos para o usuário; aqui rodam no pool batch
+    def tile_task(layer_type):
+        def run():
+            result = ee_executor.call(ee_executor.BATCH, api.get_tile.__wrapped__, api.LayerRequest(
+                polygon=coords, start_date=start, end_date=end,
+                layer_type=layer_type, cloud_percentage=TILE_CLOUD_PERCENTAGE,
+            ), None)
+            return {"tiles": prefetch_tiles(result.tile_url, ring)}
+        return run
+
+    for layer_type in TILE_LAYER_TYPES:
+        tasks[f"tile:{layer_type}"] = tile_task(layer_type)
+
+    def dem():
+        result = ee_executor.call(ee_executor.BATCH, api.get_dem.__wrapped__, api.DEMRequest(polygon=coords), None)
+        return {"tiles": prefetch_tiles(result.tileUrl, ring)}
+    tasks["tile:DEM"] = dem
+
+    tasks["analysis_data"] = lambda: asyncio.run(api.get_analysis_data(
+        api.AnalysisDataRequest(polygon=coords, start_date=start, end_date=end)
+    ))
+    tasks["analyze_area"] = lambda: asyncio.run(api.analyze_area(
+        api.AnalyzeAreaRequest(polygon=ring, area_km2=frontend_area_km2(ring))
+    ))
+
+    def time_series_task(days):
+        return lambda: asyncio.run(api.get_time_series(api.TimeSeriesRequest(
+            polygon=ring, start_date=(today - timedelta(days=days)).isoformat(), end_date=end,
+        )))
+
+    for days in TIME_SERIES_WINDOWS:
+        tasks[f"time_series:{days}d"] = time_series_task(days)
+    return tasks
+
+def warm_aoi(aoi: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa todas as tarefas de uma área e devolve o estado de cada uma."""
+    name = aoi["name"]
+    started = time.time()
+    results: Dict[str, Dict[str, Any]] = {}
+    print(f"🔥 Aquecendo caches: {name}")
+    for task, run in _tasks(aoi).items():
+        t0 = time.time()
+        entry: Dict[str, Any] = {"status": "ok", "error": None}
+        try:
+            extra = run()
+            if isinstance(extra, dict):
+                entry.update(extra)
+        except HTTPException as e:
+            # 404 = sem imagens para a área/janela: nada a aquecer, não é falha
+            entry["status"] = "empty" if e.status_code == 404 else "error"
+            entry["error"] = str(e.detail)
+        except Exception as e:
+            entry["status"] = "error"
+            entry["error"] = str(e)
+        entry["seconds"] = round(time.time() - t0, 2)
+        results[task] = entry
+        if entry["status"] == "error":
+            print(f"⚠️ Warmup {name}/{task}: {entry['error']}")
+
+    failed = [t for t, r in results.items() if r["status"] == "error"]
+    status = {
+        "warm": not failed,
+        "failed": failed,
+        "finished_at": datetime.now().isoformat(),
+        "seconds": round(time.time() - started, 1),
+        "tasks": results,
+    }
+    with _status_lock:
+        _status[name] = status
+    _write_status()
+    print(f"{'✅' if not failed else '⚠️'} Warmup {name}: {len(results) - len(failed)}/{len(results)} tarefas "
+          f"em {status['seconds']}s")
+    return status
+
+
+# =========================
+# Execução e estado
+# =========================
+def _write_status() -> None:
+    with _status_lock:
+        snapshot = dict(_status)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = STATUS_PATH.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(snapshot, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, STATUS_PATH)
+    except OSError as e:
+        print(f"⚠️ Falha ao gravar estado do warmup: {e}")
+
+def status() -> Dict[str, Any]:
+    """Estado por área (inclui rodadas feitas por outro worker ou pela CLI)."""
+    try:
+        stored = json.loads(STATUS_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        stored = {}
+    with _status_lock:
+        stored.update(_status)
+    names = [a["name"] for a in load_aois()]
+    return {
+        "enabled": WARMUP_ENABLED,
+        "interval_hours": WARMUP_INTERVAL_HOURS,
+        "running": _thread is not None and _thread.is_alive(),
+        "areas": {n: stored.get(n, {"warm": False, "finished_at": None}) for n in names},
+    }
+
+def run_once(names: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Uma rodada para as áreas pedidas (todas, por padrão). Pula se outro processo já estiver rodando."""
+    aois = [a for a in load_aois() if not names or a["name"] in names]
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(LOCK_PATH, "w") as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                print("⏭️ Warmup já em execução em outro processo")
+                return {}
+        return {a["name"]: warm_aoi(a) for a in aois if not _stop.is_set()}
+
+def _loop() -> None:
+    if _stop.wait(WARMUP_INITIAL_DELAY):
+        return
+    while not _stop.is_set():
+        try:
+            run_once()
+        except Exception as e:
+            print(f"⚠️ Rodada de warmup falhou: {e}")
+        if _stop.wait(WARMUP_INTERVAL_HOURS * 3600):
+            return
+
+def start() -> None:
+    global _thread
+    if not WARMUP_ENABLED or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="cache-warmup", daemon=True)
+    _thread.start()
+
+def stop() -> None:
+    _stop.set()
+
+
+if __name__ == "__main__":
+    results = run_once(sys.argv[1:] or None)
+    warm = sum(1 for r in results.values() if r["warm"])
+    print(f"✅ Warmup concluído: {warm}/{len(results)} área(s) aquecidas")